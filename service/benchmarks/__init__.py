@@ -0,0 +1,6 @@
+"""
+Local benchmarks, for measuring the performance of hot paths in the service
+
+Each benchmark is a module that can be run directly, using the test settings, and does not need network access.
+Ex: poetry run python -m benchmarks.http2_benchmark
+"""
@@ -0,0 +1,118 @@
+"""
+Measure the consumer's throughput and end-to-end latency, by publishing to the mocked internal topic at fixed rates
+
+Messages are published from a background thread at each rate, while the main thread runs process_topics against the
+mocked topic (is_mocked in the test settings), so this runs offline with no SQS.  Each message's handler sleeps for
+--handler-ms, to stand in for database or HTTP calls, and records how long ago the message was published.  Each rate
+is run with messages handled on the consumer's thread, and on a worker pool, to show where each falls behind.
+
+Ex: poetry run python -m benchmarks.consumer_benchmark --rates 50 200 500 --seconds 5 --workers 4
+"""
+import argparse
+import threading
+import time
+from typing import List
+from unittest import mock
+
+from benchmarks.utils import percentile, print_table, setup_django
+
+
+def _create_message_class():
+    from blink_messaging.serialization import BlinkMessage, fields
+
+    class BenchmarkMessage(BlinkMessage):
+        class Meta:
+            full_name = "benchmark.message"
+            version = 1
+
+        id = fields.String(max_len=60)
+        sent_timestamp = fields.Decimal()  # epoch milliseconds, which the benchmark measures lag from
+
+    return BenchmarkMessage
+
+
+def _publish_at_rate(message_class, rate: float, seconds: float) -> int:
+    """Publish rate messages per second for seconds, scheduling each one so a slow publish doesn't lower the rate"""
+    from blink_messaging.publisher import publish
+    from django.conf import settings
+
+    from core.constants import INTERNAL_QUEUE_TOPIC_NAME
+
+    topic = settings.TOPIC_CONFIG[INTERNAL_QUEUE_TOPIC_NAME]
+    count = int(rate * seconds)
+    start_time = time.monotonic()
+    for i in range(count):
+        delay = start_time + i / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        publish(topic, message_class(id=str(i), sent_timestamp=time.time() * 1000))
+    return count
+
+
+def _run(message_class, rate: float, seconds: float, handler_ms: float, workers: int) -> list:
+    from message_consumer import consumer
+    from message_consumer.worker_pool import MessageWorkerPool
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def handler(message):
+        time.sleep(handler_ms / 1000)
+        with lock:
+            latencies.append(time.time() * 1000 - float(message.sent_timestamp))
+
+    expected = int(rate * seconds)
+    pool = MessageWorkerPool(workers, max_pending=workers * 5) if workers else None
+    publisher = threading.Thread(target=_publish_at_rate, args=(message_class, rate, seconds), daemon=True)
+    start_time = time.monotonic()
+    with mock.patch.dict(consumer._handler_map, {message_class: handler}), mock.patch.object(
+        consumer, "_worker_pool", pool
+    ):
+        publisher.start()
+        # keep consuming until every message is handled, or it's fallen too far behind to finish
+        deadline = start_time + seconds * 5 + 10
+        while len(latencies) < expected and time.monotonic() < deadline:
+            success_count, failure_count = consumer.process_topics()
+            if not success_count + failure_count:
+                time.sleep(0.001)
+            # the mocked topic may deliver unconfirmed messages again, so the pool finishes each run's messages first
+            if pool is not None:
+                while pool.outstanding and time.monotonic() < deadline:
+                    time.sleep(0.001)
+        if pool is not None:
+            pool.drain(timeout=5)
+    elapsed = time.monotonic() - start_time
+    publisher.join()
+
+    mode = f"{workers} workers" if workers else "consumer thread"
+    return [
+        f"{rate:.0f}/s",
+        mode,
+        f"{len(latencies)}/{expected}",
+        f"{len(latencies) / elapsed:.0f}",
+        f"{percentile(latencies, 50):.1f}",
+        f"{percentile(latencies, 99):.1f}",
+        f"{max(latencies, default=0):.1f}",
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", type=float, nargs="+", default=[50, 200], help="messages published per second")
+    parser.add_argument("--seconds", type=float, default=5, help="how long to publish at each rate")
+    parser.add_argument("--handler-ms", type=float, default=5, help="how long each message's handler takes")
+    parser.add_argument("--workers", type=int, default=4, help="workers for the worker pool scenarios")
+    args = parser.parse_args()
+    setup_django()
+
+    message_class = _create_message_class()
+    rows = []
+    for rate in args.rates:
+        for workers in (0, args.workers):
+            rows.append(_run(message_class, rate, args.seconds, args.handler_ms, workers))
+
+    print_table(["rate", "handled on", "handled", "messages/s", "p50 lag (ms)", "p99 lag (ms)", "max lag (ms)"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Measure Event construction and recording throughput, comparing the current Event with the previous implementation
+
+The previous implementation parsed field definitions on first construction, then on every construction scanned all
+fields for each kwarg, and walked every field definition to validate and set defaults.  It also formatted the message
+on construction, and built the metric tag strings on every record, even when the event wasn't logged.  It is kept here
+as a baseline.  Recording is measured with the event service's logger enabled (writing to /dev/null) and disabled, and
+with metrics sent to a no-op client, so only the event's own cost is measured.
+
+Ex: poetry run python -m benchmarks.event_benchmark --iterations 200000
+"""
+import argparse
+import logging
+import os
+import timeit
+from unittest import mock
+
+from benchmarks.utils import print_table, setup_django
+
+
+def _legacy_init(self, *args, **kwargs):
+    """Event.__init__ before field definitions were compiled when the class is defined"""
+    if not hasattr(self, "_legacy_fields"):
+        self.__class__._legacy_fields = self._parse_field_definitions()
+
+    tags = dict()
+    fields = self._legacy_fields
+    allow_any_parameter = fields[-1].is_kwargs
+
+    for i, arg in enumerate(args):
+        tags[fields[i].name] = arg
+    for key, value in kwargs.items():
+        if not any(f.name == key for f in fields) and not allow_any_parameter:
+            raise ValueError(f"Field {key} was not defined for {self.__class__.__name__}")
+        tags[key] = value
+
+    for field in fields:
+        if field.is_kwargs:
+            continue
+        if field.name not in tags:
+            if field.is_required:
+                raise ValueError(f"Field {field.name} was not set for {self.__class__.__name__}")
+            else:
+                tags[field.name] = field.default_value
+        if not field.allow_none and tags[field.name] is None:
+            raise ValueError(f"Required field {field.name} is None for {self.__class__.__name__}")
+
+    if self.__class__.message:
+        self.message = self.__class__.message.format(**tags)
+    self.tags = tags
+    if hasattr(self, "init"):
+        self.init(self.tags)
+
+
+def _legacy_record_event(event):
+    """event_service._record_event before messages and metric tags were built lazily"""
+    from core.services import event_service
+
+    if event.log_level:
+        log_message = f"{event.event_name}: {event.message}" if event.message else event.event_name
+        event_service._logger.log(event.log_level, log_message, extra=event.tags)
+    if event.emit_metric:
+        tags = [f"{tag}:{event.tags[tag]}" for tag in event.metric_tags] if event.metric_tags else None
+        increment_by = event.tags[event.metric_increment_field] if event.metric_increment_field else 1
+        event_service.statsd.increment(event.event_name, value=increment_by, tags=tags)
+
+
+class _NoOpStatsd:
+    def increment(self, *args, **kwargs):
+        pass
+
+
+def _set_logging(enabled: bool):
+    """Log the event service to /dev/null at INFO if enabled, otherwise only log warnings and above"""
+    from core.services import event_service
+
+    event_service._logger.handlers.clear()
+    if enabled:
+        logging.disable(logging.NOTSET)
+        handler = logging.StreamHandler(open(os.devnull, "w"))
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        event_service._logger.addHandler(handler)
+        event_service._logger.setLevel(logging.INFO)
+    else:
+        event_service._logger.setLevel(logging.WARNING)
+    event_service._logger.propagate = False
+
+
+def _event_classes():
+    from common_lib.event import Event
+
+    class OrderEvent(Event):
+        event_name = "benchmark.order.updated"
+        event_fields = ["order_id", "patient_id", "status?", "pharmacy_id=None", "source='api'", "retries=0"]
+        message = "Order {order_id} is now {status}"
+        log_level = logging.INFO
+        emit_metric = True
+        metric_tags = ["status", "source"]
+
+    class LegacyOrderEvent(OrderEvent):
+        __init__ = _legacy_init
+
+    return OrderEvent, LegacyOrderEvent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000, help="events to construct for each scenario")
+    args = parser.parse_args()
+    setup_django()
+
+    event_class, legacy_event_class = _event_classes()
+    scenarios = [
+        ("positional", lambda cls: cls(1, 2, "filled")),
+        ("kwargs", lambda cls: cls(order_id=1, patient_id=2, status="filled", pharmacy_id=3, retries=1)),
+    ]
+
+    rows = []
+    for name, create in scenarios:
+        timings = {}
+        for label, cls in (("before", legacy_event_class), ("after", event_class)):
+            create(cls)  # parse the definitions of the legacy class, outside the timing
+            seconds = min(timeit.repeat(lambda: create(cls), number=args.iterations, repeat=3))
+            timings[label] = args.iterations / seconds
+        rows.append(
+            [
+                name,
+                f"{timings['before']:,.0f}",
+                f"{timings['after']:,.0f}",
+                f"{timings['after'] / timings['before']:.2f}x",
+            ]
+        )
+    print_table(["construction", "before (events/s)", "after (events/s)", "speedup"], rows)
+    print()
+    _benchmark_recording(event_class, legacy_event_class, args.iterations)
+
+
+def _benchmark_recording(event_class, legacy_event_class, iterations: int):
+    from core.services import event_service
+
+    record_scenarios = [
+        ("before", legacy_event_class, _legacy_record_event),
+        ("after", event_class, event_service._record_event),
+    ]
+    rows = []
+    with mock.patch.object(event_service, "statsd", _NoOpStatsd()):
+        for logging_enabled in (True, False):
+            _set_logging(logging_enabled)
+            timings = {}
+            for label, cls, record in record_scenarios:
+                record(cls(1, 2, "filled"))
+                seconds = min(timeit.repeat(lambda: record(cls(1, 2, "filled")), number=iterations, repeat=5))
+                timings[label] = seconds / iterations * 1_000_000
+            rows.append(
+                [
+                    "logging enabled" if logging_enabled else "logging disabled",
+                    f"{timings['before']:.2f}",
+                    f"{timings['after']:.2f}",
+                    f"{timings['before'] / timings['after']:.2f}x",
+                ]
+            )
+    print_table(["create and record", "before (us/event)", "after (us/event)", "speedup"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Compare HTTP/1.1 pooling against HTTP/2 multiplexing for the foo_client call pattern
+
+Two local stand-in servers are started, one speaking HTTP/1.1 and one speaking HTTP/2 (cleartext, with prior knowledge),
+and both respond to foo requests after a fixed delay.  Bursts of concurrent get_foo_async() calls are run against each,
+reporting latency percentiles and how many sockets the client opened to the server (including while warming up).
+
+Ex: poetry run python -m benchmarks.http2_benchmark --requests 2000 --concurrency 50 --latency-ms 20
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import h2.config
+import h2.connection
+import h2.events
+
+from benchmarks.utils import setup_django, percentile, print_table
+
+ROOT_PATH = "/api/v1/foo"
+
+
+def _foo_body(path: str) -> bytes:
+    foo_id = path.rstrip("/").split("/")[-1]
+    return json.dumps({"id": foo_id, "name": "benchmark", "price": "1.000"}).encode("utf-8")
+
+
+class _Http1Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.connection_count = 0
+        self._count_lock = threading.Lock()
+        super().__init__(("127.0.0.1", 0), _Http1Handler)
+
+    def record_connection(self):
+        with self._count_lock:
+            self.connection_count += 1
+
+
+class _Http1Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # required for keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def do_GET(self):
+        time.sleep(self.server.latency_seconds)
+        body = _foo_body(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Http2Protocol(asyncio.Protocol):
+    """A minimal HTTP/2 server connection, that responds to every stream concurrently"""
+
+    def __init__(self, server: "_Http2Server"):
+        self._server = server
+        self._conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._server.connection_count += 1
+        self._transport = transport
+        self._conn.initiate_connection()
+        transport.write(self._conn.data_to_send())
+
+    def data_received(self, data):
+        for event in self._conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                headers = dict(event.headers)
+                asyncio.ensure_future(self._respond(event.stream_id, headers[b":path"].decode("utf-8")))
+        self._transport.write(self._conn.data_to_send())
+
+    async def _respond(self, stream_id: int, path: str):
+        await asyncio.sleep(self._server.latency_seconds)
+        body = _foo_body(path)
+        headers = [(":status", "200"), ("content-type", "application/json"), ("content-length", str(len(body)))]
+        self._conn.send_headers(stream_id, headers)
+        self._conn.send_data(stream_id, body, end_stream=True)
+        self._transport.write(self._conn.data_to_send())
+
+
+class _Http2Server:
+    """Runs an HTTP/2 server on its own event loop, in a background thread"""
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.connection_count = 0
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            self._loop.create_server(lambda: _Http2Protocol(self), "127.0.0.1", 0)
+        )
+        self.server_address = self._server.sockets[0].getsockname()
+
+    def serve_forever(self):
+        self._loop.run_forever()
+
+    def shutdown(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def _run_burst(num_requests: int, concurrency: int) -> list:
+    """Run get_foo_async() num_requests times, with at most concurrency running at once"""
+    from core.clients.foo_client import get_foo_async
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def call(foo_id: int):
+        async with semaphore:
+            start_time = time.perf_counter()
+            await get_foo_async(str(foo_id))
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+    await asyncio.gather(*(call(i) for i in range(num_requests)))
+    return latencies
+
+
+def _run_warm_bursts(num_requests: int, concurrency: int) -> tuple:
+    """
+    Warm up the connections with one burst, then time a second, returning its latencies and how long it took
+
+    Both bursts run in a single call to run_async_as_sync, since it closes the async clients afterwards when running
+    with the test settings, which would throw away the warmed up connections.
+    """
+    from common_lib.blink_requests_async import run_async_as_sync
+
+    @run_async_as_sync
+    async def bursts():
+        await _run_burst(concurrency, concurrency)
+        start_time = time.perf_counter()
+        latencies = await _run_burst(num_requests, concurrency)
+        return latencies, time.perf_counter() - start_time
+
+    return bursts()
+
+
+def _benchmark(name: str, server, endpoint_config: dict, num_requests: int, concurrency: int) -> list:
+    from django.conf import settings
+    from django.test import override_settings
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+
+    http_clients = deepcopy(settings.HTTP_CLIENTS)
+    http_clients["endpoints"]["foo"] = {
+        "root_url": f"http://{host}:{port}{ROOT_PATH}",
+        "default_timeout_seconds": 30.0,
+        "log_body": False,
+        **endpoint_config,
+    }
+    with override_settings(HTTP_CLIENTS=http_clients):
+        latencies, elapsed = _run_warm_bursts(num_requests, concurrency)
+
+    server.shutdown()
+    return [
+        name,
+        f"{percentile(latencies, 50):.1f}",
+        f"{percentile(latencies, 99):.1f}",
+        f"{num_requests / elapsed:.0f}",
+        server.connection_count,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="number of requests in each burst")
+    parser.add_argument("--concurrency", type=int, default=50, help="max concurrent requests")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="server response delay")
+    args = parser.parse_args()
+    setup_django()
+
+    latency_seconds = args.latency_ms / 1000
+    limits = {"max_connections": 100, "max_keepalive_connections": 100}
+    rows = [
+        _benchmark(
+            "HTTP/1.1",
+            _Http1Server(latency_seconds),
+            {"limits": limits},
+            args.requests,
+            args.concurrency,
+        ),
+        _benchmark(
+            "HTTP/2",
+            _Http2Server(latency_seconds),
+            {"http2": True, "limits": limits},
+            args.requests,
+            args.concurrency,
+        ),
+    ]
+    print_table(["protocol", "p50 (ms)", "p99 (ms)", "req/s", "sockets"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Measure the overhead blink_requests_async adds to get_foo/get_foo_async, by replaying recorded foo responses
+
+Responses are replayed from benchmarks/recordings/foo.jsonl, so this runs offline with no server.  Each scenario is
+compared against a bare HTTPX client on the same replay transport, to isolate the cost of our hooks (logging,
+correlation ids, deadlines and metrics).  With --max-overhead-us, it exits with an error if get_foo's overhead is above
+that, so CI can catch regressions in the hot paths.
+
+Ex: poetry run python -m benchmarks.http_client_benchmark --calls 5000 --threads 4
+To re-record the responses from the mocked foo service: poetry run python -m benchmarks.http_client_benchmark --record
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from copy import deepcopy
+from typing import Callable, List
+
+from benchmarks.utils import setup_django, percentile, print_table
+
+RECORDINGS_PATH = os.path.join(os.path.dirname(__file__), "recordings", "foo.jsonl")
+NUM_FOO_IDS = 100
+
+
+def _foo_ids() -> List[str]:
+    return [str(foo_id) for foo_id in range(1, NUM_FOO_IDS + 1)]
+
+
+def _http_clients(**endpoint_overrides) -> dict:
+    from django.conf import settings
+
+    http_clients = deepcopy(settings.HTTP_CLIENTS)
+    http_clients["endpoints"]["foo"].update(endpoint_overrides)
+    return http_clients
+
+
+def _record():
+    """Record a response for each foo id from the mocked foo service, replacing any existing recordings"""
+    from django.test import override_settings
+
+    from core.clients.foo_client import get_foo
+
+    os.makedirs(os.path.dirname(RECORDINGS_PATH), exist_ok=True)
+    if os.path.exists(RECORDINGS_PATH):
+        os.remove(RECORDINGS_PATH)
+    with override_settings(HTTP_CLIENTS=_http_clients(record={"path": RECORDINGS_PATH})):
+        for foo_id in _foo_ids():
+            get_foo(foo_id)
+    print(f"Recorded {NUM_FOO_IDS} responses to {RECORDINGS_PATH}")
+
+
+def _reset_clients():
+    from common_lib import blink_requests_async
+
+    getattr(blink_requests_async._thread_local, "httpx_clients", {}).clear()
+    getattr(blink_requests_async._thread_local, "httpx_async_clients", {}).clear()
+
+
+def _time_calls(call: Callable[[str], object], num_calls: int) -> List[float]:
+    """Time each call, in microseconds, cycling through the recorded foo ids"""
+    foo_ids = _foo_ids()
+    latencies = []
+    for i in range(num_calls):
+        start_time = time.perf_counter()
+        call(foo_ids[i % len(foo_ids)])
+        latencies.append((time.perf_counter() - start_time) * 1_000_000)
+    return latencies
+
+
+def _bare_client_call():
+    """A call with the same transport and parsing as get_foo, but none of our hooks"""
+    import httpx
+    from django.conf import settings
+
+    from common_lib.http_recording import Recordings, ReplayTransport
+    from core.dtos import Foo
+
+    client = httpx.Client(
+        transport=ReplayTransport(Recordings(RECORDINGS_PATH)),
+        base_url=settings.HTTP_CLIENTS["endpoints"]["foo"]["root_url"],
+    )
+    return lambda foo_id: Foo.from_json(client.get(f"/{foo_id}/").text).validate()
+
+
+def _async_calls(num_calls: int, concurrency: int) -> List[float]:
+    from core.clients.foo_client import get_foo_async
+
+    foo_ids = _foo_ids()
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def call(i: int):
+            async with semaphore:
+                start_time = time.perf_counter()
+                await get_foo_async(foo_ids[i % len(foo_ids)])
+                latencies.append((time.perf_counter() - start_time) * 1_000_000)
+
+        await asyncio.gather(*(call(i) for i in range(num_calls)))
+        return latencies
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def _threaded_calls(num_calls: int, num_threads: int) -> float:
+    """Run get_foo from several threads at once, returning the requests per second of each thread"""
+    from core.clients.foo_client import get_foo
+
+    calls_per_thread = num_calls // num_threads
+    threads = [threading.Thread(target=_time_calls, args=(get_foo, calls_per_thread)) for _ in range(num_threads)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    return calls_per_thread / elapsed
+
+
+def _row(name: str, latencies: List[float], baseline_mean: float) -> list:
+    mean = sum(latencies) / len(latencies)
+    return [
+        name,
+        f"{mean:.0f}",
+        f"{percentile(latencies, 50):.0f}",
+        f"{percentile(latencies, 99):.0f}",
+        f"{mean - baseline_mean:.0f}",
+        f"{1_000_000 / mean:.0f}",
+    ]
+
+
+def _enable_logging():
+    """Send logs to /dev/null, so the cost of building and formatting log records is measured, without the output"""
+    logging.disable(logging.NOTSET)
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logging.getLogger("common_lib.blink_requests_async").addHandler(handler)
+    logging.getLogger("common_lib.blink_requests_async").setLevel(logging.INFO)
+    return handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=5000, help="number of calls in each scenario")
+    parser.add_argument("--threads", type=int, default=4, help="threads for the throughput scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent calls for the async scenario")
+    parser.add_argument("--latency-ms", type=float, default=0, help="injected latency for each replayed response")
+    parser.add_argument("--max-overhead-us", type=float, help="fail if get_foo's mean overhead is above this")
+    parser.add_argument("--record", action="store_true", help="re-record the responses, instead of benchmarking")
+    args = parser.parse_args()
+    setup_django()
+
+    if args.record:
+        _record()
+        return
+
+    from django.test import override_settings
+
+    from core.clients.foo_client import get_foo
+
+    # the mocked transport would take precedence over replaying
+    replay = {"path": RECORDINGS_PATH, "latency_ms": args.latency_ms}
+    replay_config = {"mocked_transport": None, "replay": replay}
+    bare_call = _bare_client_call()
+    _time_calls(bare_call, NUM_FOO_IDS)  # warm up
+    baseline = _time_calls(bare_call, args.calls)
+    baseline_mean = sum(baseline) / len(baseline)
+    rows = [_row("bare httpx client", baseline, baseline_mean)]
+
+    scenarios = [
+        ("get_foo, logs disabled", replay_config, False),
+        ("get_foo, logging bodies", replay_config, True),
+        ("get_foo, logging without bodies", {**replay_config, "log_body": False}, True),
+        ("get_foo, 10% of bodies logged", {**replay_config, "log_body_sample_rate": 0.1}, True),
+    ]
+    overheads = {}
+    for name, endpoint_config, log in scenarios:
+        handler = _enable_logging() if log else None
+        _reset_clients()
+        with override_settings(HTTP_CLIENTS=_http_clients(**endpoint_config)):
+            _time_calls(get_foo, NUM_FOO_IDS)  # warm up
+            latencies = _time_calls(get_foo, args.calls)
+        if handler:
+            logging.getLogger("common_lib.blink_requests_async").removeHandler(handler)
+            logging.disable(logging.INFO)
+        rows.append(_row(name, latencies, baseline_mean))
+        overheads[name] = sum(latencies) / len(latencies) - baseline_mean
+
+    _reset_clients()
+    with override_settings(HTTP_CLIENTS=_http_clients(**replay_config)):
+        rows.append(_row("get_foo_async", _async_calls(args.calls, args.concurrency), baseline_mean))
+        per_thread = _threaded_calls(args.calls, args.threads)
+
+    print_table(["scenario", "mean (us)", "p50 (us)", "p99 (us)", "overhead (us)", "calls/s"], rows)
+    print(f"\nget_foo throughput with {args.threads} threads: {per_thread:.0f} calls/s per thread")
+
+    overhead = overheads["get_foo, logging bodies"]
+    if args.max_overhead_us is not None and overhead > args.max_overhead_us:
+        print(f"\nFAILED: get_foo overhead of {overhead:.0f}us is above the max of {args.max_overhead_us:.0f}us")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import logging
+import os
+from typing import List, Sequence
+
+
+def setup_django():
+    """Configure Django with the test settings, so benchmarks can be run as plain scripts"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_service_bootstrap.settings.test")
+    os.environ.setdefault("ENVIRONMENT", "test")
+
+    import django
+
+    django.setup()
+
+    # per-request logs would dominate the timings, and flood the terminal
+    logging.disable(logging.INFO)
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Get a percentile (0-100) from a list of values, using the nearest-rank method"""
+    if not values:
+        return 0.0
+    sorted_values = sorted(values)
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def print_table(headers: List[str], rows: List[list]):
+    """Print results as a simple fixed-width table"""
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers, *rows]:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
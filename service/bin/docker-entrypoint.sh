@@ -4,6 +4,11 @@ set -ex
 STATSD_HOST="dogstatsd.datadog.svc.cluster.local"
 >&2 echo "statsd: $STATSD_HOST"
 
+# run only the message consumer, in pods separate from the API (which should set MESSAGE_CONSUMER_IN_API=false)
+if [ "${PROCESS_TYPE}" = "consumer" ]; then
+  exec python manage.py run_consumer --workers="${CONSUMER_WORKERS:-4}" --health-port="8001"
+fi
+
 GUNICORN_CMD="gunicorn"
 if [ -n "${NEW_RELIC_CONFIG_FILE}" ]; then
   GUNICORN_CMD="newrelic-admin run-program gunicorn"
@@ -1,18 +1,52 @@
 """This file has functionality that roughly matches blink-requests, but uses HTTPX, allowing async calls"""
 import asyncio
+import contextvars
 import logging
 import threading
 import math
-from functools import wraps
+import random
+from dataclasses import dataclass
+from functools import partial, wraps
 from importlib import import_module
 from time import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable, Iterable, Iterator, List, Optional
 
 import httpx
+from common_lib.deadline import (
+    DEADLINE_HEADER,
+    AsyncDeadlineTransport,
+    DeadlineExceededError,
+    DeadlineTransport,
+    get_deadline,
+    get_remaining_seconds,
+    set_deadline,
+)
 from common_lib.errors import ClientError, BlinkParsingError
+from common_lib.event_loop_thread import EventLoopThread
+from common_lib.http_cache import AsyncCachingTransport, CachingTransport, ResponseCache
+from common_lib.http_coalescing import AsyncCoalescingTransport, CoalescingTransport, SingleFlight
+from common_lib.http_endpoints import EndpointConfig, endpoint_registry
+from common_lib.http_pool import SharedPoolTransport
+from common_lib.http_recording import (
+    AsyncRecordingTransport,
+    AsyncReplayTransport,
+    RecordingTransport,
+    ReplayTransport,
+)
+from common_lib.http_resilience import (
+    AsyncResilientTransport,
+    CircuitBreaker,
+    ResilientTransport,
+    RetryBudget,
+    RetryPolicy,
+)
+from common_lib.http_streaming import JsonArrayParser, StreamModes
+from common_lib.http_timing import AsyncTimingTransport, TimingTransport
+from common_lib.latency_histogram import latency_histograms
+from common_lib.metrics import statsd
 from django.conf import settings
 from httpx import Response
 from respx.transports import MockTransport
-from blink_logging_metrics.metrics import statsd
 import re
 
 from common_lib.service_enums import DeploymentEnvironments
@@ -20,8 +54,19 @@ from common_lib.service_enums import DeploymentEnvironments
 _logger = logging.getLogger(__name__)
 _disallowed_headers = {"authorization", "ocp-apim-subscription-key"}  # must be lower-case
 _thread_local = threading.local()
+_shared_clients = {}  # process-wide sync clients, for endpoints configured with 'shared_pool'
+_shared_clients_lock = threading.Lock()
+_response_caches = {}  # process-wide response caches, for endpoints configured with 'cache'
+_single_flights = {}  # process-wide in-flight sync requests, for endpoints configured with 'coalesce_requests'
+_circuit_breakers = {}  # process-wide circuit breakers, for endpoints configured with 'circuit_breaker'
+_retry_policies = {}  # process-wide retry policies and budgets, for endpoints configured with 'retries'
+_process_state_lock = threading.Lock()
+_event_loop_thread = EventLoopThread(name="httpx-event-loop")
+# set when running on the background event loop, since the request's thread attributes aren't available there
+_correlation_id = contextvars.ContextVar("blink_correlation_id", default=None)
 _max_body_size_to_log = getattr(settings, "HTTP_MAX_LOG_PAYLOAD", 2000)
 _log_headers = getattr(settings, "HTTP_LOG_HEADERS", True)
+_log_body_sample_rate = getattr(settings, "HTTP_LOG_BODY_SAMPLE_RATE", 1.0)
 
 
 def _sanitize_headers(headers):
@@ -38,75 +83,104 @@ def _sanitize_headers(headers):
     return sanitized_headers
 
 
-def _get_request_body(request):
+def _truncate_body(content: bytes, encoding: str = None) -> str:
     """
-    Truncates the request body if necessary for logging
+    Truncate a body to the max size to log, in bytes, only decoding the part that will be logged
+
+    A multi-byte character split by the truncation is replaced, rather than failing to decode.
     """
-    request.read()
-    content = getattr(request, "content", None) or ""
+    truncated = len(content) > _max_body_size_to_log
+    text = content[:_max_body_size_to_log].decode(encoding or "utf-8", errors="replace")
+    return text + "..." if truncated else text
 
-    if content and len(content) > _max_body_size_to_log:
-        truncated_body = content[:_max_body_size_to_log]
-        if isinstance(truncated_body, bytes):
-            truncated_body += b"..."
-        elif isinstance(truncated_body, str):
-            truncated_body += "..."
-        return truncated_body
 
-    return content
+def _get_request_body(request, log_streamed_body: bool = False):
+    """
+    Truncates the request body if necessary for logging
+
+    A streamed request body (such as from a generator) is only read if log_streamed_body is set, since reading it
+    buffers the whole body in memory.
+    """
+    if not isinstance(request.stream, httpx.ByteStream) and not log_streamed_body:
+        return "<streamed>"
+    request.read()
+    return _truncate_body(request.content)
 
 
 def _get_response_body(response):
     """
     Truncates the response body if necessary for logging
+
+    If the response is being streamed, and its body hasn't been read yet, it isn't logged, since that would force the
+    whole body to be read into memory.
     """
-    content = getattr(response, "text", None) or ""
+    if not response.is_stream_consumed:
+        return "<streamed>"
 
     # if the response is too long, we can't parse partial json, so just return the first part as a string
-    if len(content) > _max_body_size_to_log:
-        content = content[:_max_body_size_to_log] + "..."
+    return _truncate_body(response.content, response.encoding)
+
 
-    return content
+def _should_log_body(sample_rate: float) -> bool:
+    return sample_rate >= 1 or random.random() < sample_rate
 
 
-def _record_metrics(request, response, duration_ms):
-    """Record metrics for outbound responses"""
+def _record_metrics(request, response, duration_ms, endpoint: EndpointConfig = None):
+    """
+    Record metrics for outbound responses
+
+    Durations are also recorded in the in-process latency histograms, by client and route, along with any phase timings
+    added by the endpoint's transports (see the phase_timings option).
+    """
     statsd_tags = [
         f"status_code:{response.status_code}",
         f"method:{request.method}",
         f"endpoint:{request.url.host}",
     ]
+    histogram_tags = [f"method:{request.method}"]
+    if endpoint is not None:
+        route_tags = [f"client:{endpoint.name}", f"route:{endpoint.get_route(request.url.path)}"]
+        statsd_tags += route_tags
+        histogram_tags += route_tags
     statsd.timing("http.request.duration", duration_ms, tags=statsd_tags)
+    latency_histograms.record("http.request.duration", duration_ms, histogram_tags)
     status_code_range = int((math.floor(response.status_code / 100)) * 100)
     statsd.increment(f"http.request.status.{status_code_range}", tags=statsd_tags)
 
+    for phase, phase_ms in response.extensions.get("timings", {}).items():
+        statsd.timing(f"http.request.phase.{phase}", phase_ms, tags=statsd_tags)
+        latency_histograms.record(f"http.request.phase.{phase}", phase_ms, histogram_tags)
+
+
+def _log_request(request, log_body: bool = True, log_body_sample_rate: float = None, log_streamed_body: bool = False):
+    """
+    Log an outbound request, and record its start time
+
+    :param log_body: whether to log bodies at all
+    :param log_body_sample_rate: the fraction (0-1) of request/response bodies to log.  The bodies of error responses,
+        and their requests, are always logged.  Defaults to settings.HTTP_LOG_BODY_SAMPLE_RATE.
+    :param log_streamed_body: if True, streamed bodies are read into memory so they can be logged
+    """
+    sample_rate = _log_body_sample_rate if log_body_sample_rate is None else log_body_sample_rate
+    request.log_body_sampled = log_body and _should_log_body(sample_rate)
 
-def _log_request(request, log_body: bool = True):
     request_extra = {
         "method": request.method,
         "url": request.url,
     }
     if _log_headers:
         request_extra["headers"] = _sanitize_headers(request.headers)
-    if log_body:
-        request_extra["body"] = _get_request_body(request)
+    if request.log_body_sampled:
+        request_extra["body"] = _get_request_body(request, log_streamed_body)
     _logger.info(f"S=> {request.method} - {request.url}", extra=request_extra)
     request.start_time = time()
 
 
-async def _log_request_async(request):
-    _log_request(request)
-
+async def _log_request_async(request, **kwargs):
+    _log_request(request, **kwargs)
 
-def _log_request_no_body(request):
-    _log_request(request, log_body=False)
 
-
-async def _log_request_no_body_async(request):
-    _log_request(request, log_body=False)
-
-
-def _log_response(response, log_body: bool = True):
+def _log_response(response, log_body: bool = True, log_streamed_body: bool = False, endpoint: EndpointConfig = None):
     # get the initial request, handling and warning if there was a redirect
     request = response.request
     if response.history:
@@ -122,72 +196,268 @@ def _log_response(response, log_body: bool = True):
     }
     if _log_headers:
         response_extra["headers"] = _sanitize_headers(response.headers)
-    if log_body:
+    if "timings" in response.extensions:
+        response_extra["timings"] = response.extensions["timings"]
+    if response.extensions.get("retries"):
+        response_extra["retries"] = response.extensions["retries"]
+    if response.extensions.get("revalidated"):
+        response_extra["revalidated"] = True
+
+    # bodies are only logged for sampled requests, except for errors, which are always logged
+    is_error = response.status_code >= 400
+    if log_body and (is_error or getattr(request, "log_body_sampled", True)):
+        if log_streamed_body and not response.is_stream_consumed:
+            response.read()
         response_extra["body"] = _get_response_body(response)
-    _logger.info(f"S<= {request.method} ({response.status_code}) - {request.url}", extra=response_extra)
-    _record_metrics(request, response, duration)
+        if is_error and not getattr(request, "log_body_sampled", True):
+            response_extra["request_body"] = _get_request_body(request, log_streamed_body)
 
+    # responses served from the cache never reached the upstream, so they are only counted by the cache metrics
+    if response.extensions.get("from_cache"):
+        response_extra["cached"] = True
+        _logger.info(f"S<= {request.method} ({response.status_code}) - {request.url} (cached)", extra=response_extra)
+        return
 
-async def _log_response_async(response):
-    _log_response(response)
+    _logger.info(f"S<= {request.method} ({response.status_code}) - {request.url}", extra=response_extra)
+    _record_metrics(request, response, duration, endpoint)
 
 
-def _log_response_no_body(response):
-    _log_response(response, log_body=False)
+async def _log_response_async(
+    response, log_body: bool = True, log_streamed_body: bool = False, endpoint: EndpointConfig = None
+):
+    # a streamed body needs to be read asynchronously, before the sync logging can use it
+    if log_body and log_streamed_body and not response.is_stream_consumed:
+        await response.aread()
+    _log_response(response, log_body=log_body, log_streamed_body=False, endpoint=endpoint)
 
 
-async def _log_response_no_body_async(response):
-    _log_response(response)
+def get_correlation_id():
+    """Get the correlation id of the current request, from the event loop's context, or else the current thread"""
+    correlation_id = _correlation_id.get()
+    if correlation_id is None:
+        correlation_id = getattr(threading.current_thread(), "blink_correlation_id", None)
+    return correlation_id
 
 
 def _add_correlation_id_header(request):
-    cur_thread = threading.current_thread()
-    if hasattr(cur_thread, "blink_correlation_id"):
+    correlation_id = get_correlation_id()
+    if correlation_id is not None:
         # convert to a string, since a UUID can't be encoded to a header
-        request.headers["Blink-Correlation-Id"] = str(cur_thread.blink_correlation_id)
+        request.headers["Blink-Correlation-Id"] = str(correlation_id)
 
 
 async def _add_correlation_id_header_async(request):
     _add_correlation_id_header(request)
 
 
+def _add_deadline_header(request):
+    """Fail the request if the deadline for the work being done has passed, otherwise forward the time remaining"""
+    remaining = get_remaining_seconds()
+    if remaining is None:
+        return
+    if remaining <= 0:
+        statsd.increment("http.request.deadline_exceeded", tags=[f"endpoint:{request.url.host}"])
+        raise DeadlineExceededError(f"The deadline passed before sending {request.method} {request.url}")
+    request.headers[DEADLINE_HEADER] = str(int(remaining * 1000))
+
+
+async def _add_deadline_header_async(request):
+    _add_deadline_header(request)
+
+
 def _get_config(config_name: str, is_async: bool):
-    settings_config = settings.HTTP_CLIENTS["endpoints"][config_name]
+    """
+    Build the HTTPX client kwargs for an endpoint in settings.HTTP_CLIENTS
+
+    Endpoint options:
+    * root_url: the base url for all requests made by the client
+    * auth: a dict with a username and password, used for basic auth
+    * default_timeout_seconds: the timeout for all requests, unless overridden when making the request
+    * num_retries: how many times to retry failed connection attempts
+    * log_body: whether to log request/response bodies (default: True)
+    * log_body_sample_rate: the fraction (0-1) of bodies to log, though error bodies are always logged (default:
+        settings.HTTP_LOG_BODY_SAMPLE_RATE)
+    * log_streamed_body: if True, streamed request/response bodies are read into memory so they can be logged.
+        Otherwise, they are logged as "<streamed>" (default: False)
+    * mocked_transport: a dict with the path and name of a respx router, used in place of the network
+    * record: a dict with the path of a JSON lines file, to append every response received to
+    * replay: a dict with the path of a file written by 'record', whose responses are replayed in place of the network,
+        after latency_ms plus a random 0 to jitter_ms.  Used for deterministic, offline benchmarks.
+    * timeouts: a dict overriding default_timeout_seconds for any of the connect, read, write or pool timeouts
+    * http2: if True, use HTTP/2 when the server supports it, multiplexing concurrent requests over one connection.
+        With an http:// root_url, HTTP/2 is used with prior knowledge, so the server must support it.
+    * limits: a dict with max_connections, max_keepalive_connections and keepalive_expiry (seconds) for the pool
+    * shared_pool: if set, sync clients share a single connection pool across all threads in the process, instead of
+        one pool per thread.  Can be True, or a dict with max_connections and max_keepalive_connections.  The pool's
+        usage and wait time are reported as http.pool.* metrics, except with http2, where requests don't each use a
+        connection of their own.
+    * cache: if set, GET responses are cached according to their Cache-Control, ETag and Last-Modified headers, in a
+        cache shared by all clients for the endpoint.  Can be True, or a dict with any of:
+        * max_entries: the max number of responses to keep in memory (default: 1000)
+        * max_ttl_seconds: the max time to keep a response, even if it could still be revalidated (default: 300)
+        * default_ttl_seconds: how long a response is fresh, when it has no Cache-Control max-age (default: 0)
+        * shared_cache_alias: a Django cache (such as Redis) to also store responses in, shared across processes
+    * circuit_breaker: if set, requests fail fast with CircuitOpenError after repeated failures (connection errors or
+        5xx responses), until the upstream recovers.  Can be True, or a dict with any of failure_threshold (default: 5),
+        recovery_timeout_seconds (default: 30) and half_open_max_calls (default: 1).  State changes are recorded as
+        events, using the function set in HTTP_CLIENTS["event_recorder"].
+    * retries: if set, failed idempotent requests (connection errors, or a status in retry_statuses) are retried with
+        exponential backoff and jitter, limited by a retry budget.  Can be True, or a dict with any of max_retries
+        (default: 2), backoff_base_seconds (default: 0.1), backoff_max_seconds (default: 2), retry_statuses (default:
+        429, 502, 503, 504), budget_ratio (default: 0.2) and min_retries_per_second (default: 1).
+    * clamp_to_deadline: if True, each request's timeouts are clamped to the time left until the deadline of the work
+        being done (see common_lib.deadline).  Whether or not this is set, requests fail with DeadlineExceededError once
+        the deadline has passed, and the time remaining is forwarded in the Blink-Deadline-Ms header.
+    * phase_timings: if True, record how long each phase of a request took (pool wait, time to response headers and
+        reading the body), as http.request.phase.* metrics and in the latency histograms
+    * routes: route templates, such as ["/{foo_id}/", "/{foo_id}/bars/"], used to tag metrics with the route of each
+        request, without the cardinality of raw paths.  Paths that match none of them are tagged as "other".  Without
+        routes, path segments that look like ids are replaced with {id}, which only catches ids with digits, so
+        endpoints with other ids (such as slugs) need routes.
+    * coalesce_requests: if True, concurrent identical GET/HEAD requests share a single upstream call.  Sync requests
+        are coalesced across all threads, and async requests across all tasks on the same event loop.
+    """
+    endpoint = endpoint_registry.get(config_name)
+    settings_config = endpoint.options
 
     # setup the config dict (an async client needs async hook methods)
-    log_body = settings_config.get("log_body", True)
     if is_async:
-        req_logger = _log_request_async if log_body else _log_request_no_body_async
-        resp_logger = _log_response_async if log_body else _log_response_no_body_async
-        config = {"event_hooks": {"request": [req_logger, _add_correlation_id_header_async], "response": [resp_logger]}}
+        req_logger = partial(_log_request_async, **endpoint.request_log_kwargs)
+        resp_logger = partial(_log_response_async, endpoint=endpoint, **endpoint.response_log_kwargs)
+        request_hooks = [req_logger, _add_correlation_id_header_async, _add_deadline_header_async]
+        config = {"event_hooks": {"request": request_hooks, "response": [resp_logger]}}
     else:
-        req_logger = _log_request if log_body else _log_request_no_body
-        resp_logger = _log_response if log_body else _log_response_no_body
-        config = {"event_hooks": {"request": [req_logger, _add_correlation_id_header], "response": [resp_logger]}}
-
-    if "root_url" in settings_config:
-        config["base_url"] = settings_config["root_url"]
-    if "auth" in settings_config:
-        config["auth"] = (settings_config["auth"]["username"], settings_config["auth"]["password"])
-    if "default_timeout_seconds" in settings_config:
-        config["timeout"] = settings_config["default_timeout_seconds"]
-    if "num_retries" in settings_config:
+        req_logger = partial(_log_request, **endpoint.request_log_kwargs)
+        resp_logger = partial(_log_response, endpoint=endpoint, **endpoint.response_log_kwargs)
+        request_hooks = [req_logger, _add_correlation_id_header, _add_deadline_header]
+        config = {"event_hooks": {"request": request_hooks, "response": [resp_logger]}}
+
+    if endpoint.base_url is not None:
+        config["base_url"] = endpoint.base_url
+    if endpoint.auth is not None:
+        config["auth"] = endpoint.auth
+    if endpoint.timeout is not None:
+        config["timeout"] = endpoint.timeout
+    if endpoint.mocked_router is not None:
+        config["transport"] = MockTransport(router=endpoint.mocked_router)
+    elif endpoint.replay_recordings is not None:
+        replay_transport_class = AsyncReplayTransport if is_async else ReplayTransport
+        replay_config = settings_config["replay"]
+        config["transport"] = replay_transport_class(
+            endpoint.replay_recordings, replay_config.get("latency_ms", 0), replay_config.get("jitter_ms", 0)
+        )
+    elif endpoint.uses_custom_transport:
         transport_class = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
-        config["transport"] = transport_class(retries=settings_config["num_retries"])
-    if "mocked_transport" in settings_config and settings_config["mocked_transport"]:
-        path = settings_config["mocked_transport"]["path"]
-        name = settings_config["mocked_transport"]["name"]
-        router = getattr(import_module(path), name)
-        config["transport"] = MockTransport(router=router)
+        config["transport"] = transport_class(
+            http2=settings_config.get("http2", False),
+            # with prior knowledge, HTTP/2 can be used without TLS, but then HTTP/1.1 must be disabled
+            http1=not (settings_config.get("http2", False) and settings_config.get("root_url", "").startswith("http:")),
+            limits=endpoint.limits,
+            retries=settings_config.get("num_retries", 0),
+        )
+    if settings_config.get("record"):
+        recording_transport_class = AsyncRecordingTransport if is_async else RecordingTransport
+        config["transport"] = recording_transport_class(config["transport"], settings_config["record"]["path"])
+    if settings_config.get("clamp_to_deadline"):
+        deadline_transport_class = AsyncDeadlineTransport if is_async else DeadlineTransport
+        config["transport"] = deadline_transport_class(config["transport"])
+    if settings_config.get("phase_timings"):
+        timing_transport_class = AsyncTimingTransport if is_async else TimingTransport
+        config["transport"] = timing_transport_class(config["transport"])
+    # HTTP/2 multiplexes requests over each connection, so in-flight requests can't be metered as connections
+    if _uses_shared_pool(settings_config, is_async) and not settings_config.get("http2"):
+        max_connections = endpoint.limits.max_connections
+        config["transport"] = SharedPoolTransport(config["transport"], config_name, max_connections)
+    if settings_config.get("circuit_breaker") or settings_config.get("retries"):
+        resilient_transport_class = AsyncResilientTransport if is_async else ResilientTransport
+        config["transport"] = resilient_transport_class(
+            config["transport"],
+            config_name,
+            circuit_breaker=_get_circuit_breaker(config_name) if settings_config.get("circuit_breaker") else None,
+            retry_policy=_get_retry_policy(config_name) if settings_config.get("retries") else None,
+        )
+    if settings_config.get("coalesce_requests"):
+        if is_async:
+            # async requests can only share a call made on the same event loop, so coalesce within the client
+            config["transport"] = AsyncCoalescingTransport(config["transport"])
+        else:
+            single_flight = _get_process_state(_single_flights, config_name, SingleFlight)
+            config["transport"] = CoalescingTransport(config["transport"], single_flight)
+    if settings_config.get("cache"):
+        caching_transport_class = AsyncCachingTransport if is_async else CachingTransport
+        config["transport"] = caching_transport_class(config["transport"], _get_response_cache(config_name))
     return config
 
 
-def get_response(response: Response, allow_non_200: bool = False, as_json: bool = False):
-    # Checks if response status in 2xx range or if manually allowing non 200 statuses. If so, return response in json.
+def _get_process_state(registry: dict, config_name: str, factory):
+    """Get an endpoint's entry from a process-wide registry, creating it with factory() if it doesn't exist yet"""
+    with _process_state_lock:
+        state = registry.get(config_name, None)
+        if state is None:
+            state = factory()
+            registry[config_name] = state
+
+    return state
+
+
+def _get_response_cache(config_name: str) -> ResponseCache:
+    """Get the process-wide response cache for an endpoint, so all threads and event loops share cached responses"""
+    cache_config = endpoint_registry.get(config_name).options["cache"]
+    cache_kwargs = cache_config if isinstance(cache_config, dict) else {}
+    return _get_process_state(_response_caches, config_name, lambda: ResponseCache(**cache_kwargs))
+
+
+def _get_circuit_breaker(config_name: str) -> CircuitBreaker:
+    breaker_config = endpoint_registry.get(config_name).options["circuit_breaker"]
+    breaker_kwargs = breaker_config if isinstance(breaker_config, dict) else {}
+    return _get_process_state(
+        _circuit_breakers,
+        config_name,
+        lambda: CircuitBreaker(config_name, on_state_change=_record_event, **breaker_kwargs),
+    )
+
+
+def _get_retry_policy(config_name: str) -> RetryPolicy:
+    retry_config = endpoint_registry.get(config_name).options["retries"]
+    retry_kwargs = dict(retry_config) if isinstance(retry_config, dict) else {}
+    budget = RetryBudget(
+        ratio=retry_kwargs.pop("budget_ratio", 0.2),
+        min_retries_per_second=retry_kwargs.pop("min_retries_per_second", 1.0),
+    )
+    return _get_process_state(_retry_policies, config_name, lambda: RetryPolicy(budget=budget, **retry_kwargs))
+
+
+def _record_event(event):
+    """
+    Record an event through the function configured in HTTP_CLIENTS["event_recorder"], or just log it if not set
+
+    The recorder is configured by path, so this module doesn't depend on the service's event recording code.
+    """
+    recorder_config = settings.HTTP_CLIENTS.get("event_recorder")
+    if not recorder_config:
+        if _logger.isEnabledFor(event.log_level):
+            _logger.log(event.log_level, event.log_message, extra=event.tags)
+        return
+
+    record_event = getattr(import_module(recorder_config["path"]), recorder_config["name"])
+    record_event(event, on_commit=False)
+
+
+def _uses_shared_pool(settings_config: dict, is_async: bool) -> bool:
+    # async clients are bound to the event loop they were created on, so they can't be shared across threads
+    return not is_async and bool(settings_config.get("shared_pool"))
+
+
+def _check_status(response: Response, allow_non_200: bool):
+    # Checks if response status in 2xx range or if manually allowing non 200 statuses
     if response.status_code >= 300 and not allow_non_200:
         raise ClientError(
             f"Received status code {response.status_code} back from {response.request.url} with the following response: {response.text}"
         )
+
+
+def get_response(response: Response, allow_non_200: bool = False, as_json: bool = False):
+    _check_status(response, allow_non_200)
     try:
         if as_json:
             return response.json()
@@ -197,13 +467,71 @@ def get_response(response: Response, allow_non_200: bool = False, as_json: bool
         raise BlinkParsingError()
 
 
+def iter_response(response: Response, mode: StreamModes = StreamModes.bytes, allow_non_200: bool = False) -> Iterator:
+    """
+    Iterate over the body of a streamed response, without reading it all into memory
+
+    The response should come from client.stream(), which only reads the body as it is iterated:
+
+        with get_client("foo").stream("GET", "/export/") as response:
+            for foo_data in iter_response(response, StreamModes.json_items):
+                ...
+
+    Endpoints with cache or coalesce_requests read GET responses in full before returning them, so they should not be
+    used for large exports.  Response logging doesn't read streamed bodies, unless the endpoint sets log_streamed_body.
+
+    :param mode: whether to yield raw chunks of bytes, decoded lines, or the parsed items of a top-level JSON array
+    """
+    if response.status_code >= 300 and not allow_non_200:
+        response.read()
+        _check_status(response, allow_non_200)
+
+    if mode == StreamModes.bytes:
+        yield from response.iter_bytes()
+    elif mode == StreamModes.lines:
+        yield from (line.rstrip("\r\n") for line in response.iter_lines())
+    else:
+        parser = JsonArrayParser()
+        for text in response.iter_text():
+            yield from parser.feed(text)
+        yield from parser.close()
+
+
+async def aiter_response(
+    response: Response, mode: StreamModes = StreamModes.bytes, allow_non_200: bool = False
+) -> AsyncIterator:
+    """The async version of iter_response, for responses streamed from an async client"""
+    if response.status_code >= 300 and not allow_non_200:
+        await response.aread()
+        _check_status(response, allow_non_200)
+
+    if mode == StreamModes.bytes:
+        async for chunk in response.aiter_bytes():
+            yield chunk
+    elif mode == StreamModes.lines:
+        async for line in response.aiter_lines():
+            yield line.rstrip("\r\n")
+    else:
+        parser = JsonArrayParser()
+        async for text in response.aiter_text():
+            for item in parser.feed(text):
+                yield item
+        for item in parser.close():
+            yield item
+
+
 def get_client(client_name: str, is_async: bool = False):
     """
     Get a persistent client, with a connection-pool, and unique for each thread
 
     The client should not be closed, so it can be re-used between requests.  This won't work when using runserver, but
     if you are using the run_async_as_sync decorator, it will automatically handle that for you.
+
+    If a sync client's endpoint is configured with 'shared_pool', a single client is shared by all threads instead.
     """
+    if not is_async and endpoint_registry.get(client_name).options.get("shared_pool"):
+        return _get_shared_client(client_name)
+
     # get the thread's list of clients, creating it if it doesn't already exist
     client_attr = "httpx_async_clients" if is_async else "httpx_clients"
     thread_clients = getattr(_thread_local, client_attr, {})
@@ -220,6 +548,46 @@ def get_client(client_name: str, is_async: bool = False):
     return client
 
 
+def _get_shared_client(client_name: str) -> httpx.Client:
+    """Get the process-wide sync client for an endpoint, creating it if needed"""
+    client = _shared_clients.get(client_name, None)
+    if client is None:
+        with _shared_clients_lock:
+            # check again, in case another thread created it while waiting on the lock
+            client = _shared_clients.get(client_name, None)
+            if client is None:
+                client = httpx.Client(**_get_config(client_name, is_async=False))
+                _shared_clients[client_name] = client
+
+    return client
+
+
+def load_endpoints(warm_connections: bool = False):
+    """
+    Validate and pre-process every endpoint in settings.HTTP_CLIENTS, and optionally connect to each of them
+
+    Call this at startup, so invalid settings fail before serving requests, and so the first request for each endpoint
+    doesn't pay for building its config.  Warming connections opens a pooled connection (DNS, TCP and TLS) to each
+    endpoint with a root_url and shared_pool, in the shared client that every request thread uses.  Other endpoints
+    aren't warmed, since their clients are per thread, and the thread calling this never serves requests.  Failures to
+    connect are only logged, so an unavailable upstream doesn't stop the service from starting.
+    """
+    endpoints = endpoint_registry.load()
+    if warm_connections:
+        for endpoint in endpoints.values():
+            _warm_connection(endpoint)
+
+
+def _warm_connection(endpoint: EndpointConfig):
+    if not endpoint.base_url or endpoint.mocked_router is not None or not endpoint.options.get("shared_pool"):
+        return
+    try:
+        # any response means the connection was opened, and it stays in the shared client's pool
+        _get_shared_client(endpoint.name).head("")
+    except Exception as ex:
+        _logger.warning(f"Failed to warm connection to {endpoint.name}: {ex!r}", extra={"url": endpoint.base_url})
+
+
 def get_event_loop():
     """Retrieves a running event loop and if one not found, creates a new event loop"""
     try:
@@ -244,6 +612,11 @@ def run_async_as_sync(async_func):
     When running with runserver, it will close the event loop after each request, causing warnings about not closing
     the HTTPX client(s).  This will automatically close all async clients before returning, when running with runserver,
     so the clients are closed properly.  When running with gunicorn, it will leave them open, so they can be re-used.
+
+    If HTTP_CLIENTS["background_event_loop"] is True, the function is instead run on a single event loop per process,
+    on a background thread, and the calling thread blocks until it completes.  Async clients are then shared by every
+    thread, and never need to be rebuilt for a new loop.  The caller's correlation id is passed along, so it is still
+    added to outbound requests.
     """
 
     async def close_thread_clients():
@@ -253,8 +626,24 @@ def run_async_as_sync(async_func):
             await thread_clients[client_name].aclose()
             del thread_clients[client_name]
 
+    async def run_with_context(correlation_id, deadline_time, *args, **kwargs):
+        # this runs in its own task, so setting the context vars doesn't affect other requests using the loop
+        _correlation_id.set(correlation_id)
+        set_deadline(deadline_time)
+        return await async_func(*args, **kwargs)
+
     @wraps(async_func)
     def decorator(*args, **kwargs):
+        should_close_clients = settings.IS_RUN_SERVER or settings.ENVIRONMENT == DeploymentEnvironments.test.value
+
+        if settings.HTTP_CLIENTS.get("background_event_loop", False):
+            try:
+                return _event_loop_thread.run(run_with_context(get_correlation_id(), get_deadline(), *args, **kwargs))
+            finally:
+                # the loop stays open, but unit tests need clients rebuilt to pick up any settings changes
+                if should_close_clients:
+                    _event_loop_thread.run(close_thread_clients())
+
         # get an existing event loop, or create a new one
         loop = get_event_loop()
 
@@ -263,9 +652,56 @@ def run_async_as_sync(async_func):
             result = loop.run_until_complete(async_func(*args, **kwargs))
         finally:
             # clean up any async httpx clients from this thread, if using runserver or running unit tests
-            if settings.IS_RUN_SERVER or settings.ENVIRONMENT == DeploymentEnvironments.test.value:
+            if should_close_clients:
                 loop.run_until_complete(close_thread_clients())
 
         return result
 
     return decorator
+
+
+@dataclass
+class BatchResult:
+    """The outcome of one item in a batch call, holding either its value or the error it raised"""
+
+    key: Hashable
+    value: Any = None
+    error: Optional[Exception] = None
+
+    @property
+    def is_success(self) -> bool:
+        return self.error is None
+
+
+async def gather_batch(
+    async_func: Callable[[Hashable], Awaitable],
+    keys: Iterable[Hashable],
+    max_concurrency: int = 10,
+    timeout_seconds: float = None,
+) -> List[BatchResult]:
+    """
+    Call an async function once for each unique key, with at most max_concurrency calls running at once
+
+    This allows replacing N sequential round-trips with concurrent waves on a single event loop.  A failure or timeout
+    for one key doesn't affect the others, so each result holds either the value or the error for its key.
+
+    :param async_func: called with each key, ex: get_foo_async
+    :param keys: the keys to call async_func with.  Duplicate keys are only called once, but appear in every position.
+    :param max_concurrency: the max number of calls in flight at once
+    :param timeout_seconds: if set, the max time a single call can take, after it starts, before it is cancelled
+    :return: a BatchResult for every key, in the same order as the keys
+    """
+    keys = list(keys)
+    unique_keys = list(dict.fromkeys(keys))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def call(key):
+        async with semaphore:
+            try:
+                return BatchResult(key, value=await asyncio.wait_for(async_func(key), timeout_seconds))
+            except Exception as ex:
+                return BatchResult(key, error=ex)
+
+    results = await asyncio.gather(*(call(key) for key in unique_keys))
+    results_by_key = dict(zip(unique_keys, results))
+    return [results_by_key[key] for key in keys]
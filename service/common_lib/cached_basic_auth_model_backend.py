@@ -6,12 +6,13 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 
-from blink_logging_metrics.metrics import statsd
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 from django.utils.timezone import make_aware
 
+from common_lib.metrics import statsd
+
 HASH_ITERATIONS = 100
 MAX_FAILED_ATTEMPTS = 5
 LOCK_DURATION_MINUTES = 60
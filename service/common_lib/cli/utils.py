@@ -1,9 +1,8 @@
 import logging
 from typing import Union, Callable
 
-from blink_logging_metrics.metrics import statsd
-
 from common_lib.cli import prompt
+from common_lib.metrics import statsd
 
 _logger = logging.getLogger(__name__)
 
@@ -0,0 +1,107 @@
+"""
+A per-request deadline, so outbound calls made while handling a request don't outlive the time it has left
+
+The deadline is set for each inbound request by DeadlineMiddleware, and read by blink_requests_async, which fails
+outbound calls once it has passed, forwards the remaining time downstream as a header, and can clamp timeouts to it.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+DEADLINE_HEADER = "Blink-Deadline-Ms"  # the milliseconds the caller has left to wait for the response
+_deadline = contextvars.ContextVar("blink_deadline", default=None)
+
+
+class DeadlineExceededError(httpx.TimeoutException):
+    """Raised instead of making an outbound request, when the request being handled has run out of time"""
+
+
+def get_deadline() -> Optional[float]:
+    """Get the current deadline, as a time.monotonic() value, or None if there isn't one"""
+    return _deadline.get()
+
+
+def get_remaining_seconds() -> Optional[float]:
+    """Get the seconds left until the current deadline, which is negative once passed, or None if there isn't one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def parse_deadline_header(value: Optional[str]) -> Optional[float]:
+    """Get the seconds remaining from a deadline header's value, ignoring it if it isn't valid"""
+    try:
+        return max(int(value), 0) / 1000
+    except (TypeError, ValueError):
+        return None
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Set a deadline, the given number of seconds from now, while in the context
+
+    An existing deadline that is sooner is kept, so code can't give itself more time than its caller has.  The deadline
+    is stored in a context var, so it applies to the current thread, and any asyncio tasks it creates.
+    """
+    new_deadline = None if seconds is None else time.monotonic() + seconds
+    current_deadline = _deadline.get()
+    if current_deadline is not None and (new_deadline is None or current_deadline < new_deadline):
+        new_deadline = current_deadline
+
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def set_deadline(deadline_time: Optional[float]):
+    """Set the deadline (a time.monotonic() value) for the current context, such as a task running another's work"""
+    _deadline.set(deadline_time)
+
+
+def _clamp_timeouts(extensions: dict) -> dict:
+    remaining = get_remaining_seconds()
+    if remaining is None:
+        return extensions
+    if remaining <= 0:
+        raise DeadlineExceededError("The deadline for the request being handled has passed")
+
+    timeouts = {
+        name: remaining if timeout is None else min(timeout, remaining)
+        for name, timeout in extensions.get("timeout", {}).items()
+    }
+    return {**extensions, "timeout": timeouts}
+
+
+class DeadlineTransport(httpx.BaseTransport):
+    """
+    A transport that clamps each request's timeouts to the time left until the current deadline
+
+    This is checked for every attempt, so each retry only gets the time that is left.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        return self._transport.handle_request(method, url, headers, stream, _clamp_timeouts(extensions))
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncDeadlineTransport(httpx.AsyncBaseTransport):
+    """The async version of DeadlineTransport"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        return await self._transport.handle_async_request(method, url, headers, stream, _clamp_timeouts(extensions))
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -1,7 +1,10 @@
 import logging
-
+import weakref
 from dataclasses import dataclass
-from typing import List
+from string import Formatter
+from typing import Dict, List, Optional, Tuple, Type
+
+from django.core.exceptions import ImproperlyConfigured
 
 _logger = logging.getLogger(__name__)
 
@@ -17,6 +20,74 @@ class EventField:
     is_kwargs: bool  # True if the field starts with '**', and allows any field to be added to the event
 
 
+class EventRegistry:
+    """
+    Every Event class that has been defined (besides abstract bases), so they can be validated and exported together
+
+    Classes are held weakly, so events defined in functions (such as tests) don't stay registered once they're gone.
+    """
+
+    def __init__(self):
+        self._event_classes = weakref.WeakSet()
+
+    def register(self, event_class: Type["Event"]):
+        self._event_classes.add(event_class)
+
+    def get_event_classes(self) -> List[Type["Event"]]:
+        """Get the registered event classes, sorted by event name"""
+        return sorted(self._event_classes, key=lambda cls: (cls.event_name, cls.__module__, cls.__qualname__))
+
+    def validate(self):
+        """Check the metric definitions of every event, raising ImproperlyConfigured with all of the errors found"""
+        errors = [error for event_class in self.get_event_classes() for error in event_class.get_definition_errors()]
+        if errors:
+            raise ImproperlyConfigured("Invalid event definitions:\n" + "\n".join(errors))
+
+    def get_catalog(self) -> List[dict]:
+        """Describe every registered event, in a JSON serializable form, such as for building dashboards"""
+        return [event_class.get_catalog_entry() for event_class in self.get_event_classes()]
+
+
+event_registry = EventRegistry()
+
+
+class _cached_attribute:
+    """
+    Like functools.cached_property, but without its lock, which costs more than building these small values
+
+    At worst, two threads reading an attribute of the same event at once will both build it.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name] = self.function(instance)
+        return value
+
+
+class _LazyMessage:
+    """
+    Replaces an event class's message, so it is only formatted with the event's tags when first read, then cached
+
+    Reading it from the class gives the unformatted message.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.template
+        message = self.template.format(**instance.tags)
+        instance.__dict__["message"] = message
+        return message
+
+
 class Event:
     """
     Base event class to automatically parse, validate and store args on construction.
@@ -45,7 +116,8 @@ class Event:
           in at all.
         * If the last field starts with '**', then all non-defined fields will be allowed.
     * message: If set, will be included in the log message.  It will processed with the format() function, passing in
-        all values passed in from `event_fields`.
+        all values passed in from `event_fields`.  This is done the first time it is read, so events that aren't
+        logged never format their message.
     * log_level: Determines the level to log the event at.  If it is set to logging.NOTSET, then the event will not be
         logged.  This is useful if you want an event to be emitted as a metric only.
         * Default: logging.INFO
@@ -56,6 +128,21 @@ class Event:
     * metric_increment_field: If `set, the event field referenced will determine how much to increment the metric.  If
         not set, the field would be incremented by 1.
         * Default: None
+    * high_cardinality_fields: Fields with too many distinct values to be metric tags, like ids.  They are left out of
+        the metric's tags, even if listed in metric_tags.
+        * Default: empty list
+    * log_sample_rate: The fraction of these events to log, from 0 to 1.  Errors are always logged, and metrics are
+        always emitted, so counts stay accurate.
+        * Default: 1
+    * log_max_per_second: If set, at most this many of these events will be logged per second, after sampling.
+        * Default: None
+    * log_burst_size: How many events can be logged at once, before log_max_per_second applies.
+        * Default: log_max_per_second, rounded up
+
+    Field definitions are parsed and validated when the class is defined, so a bad definition fails on import, rather
+    than the first time the event is created.  A class that defines neither event_name nor event_fields is treated as
+    an abstract base for other events, and is only validated if it is created directly.  Every other class is added to
+    event_registry, which checks that metric tags and fields refer to event_fields when the app starts.
     """
 
     # required to be set by sub-classes
@@ -67,6 +154,124 @@ class Event:
     emit_metric: bool = False
     metric_tags: List[str] = []
     metric_increment_field: str = None
+    high_cardinality_fields: List[str] = []
+    log_sample_rate: float = 1.0
+    log_max_per_second: float = None
+    log_burst_size: int = None
+    # set when the class is defined, from event_fields
+    _fields: List[EventField] = None
+    _field_map: Dict[str, EventField] = None
+    _positional_names: Tuple[str, ...] = ()
+    _default_values: Tuple[Tuple[str, object], ...] = ()
+    _required_names: Tuple[str, ...] = ()
+    _non_nullable_names: Tuple[str, ...] = ()
+    _allow_any_parameter: bool = False
+    _metric_tag_names: Tuple[str, ...] = ()
+    is_log_limited: bool = False  # True if the event's logs are sampled or rate limited
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = None
+        if cls.event_name or cls.event_fields:
+            cls._compile()
+
+    @classmethod
+    def _compile(cls):
+        """Parse and validate the field definitions, and pre-compute everything __init__ needs to validate parameters"""
+        fields = cls._parse_field_definitions()
+        named_fields = [field for field in fields if not field.is_kwargs]
+
+        allow_any_parameter = fields[-1].is_kwargs
+        if cls.message and not allow_any_parameter:
+            field_names = {field.name for field in named_fields}
+            for _, name, _, _ in Formatter().parse(cls.message):
+                if name is not None and name.split(".")[0].split("[")[0] not in field_names:
+                    raise ValueError(f"Message for {cls.__name__} uses {{{name}}}, which is not in event_fields")
+
+        cls._field_map = {field.name: field for field in named_fields}
+        cls._positional_names = tuple(field.name for field in named_fields)
+        cls._default_values = tuple(
+            (field.name, field.default_value) for field in named_fields if not field.is_required
+        )
+        cls._required_names = tuple(field.name for field in named_fields if field.is_required)
+        cls._non_nullable_names = tuple(field.name for field in named_fields if not field.allow_none)
+        cls._allow_any_parameter = allow_any_parameter
+        if cls.message and not isinstance(cls.__dict__.get("message"), _LazyMessage):
+            cls.message = _LazyMessage(cls.message)
+        cls._metric_tag_names = tuple(tag for tag in cls.metric_tags if tag not in cls.high_cardinality_fields)
+        cls._compile_log_limits()
+        cls._fields = fields
+        event_registry.register(cls)
+
+    @classmethod
+    def _compile_log_limits(cls):
+        if not 0 <= cls.log_sample_rate <= 1:
+            raise ValueError(f"log_sample_rate for {cls.__name__} must be between 0 and 1")
+        if cls.log_max_per_second is not None and cls.log_max_per_second <= 0:
+            raise ValueError(f"log_max_per_second for {cls.__name__} must be positive")
+        if cls.log_burst_size is not None and cls.log_max_per_second is None:
+            raise ValueError(f"log_burst_size for {cls.__name__} requires log_max_per_second")
+        cls.is_log_limited = cls.log_sample_rate < 1 or cls.log_max_per_second is not None
+
+    @_cached_attribute
+    def log_message(self) -> str:
+        """The event's name and message, as it should be logged"""
+        return f"{self.event_name}: {self.message}" if self.message else self.event_name
+
+    @_cached_attribute
+    def metric_tag_values(self) -> Optional[List[str]]:
+        """The metric_tags of the event as "name:value" strings, or None if it has no metric_tags"""
+        tag_names = self._metric_tag_names
+        if "metric_tags" in self.__dict__:
+            tag_names = [tag for tag in self.metric_tags if tag not in self.high_cardinality_fields]
+        return [f"{tag}:{self.tags[tag]}" for tag in tag_names] if tag_names else None
+
+    @classmethod
+    def get_definition_errors(cls) -> List[str]:
+        """Check that the fields referenced by the metric definition are in event_fields"""
+        if cls._allow_any_parameter:
+            return []
+        errors = []
+        for attribute in ("metric_tags", "high_cardinality_fields"):
+            for name in getattr(cls, attribute):
+                if name not in cls._field_map:
+                    errors.append(f"{cls.__name__}.{attribute} includes {name!r}, which is not in event_fields")
+        if cls.metric_increment_field and cls.metric_increment_field not in cls._field_map:
+            errors.append(
+                f"{cls.__name__}.metric_increment_field is {cls.metric_increment_field!r}, which is not in event_fields"
+            )
+        return errors
+
+    @classmethod
+    def get_catalog_entry(cls) -> dict:
+        """Describe the event, and the log and metric it records"""
+        return {
+            "event_name": cls.event_name,
+            "class": f"{cls.__module__}.{cls.__qualname__}",
+            "fields": [
+                {
+                    "name": field.name,
+                    "required": field.is_required,
+                    "nullable": field.allow_none,
+                    "default": None if field.is_required else repr(field.default_value),
+                    "high_cardinality": field.name in cls.high_cardinality_fields,
+                }
+                for field in cls._fields
+                if not field.is_kwargs
+            ],
+            "allows_any_field": cls._allow_any_parameter,
+            "message": cls.message,
+            "log_level": logging.getLevelName(cls.log_level) if cls.log_level else None,
+            "log_sample_rate": cls.log_sample_rate,
+            "log_max_per_second": cls.log_max_per_second,
+            "metric": {
+                "name": cls.event_name,
+                "tags": list(cls._metric_tag_names),
+                "increment_field": cls.metric_increment_field,
+            }
+            if cls.emit_metric
+            else None,
+        }
 
     def __repr__(self):
         return f"{self.__class__.__name__}({self.event_name!r}, {self.tags!r})"
@@ -122,23 +327,24 @@ class Event:
 
         return EventField(field, is_required, allow_none, default_value, is_kwargs)
 
-    def _parse_field_definitions(self):
+    @classmethod
+    def _parse_field_definitions(cls):
         """
         Parse all field info, to be used for parameter validation during event construction.
 
         :return: a list of EventField definitions
         """
         # ensure required fields exist
-        if not self.event_name:
-            raise ValueError("Class definition does not define 'event_name'")
-        if not self.event_fields:
-            raise ValueError("Class definition does not define 'event_fields'")
+        if not cls.event_name:
+            raise ValueError(f"Class definition for {cls.__name__} does not define 'event_name'")
+        if not cls.event_fields:
+            raise ValueError(f"Class definition for {cls.__name__} does not define 'event_fields'")
 
         # parse all fields
         fields = []
         default_found = False  # once True, all remaining fields must have a default value
-        for field_def in self.event_fields:
-            field = self._parse_field(field_def)
+        for field_def in cls.event_fields:
+            field = cls._parse_field(field_def)
 
             # track once a default field has been found
             if not field.is_required:
@@ -148,7 +354,7 @@ class Event:
             if field.is_required and default_found:
                 raise ValueError(f"Required field {field_def} can't be defined after an optional field")
 
-            if field.is_kwargs and field_def != self.event_fields[-1]:
+            if field.is_kwargs and field_def != cls.event_fields[-1]:
                 raise ValueError(f"**kwargs fields can only be added as the last parameter.")
 
             # store the field info
@@ -159,38 +365,33 @@ class Event:
 
     def __init__(self, *args, **kwargs):
         """Validate all constructor parameters, and store them in self.tags"""
-        if not hasattr(self, "_fields"):
-            self.__class__._fields = self._parse_field_definitions()
-
-        tags = dict()
-        fields = self._fields
-        allow_any_parameter = fields[-1].is_kwargs
+        cls = self.__class__
+        if cls._fields is None:
+            cls._compile()
 
         # read in all arguments
-        for i, arg in enumerate(args):
-            tags[fields[i].name] = arg
-        for key, value in kwargs.items():
-            if not any(f.name == key for f in fields) and not allow_any_parameter:
-                raise ValueError(f"Field {key} was not defined for {self.__class__.__name__}")
-            tags[key] = value
+        if len(args) > len(cls._positional_names):
+            raise IndexError(f"{cls.__name__} takes {len(cls._positional_names)} positional fields, got {len(args)}")
+        tags = dict(zip(cls._positional_names, args))
+        if kwargs:
+            if not cls._allow_any_parameter:
+                for key in kwargs:
+                    if key not in cls._field_map:
+                        raise ValueError(f"Field {key} was not defined for {cls.__name__}")
+            tags.update(kwargs)
 
         # validate fields, and set default values
-        for field in fields:
-            if field.is_kwargs:
-                continue
-            if field.name not in tags:
-                if field.is_required:
-                    raise ValueError(f"Field {field.name} was not set for {self.__class__.__name__}")
-                else:
-                    tags[field.name] = field.default_value
-            if not field.allow_none and tags[field.name] is None:
-                raise ValueError(f"Required field {field.name} is None for {self.__class__.__name__}")
-
-        # set message, if defined
-        if self.message:
-            self.message = self.message.format(**tags)
-
-        # set tags
+        for name, default_value in cls._default_values:
+            if name not in tags:
+                tags[name] = default_value
+        for name in cls._required_names:
+            if name not in tags:
+                raise ValueError(f"Field {name} was not set for {cls.__name__}")
+        for name in cls._non_nullable_names:
+            if tags[name] is None:
+                raise ValueError(f"Required field {name} is None for {cls.__name__}")
+
+        # set tags (the message is formatted with them when it's first read)
         self.tags = tags
 
         # run custom initialization, if defined
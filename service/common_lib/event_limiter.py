@@ -0,0 +1,71 @@
+"""Sampling and rate limiting of event logs, as declared by each Event class"""
+import math
+import random
+import threading
+import time
+from typing import Dict, Tuple
+
+from common_lib.event import Event
+from common_lib.metrics import statsd
+
+
+class _LimitState:
+    __slots__ = ("tokens", "updated_at", "suppressed")
+
+    def __init__(self, tokens: float):
+        self.tokens = tokens
+        self.updated_at = time.monotonic()
+        self.suppressed = 0
+
+
+class EventLimiter:
+    """
+    Decides whether each event should be logged, using the log_sample_rate, log_max_per_second and log_burst_size of
+    its class, tracked per event name
+
+    An event is first sampled, then rate limited by a token bucket that refills at log_max_per_second, up to
+    log_burst_size tokens.  Each suppressed event increments the event.suppressed metric, and the number suppressed
+    since the last logged event is returned with the next one that is allowed, so it can be included in that log.
+    """
+
+    def __init__(self):
+        self._states: Dict[str, _LimitState] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, event: Event) -> Tuple[bool, int]:
+        """Check if an event should be logged, returning whether it should, and the count suppressed before it"""
+        if not event.is_log_limited:
+            return True, 0
+
+        with self._lock:
+            burst_size = event.log_burst_size or math.ceil(event.log_max_per_second or 0)
+            state = self._states.get(event.event_name)
+            if state is None:
+                state = self._states[event.event_name] = _LimitState(burst_size)
+
+            allowed = event.log_sample_rate >= 1 or random.random() < event.log_sample_rate
+            if allowed and event.log_max_per_second:
+                now = time.monotonic()
+                state.tokens = min(state.tokens + (now - state.updated_at) * event.log_max_per_second, burst_size)
+                state.updated_at = now
+                if state.tokens >= 1:
+                    state.tokens -= 1
+                else:
+                    allowed = False
+
+            if not allowed:
+                state.suppressed += 1
+                suppressed = 0
+            else:
+                suppressed, state.suppressed = state.suppressed, 0
+
+        if not allowed:
+            statsd.increment("event.suppressed", tags=[f"event_name:{event.event_name}"])
+        return allowed, suppressed
+
+    def clear(self):
+        with self._lock:
+            self._states.clear()
+
+
+event_limiter = EventLimiter()
@@ -0,0 +1,69 @@
+"""A single, persistent event loop per process, running on a background thread"""
+import asyncio
+import os
+import threading
+from typing import Coroutine
+
+
+class EventLoopThread:
+    """
+    Owns an event loop that runs forever on a daemon thread, so any thread can submit coroutines to it
+
+    Since every coroutine runs on the same loop, objects bound to a loop, such as async HTTPX clients and their
+    connection pools, can be shared by the whole process instead of being rebuilt for each thread's loop.
+
+    The loop is started lazily, and re-created if the process has forked (such as gunicorn workers forking from the
+    master process), as a thread doesn't survive a fork.
+    """
+
+    def __init__(self, name: str = "event-loop"):
+        self._name = name
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        if not self.is_running:
+            with self._lock:
+                if not self.is_running:
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run_loop, name=self._name, daemon=True)
+        self._thread.start()
+        started.wait()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    def run(self, coroutine: Coroutine):
+        """Run a coroutine on the loop, blocking the calling thread until it completes, and return its result"""
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            # blocking the loop's own thread while waiting on the loop would deadlock
+            raise RuntimeError("Can't synchronously run a coroutine from the event loop thread.  Await it instead.")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.get_loop()).result()
+
+    def stop(self):
+        """Stop the loop and wait for its thread to exit"""
+        with self._lock:
+            if not self.is_running:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
@@ -0,0 +1,162 @@
+"""A background pipeline for recording events, so logging and metrics don't add latency to the calling thread"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from common_lib.metrics import statsd
+
+_logger = logging.getLogger(__name__)
+_stop = object()
+# pipelines whose locks are re-created in a forked child, since a lock held by another of the parent's threads at the
+# time of the fork would never be released in the child
+_pipelines = weakref.WeakSet()
+
+
+class EventPipeline:
+    """
+    A bounded queue of log records and metric increments, recorded in batches by a worker thread
+
+    Every flush_interval_seconds, the worker handles the queued log records, and sends each metric increment, with
+    counters for the same name and tags combined into a single increment.  The caller only pays for putting an item on
+    the queue, rather than formatting logs and sending a UDP packet for each metric.
+
+    If the queue is full, new items are dropped rather than blocking the caller.  Dropped items are counted, and
+    reported with the event_pipeline.dropped metric on the next flush.  Everything queued is flushed when the process
+    exits, and the worker is started lazily, and again after a fork.
+    """
+
+    def __init__(self, max_queue_size: int = 10000, flush_interval_seconds: float = 1.0, name: str = "event-pipeline"):
+        self._max_queue_size = max_queue_size
+        self._flush_interval_seconds = flush_interval_seconds
+        self._name = name
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._exit_registered = False
+        _pipelines.add(self)
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def submit_log(self, logger: logging.Logger, record: logging.LogRecord) -> bool:
+        """Queue a log record to be handled by the logger, returning False if it was dropped"""
+        return self._put(("log", logger, record))
+
+    def submit_metric(self, name: str, value: float = 1, tags: Tuple[str, ...] = ()) -> bool:
+        """Queue a metric increment, returning False if it was dropped"""
+        return self._put(("metric", name, value, tags))
+
+    def flush(self, timeout: float = None) -> bool:
+        """Record everything queued so far, blocking until done, and returning False if it timed out"""
+        if not self.is_running:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Flush everything queued, and stop the worker"""
+        with self._lock:
+            if not self.is_running:
+                return
+            try:
+                self._queue.put(_stop, timeout=timeout)
+            except queue.Full:
+                _logger.error(f"Timed out stopping {self._name}, dropping {self._queue.qsize()} queued items")
+                return
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _put(self, item) -> bool:
+        if not self.is_running:
+            self._start()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+            return False
+
+    def _start(self):
+        with self._lock:
+            if self.is_running:
+                return
+            # after a fork, the parent's queue may have been locked by a thread that doesn't exist in the child
+            self._queue = queue.Queue(maxsize=self._max_queue_size)
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            if not self._exit_registered:
+                atexit.register(self.stop)
+                self._exit_registered = True
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._dropped_lock = threading.Lock()
+
+    def _run(self):
+        logs: List[Tuple[logging.Logger, logging.LogRecord]] = []
+        metrics: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        next_flush = time.monotonic() + self._flush_interval_seconds
+
+        while True:
+            try:
+                item = self._queue.get(timeout=max(next_flush - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+
+            if item is _stop:
+                self._flush(logs, metrics)
+                return
+            if isinstance(item, threading.Event):
+                self._flush(logs, metrics)
+                item.set()
+            elif item is not None and item[0] == "log":
+                logs.append((item[1], item[2]))
+            elif item is not None:
+                _, name, value, tags = item
+                metrics[(name, tags)] = metrics.get((name, tags), 0) + value
+
+            # flush early if a burst of events has built up, so memory stays bounded by the queue size
+            if time.monotonic() >= next_flush or len(logs) >= self._max_queue_size:
+                self._flush(logs, metrics)
+                next_flush = time.monotonic() + self._flush_interval_seconds
+
+    def _flush(self, logs: list, metrics: dict):
+        try:
+            for logger, record in logs:
+                logger.handle(record)
+            for (name, tags), value in metrics.items():
+                statsd.increment(name, value=value, tags=list(tags) if tags else None)
+
+            with self._dropped_lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                statsd.increment("event_pipeline.dropped", value=dropped)
+                _logger.warning(f"{self._name} dropped {dropped} events, since its queue was full")
+        except Exception:
+            _logger.exception(f"Failed to flush {self._name}")
+        finally:
+            logs.clear()
+            metrics.clear()
+
+
+def _after_fork_in_child():
+    for pipeline in list(_pipelines):
+        pipeline._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,391 @@
+"""A caching layer for idempotent GET requests, used as a transport by HTTPX clients"""
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import time
+from typing import List, Optional, Tuple
+
+import httpx
+from django.core.cache import caches
+
+from common_lib.metrics import statsd
+
+_logger = logging.getLogger(__name__)
+_cacheable_status_codes = {200, 203, 300, 301, 404, 410}
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_TTL_SECONDS = 300
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    content: bytes
+    fresh_until: float  # epoch seconds after which the response must be revalidated before use
+    expires_at: float  # epoch seconds after which the response is dropped from the cache entirely
+    etag: Optional[bytes]
+    last_modified: Optional[bytes]
+    vary: Tuple[bytes, ...] = ()  # lower-case names of the request headers the response varies on
+    is_private: bool = False  # responses for a single user are never written to the shared tier
+
+    @property
+    def is_fresh(self) -> bool:
+        return time() < self.fresh_until
+
+    @property
+    def can_revalidate(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+def _get_header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for header_name, header_value in headers:
+        if header_name.lower() == name:
+            return header_value
+    return None
+
+
+def _parse_vary(value: Optional[bytes]) -> Tuple[bytes, ...]:
+    """Parse a Vary header into a sorted tuple of lower-case header names, ex: b"Accept, X-Tenant" -> (b"accept", ..)"""
+    names = {name.strip().lower() for name in (value or b"").split(b",")}
+    return tuple(sorted(name for name in names if name))
+
+
+def _allows_shared_caching(cache_control: dict) -> bool:
+    """Whether a response to a request with an Authorization header may be stored in a shared cache"""
+    return any(directive in cache_control for directive in ("public", "s-maxage", "must-revalidate"))
+
+
+def _parse_cache_control(value: Optional[bytes]) -> dict:
+    """Parse a Cache-Control header into a dict of directives, ex: b"max-age=60, private" -> {"max-age": "60", ...}"""
+    directives = {}
+    for directive in (value or b"").decode("latin-1").split(","):
+        name, _, directive_value = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = directive_value.strip('"')
+    return directives
+
+
+class ResponseCache:
+    """
+    A bounded, thread-safe LRU cache of responses, with an optional shared tier in a Django cache (such as Redis)
+
+    Responses are kept in memory for at most max_ttl_seconds, even if they could still be revalidated, and the least
+    recently used responses are evicted once max_entries is reached.  When shared_cache_alias is set, responses are also
+    written to that cache, so other processes can use them, and local misses are checked against it.  Responses with
+    Cache-Control: private, and responses to requests with an Authorization header that don't allow shared caching, are
+    only kept in memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_ttl_seconds: float = DEFAULT_MAX_TTL_SECONDS,
+        default_ttl_seconds: float = 0,
+        shared_cache_alias: str = None,
+    ):
+        self.max_entries = max_entries
+        self.max_ttl_seconds = max_ttl_seconds
+        self.default_ttl_seconds = default_ttl_seconds
+        self._shared_cache_alias = shared_cache_alias
+        self._entries = OrderedDict()
+        self._vary_by_url = OrderedDict()  # the header names each url's responses vary on, from the last one cached
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_key(self, url_key: str, request_headers: List[Tuple[bytes, bytes]], vary: Tuple[bytes, ...] = None) -> str:
+        """
+        Get the cache key for a request, including the values of any request headers its url's responses vary on
+
+        Which headers a url varies on is only known from its responses, so the names given in vary (from a response
+        about to be cached) are remembered, and used for the url's later requests.
+        """
+        with self._lock:
+            if vary is None:
+                vary = self._vary_by_url.get(url_key, ())
+            elif vary:
+                self._vary_by_url[url_key] = vary
+                self._vary_by_url.move_to_end(url_key)
+                while len(self._vary_by_url) > self.max_entries:
+                    self._vary_by_url.popitem(last=False)
+            else:
+                self._vary_by_url.pop(url_key, None)
+
+        if not vary:
+            return url_key
+        values = b";".join(name + b"=" + (_get_header(request_headers, name) or b"") for name in vary)
+        return f"{url_key}|{values.decode('latin-1')}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._get_local(key)
+        if entry is None:
+            entry = self._get_shared(key)
+            if entry is not None:
+                self._set_local(key, entry)
+        return entry
+
+    def set(self, key: str, entry: CachedResponse):
+        self._set_local(key, entry)
+        if not entry.is_private:
+            self._set_shared(key, entry)
+
+    async def aget(self, key: str) -> Optional[CachedResponse]:
+        """The async version of get, which reads the shared tier on a thread, so a slow cache doesn't block the loop"""
+        entry = self._get_local(key)
+        if entry is None and self._shared_cache_alias:
+            entry = await asyncio.get_running_loop().run_in_executor(None, self._get_shared, key)
+            if entry is not None:
+                self._set_local(key, entry)
+        return entry
+
+    async def aset(self, key: str, entry: CachedResponse):
+        """The async version of set, which writes the shared tier on a thread"""
+        self._set_local(key, entry)
+        if self._shared_cache_alias and not entry.is_private:
+            await asyncio.get_running_loop().run_in_executor(None, self._set_shared, key, entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vary_by_url.clear()
+
+    def build_entry(
+        self, status_code: int, headers: List[Tuple[bytes, bytes]], content: bytes, is_authorized: bool = False
+    ):
+        """
+        Create a cache entry for a response, or return None if the response should not be cached
+
+        :param is_authorized: if the request had an Authorization header, in which case the response is only kept in
+            memory, unless it allows shared caching with public, s-maxage or must-revalidate (RFC 7234, section 3.2)
+        """
+        if status_code not in _cacheable_status_codes:
+            return None
+
+        cache_control = _parse_cache_control(_get_header(headers, b"cache-control"))
+        # a response that varies on everything can never be matched to a later request
+        vary = _parse_vary(_get_header(headers, b"vary"))
+        if "no-store" in cache_control or b"*" in vary:
+            return None
+        if "no-cache" in cache_control:
+            ttl_seconds = 0
+        elif "max-age" in cache_control:
+            try:
+                ttl_seconds = int(cache_control["max-age"])
+            except ValueError:
+                ttl_seconds = 0
+        else:
+            ttl_seconds = self.default_ttl_seconds
+
+        # a response that isn't fresh, and can't be revalidated, is of no use
+        etag = _get_header(headers, b"etag")
+        last_modified = _get_header(headers, b"last-modified")
+        if ttl_seconds <= 0 and not (etag or last_modified):
+            return None
+
+        now = time()
+        return CachedResponse(
+            status_code=status_code,
+            headers=headers,
+            content=content,
+            fresh_until=now + min(ttl_seconds, self.max_ttl_seconds),
+            expires_at=now + self.max_ttl_seconds,
+            etag=etag,
+            last_modified=last_modified,
+            vary=vary,
+            is_private="private" in cache_control or (is_authorized and not _allows_shared_caching(cache_control)),
+        )
+
+    def build_refreshed_entry(
+        self, entry: CachedResponse, not_modified_headers: List[Tuple[bytes, bytes]]
+    ) -> Optional[CachedResponse]:
+        """Build an entry with updated freshness, after the server confirmed it was not modified"""
+        refreshed_entry = self.build_entry(entry.status_code, not_modified_headers, entry.content)
+        if refreshed_entry is None:
+            return None
+        # a 304 doesn't need to repeat the validators or Vary, so keep the original ones if they weren't sent
+        refreshed_entry.headers = entry.headers
+        refreshed_entry.etag = refreshed_entry.etag or entry.etag
+        refreshed_entry.last_modified = refreshed_entry.last_modified or entry.last_modified
+        refreshed_entry.vary = refreshed_entry.vary or entry.vary
+        refreshed_entry.is_private = refreshed_entry.is_private or entry.is_private
+        return refreshed_entry
+
+    def _get_local(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if time() < entry.expires_at:
+                    self._entries.move_to_end(key)
+                    return entry
+                del self._entries[key]
+        return None
+
+    def _set_local(self, key: str, entry: CachedResponse):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _get_shared(self, key: str) -> Optional[CachedResponse]:
+        if not self._shared_cache_alias:
+            return None
+        try:
+            return caches[self._shared_cache_alias].get(f"http_cache:{key}")
+        except Exception:
+            # the shared cache is only an optimization, so never fail a request because it is unavailable
+            _logger.warning("Failed to read from the shared HTTP cache", exc_info=True)
+            return None
+
+    def _set_shared(self, key: str, entry: CachedResponse):
+        if not self._shared_cache_alias:
+            return
+        timeout = max(int(entry.expires_at - time()), 1)
+        try:
+            caches[self._shared_cache_alias].set(f"http_cache:{key}", entry, timeout=timeout)
+        except Exception:
+            _logger.warning("Failed to write to the shared HTTP cache", exc_info=True)
+
+
+class _CachingTransportMixin:
+    """Logic shared by the sync and async caching transports, which only differ in how they call the next transport"""
+
+    def __init__(self, transport, response_cache: ResponseCache):
+        self._transport = transport
+        self.cache = response_cache
+
+    @staticmethod
+    def _get_url_key(url) -> str:
+        scheme, host, port, path = url
+        return f"{scheme.decode()}://{host.decode()}:{port or ''}{path.decode()}"
+
+    @staticmethod
+    def _should_bypass(method: bytes, headers: List[Tuple[bytes, bytes]]) -> bool:
+        if method != b"GET":
+            return True
+        cache_control = _parse_cache_control(_get_header(headers, b"cache-control"))
+        return "no-cache" in cache_control or "no-store" in cache_control
+
+    @staticmethod
+    def _add_conditional_headers(headers: List[Tuple[bytes, bytes]], entry: CachedResponse):
+        headers = list(headers)
+        if entry.etag:
+            headers.append((b"if-none-match", entry.etag))
+        if entry.last_modified:
+            headers.append((b"if-modified-since", entry.last_modified))
+        return headers
+
+    @staticmethod
+    def _cached_response(entry: CachedResponse):
+        """A response served from the cache, without reaching the upstream"""
+        return entry.status_code, entry.headers, httpx.ByteStream(entry.content), {"from_cache": True}
+
+    @staticmethod
+    def _revalidated_response(entry: CachedResponse, extensions: dict):
+        """A cached body returned for a 304, which is still a round trip to the upstream, so it isn't from_cache"""
+        extensions = {**extensions, "revalidated": True}
+        return entry.status_code, entry.headers, httpx.ByteStream(entry.content), extensions
+
+    @staticmethod
+    def _record_metric(name: str, url):
+        statsd.increment(f"http.cache.{name}", tags=[f"endpoint:{url[1].decode()}"])
+
+
+class CachingTransport(_CachingTransportMixin, httpx.BaseTransport):
+    """
+    A transport that caches GET responses, honoring Cache-Control, ETag and Last-Modified headers
+
+    Fresh responses are returned without a network call.  Stale responses with an ETag or Last-Modified header are
+    revalidated with a conditional request, and a 304 response returns the cached body.  Counts of each are emitted as
+    http.cache.hit, http.cache.miss and http.cache.revalidated.  Responses are cached separately for each value of the
+    request headers named in their Vary header, and responses with Vary: * are not cached.
+    """
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        if self._should_bypass(method, headers):
+            return self._transport.handle_request(method, url, headers, stream, extensions)
+
+        url_key = self._get_url_key(url)
+        key = self.cache.get_key(url_key, headers)
+        entry = self.cache.get(key)
+        if entry is not None and entry.is_fresh:
+            self._record_metric("hit", url)
+            return self._cached_response(entry)
+
+        request_headers = self._add_conditional_headers(headers, entry) if entry and entry.can_revalidate else headers
+        status_code, response_headers, response_stream, response_extensions = self._transport.handle_request(
+            method, url, request_headers, stream, extensions
+        )
+
+        if entry is not None and status_code == 304:
+            response_stream.close()
+            self._record_metric("revalidated", url)
+            refreshed_entry = self.cache.build_refreshed_entry(entry, response_headers)
+            if refreshed_entry is not None:
+                self.cache.set(key, refreshed_entry)
+            return self._revalidated_response(entry, response_extensions)
+
+        self._record_metric("miss", url)
+        try:
+            content = b"".join(response_stream)
+        finally:
+            response_stream.close()
+        new_entry = self.cache.build_entry(
+            status_code, response_headers, content, is_authorized=_get_header(headers, b"authorization") is not None
+        )
+        if new_entry is not None:
+            self.cache.set(self.cache.get_key(url_key, headers, new_entry.vary), new_entry)
+        return status_code, response_headers, httpx.ByteStream(content), response_extensions
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncCachingTransport(_CachingTransportMixin, httpx.AsyncBaseTransport):
+    """The async version of CachingTransport, which reads and writes the shared tier without blocking the event loop"""
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        if self._should_bypass(method, headers):
+            return await self._transport.handle_async_request(method, url, headers, stream, extensions)
+
+        url_key = self._get_url_key(url)
+        key = self.cache.get_key(url_key, headers)
+        entry = await self.cache.aget(key)
+        if entry is not None and entry.is_fresh:
+            self._record_metric("hit", url)
+            return self._cached_response(entry)
+
+        request_headers = self._add_conditional_headers(headers, entry) if entry and entry.can_revalidate else headers
+        (
+            status_code,
+            response_headers,
+            response_stream,
+            response_extensions,
+        ) = await self._transport.handle_async_request(method, url, request_headers, stream, extensions)
+
+        if entry is not None and status_code == 304:
+            await response_stream.aclose()
+            self._record_metric("revalidated", url)
+            refreshed_entry = self.cache.build_refreshed_entry(entry, response_headers)
+            if refreshed_entry is not None:
+                await self.cache.aset(key, refreshed_entry)
+            return self._revalidated_response(entry, response_extensions)
+
+        self._record_metric("miss", url)
+        try:
+            content = b"".join([chunk async for chunk in response_stream])
+        finally:
+            await response_stream.aclose()
+        new_entry = self.cache.build_entry(
+            status_code, response_headers, content, is_authorized=_get_header(headers, b"authorization") is not None
+        )
+        if new_entry is not None:
+            await self.cache.aset(self.cache.get_key(url_key, headers, new_entry.vary), new_entry)
+        return status_code, response_headers, httpx.ByteStream(content), response_extensions
+
+    async def aclose(self):
+        await self._transport.aclose()
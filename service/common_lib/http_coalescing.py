@@ -0,0 +1,194 @@
+"""Coalesces concurrent identical idempotent requests into a single in-flight upstream call"""
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import httpx
+
+from common_lib.deadline import get_remaining_seconds
+from common_lib.metrics import statsd
+
+_coalesced_methods = {b"GET", b"HEAD"}
+# headers that differ for every request, but don't change the response, so are left out of the request key
+_per_request_headers = {b"blink-correlation-id", b"blink-deadline-ms"}
+
+
+@dataclass
+class _SharedResponse:
+    status_code: int
+    headers: List[Tuple[bytes, bytes]]
+    content: bytes
+    extensions: dict
+
+    def to_transport_response(self):
+        return self.status_code, self.headers, httpx.ByteStream(self.content), dict(self.extensions)
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[_SharedResponse] = None
+        self.error: Optional[BaseException] = None
+
+
+def _get_key(method: bytes, url, headers: List[Tuple[bytes, bytes]]):
+    """Requests with the same method, url and headers (besides per-request ones) are considered identical"""
+    request_headers = tuple(sorted((name.lower(), value) for name, value in headers))
+    return method, url, tuple(header for header in request_headers if header[0] not in _per_request_headers)
+
+
+def _get_wait_timeout(extensions: dict) -> Optional[float]:
+    """
+    Get how long to wait for another request's response, as if waiting for this request's own response
+
+    This is the request's read timeout, limited to the time left until the current deadline, or None to wait forever.
+    """
+    timeouts = [extensions.get("timeout", {}).get("read"), get_remaining_seconds()]
+    timeouts = [timeout for timeout in timeouts if timeout is not None]
+    return max(min(timeouts), 0) if timeouts else None
+
+
+def _wait_timeout_error(url) -> httpx.ReadTimeout:
+    return httpx.ReadTimeout(f"Timed out waiting for a coalesced request to {url[1].decode()}{url[3].decode()}")
+
+
+def _record_coalesced(url):
+    statsd.increment("http.request.coalesced", tags=[f"endpoint:{url[1].decode()}"])
+
+
+class SingleFlight:
+    """
+    A thread-safe group of in-flight calls, so the first caller for a key makes the call and later ones wait for it
+
+    This is shared by every sync client for an endpoint, so identical requests are coalesced across threads.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, timeout: float = None) -> Tuple[_SharedResponse, bool]:
+        """
+        Call func, unless a call with the same key is already in flight, in which case wait for its result
+
+        :param timeout: the max seconds to wait for another caller's call, before raising TimeoutError
+        :return: a tuple of (result, was_shared), where was_shared is True if another caller made the call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+
+        if not is_leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError()
+            if call.error is not None:
+                raise call.error
+            return call.response, True
+
+        try:
+            call.response = func()
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.response, False
+
+
+class CoalescingTransport(httpx.BaseTransport):
+    """
+    A transport that shares one upstream call between concurrent identical GET/HEAD requests, from any thread
+
+    The response body is read in full, so every waiter gets its own copy.  Each request that reused another's call is
+    counted with the http.request.coalesced metric.  A request waiting on another's call still honors its own read
+    timeout and deadline, raising httpx.ReadTimeout if the call takes longer.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, single_flight: SingleFlight):
+        self._transport = transport
+        self._single_flight = single_flight
+
+    def _send(self, method, url, headers, stream, extensions) -> _SharedResponse:
+        status_code, response_headers, response_stream, response_extensions = self._transport.handle_request(
+            method, url, headers, stream, extensions
+        )
+        try:
+            content = b"".join(response_stream)
+        finally:
+            response_stream.close()
+        return _SharedResponse(status_code, response_headers, content, response_extensions)
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        if method not in _coalesced_methods:
+            return self._transport.handle_request(method, url, headers, stream, extensions)
+
+        try:
+            response, was_shared = self._single_flight.do(
+                _get_key(method, url, headers),
+                lambda: self._send(method, url, headers, stream, extensions),
+                timeout=_get_wait_timeout(extensions),
+            )
+        except TimeoutError:
+            raise _wait_timeout_error(url)
+        if was_shared:
+            _record_coalesced(url)
+        return response.to_transport_response()
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncCoalescingTransport(httpx.AsyncBaseTransport):
+    """
+    The async version of CoalescingTransport, which coalesces requests across tasks on the client's event loop
+
+    The upstream call runs in its own task, so if the task that started it is cancelled, the other waiters still get
+    the response.  As with sync requests, a waiter gives up after its own read timeout or deadline.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self._in_flight = {}
+
+    async def _send(self, method, url, headers, stream, extensions) -> _SharedResponse:
+        (
+            status_code,
+            response_headers,
+            response_stream,
+            response_extensions,
+        ) = await self._transport.handle_async_request(method, url, headers, stream, extensions)
+        try:
+            content = b"".join([chunk async for chunk in response_stream])
+        finally:
+            await response_stream.aclose()
+        return _SharedResponse(status_code, response_headers, content, response_extensions)
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        if method not in _coalesced_methods:
+            return await self._transport.handle_async_request(method, url, headers, stream, extensions)
+
+        key = _get_key(method, url, headers)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._send(method, url, headers, stream, extensions))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            response = await asyncio.shield(task)
+            return response.to_transport_response()
+
+        _record_coalesced(url)
+        try:
+            response = await asyncio.wait_for(asyncio.shield(task), _get_wait_timeout(extensions))
+        except asyncio.TimeoutError:
+            raise _wait_timeout_error(url)
+        return response.to_transport_response()
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,266 @@
+"""A registry of the endpoints in settings.HTTP_CLIENTS, validated and pre-processed once per process"""
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from importlib import import_module
+from typing import Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from common_lib.http_pool import get_pool_limits
+from common_lib.http_recording import Recordings
+
+_logger = logging.getLogger(__name__)
+_default_timeout_seconds = 5.0
+_default_limits = {"max_connections": 100, "max_keepalive_connections": 20}
+
+# the options allowed for each endpoint, with the keys allowed when the option is a dict (None if it can't be a dict)
+_endpoint_options = {
+    "root_url": None,
+    "auth": {"username", "password"},
+    "default_timeout_seconds": None,
+    "num_retries": None,
+    "log_body": None,
+    "log_body_sample_rate": None,
+    "log_streamed_body": None,
+    "mocked_transport": {"path", "name"},
+    "record": {"path"},
+    "replay": {"path", "latency_ms", "jitter_ms"},
+    "timeouts": {"connect", "read", "write", "pool"},
+    "http2": None,
+    "limits": {"max_connections", "max_keepalive_connections", "keepalive_expiry"},
+    "shared_pool": {"max_connections", "max_keepalive_connections", "keepalive_expiry"},
+    "cache": {"max_entries", "max_ttl_seconds", "default_ttl_seconds", "shared_cache_alias"},
+    "coalesce_requests": None,
+    "clamp_to_deadline": None,
+    "phase_timings": None,
+    "routes": None,
+    "circuit_breaker": {"failure_threshold", "recovery_timeout_seconds", "half_open_max_calls"},
+    "retries": {
+        "max_retries",
+        "backoff_base_seconds",
+        "backoff_max_seconds",
+        "retry_statuses",
+        "budget_ratio",
+        "min_retries_per_second",
+    },
+}
+# endpoint options that require building a custom transport
+_transport_options = {
+    "num_retries",
+    "http2",
+    "limits",
+    "shared_pool",
+    "cache",
+    "coalesce_requests",
+    "record",
+    "clamp_to_deadline",
+    "phase_timings",
+    "circuit_breaker",
+    "retries",
+}
+# path segments that are likely to be ids, which are replaced by {id} in routes, to keep metric tags low-cardinality
+_id_segment_regex = re.compile(r".*\d.*|[0-9a-fA-F-]{16,}")
+# path segments with digits that are part of the api, rather than ids, such as versions (v2, v1.1) or oauth2
+_fixed_segment_regex = re.compile(r"v\d+(\.\d+)*|[a-zA-Z]+\d")
+_template_param_regex = re.compile(r"{\w+}")
+_unmatched_route = "other"
+
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    """The pre-processed settings for an endpoint, so building each thread's client doesn't need to re-process them"""
+
+    name: str
+    options: dict
+    base_url: Optional[str] = None
+    auth: Optional[Tuple[str, str]] = None
+    timeout: Optional[httpx.Timeout] = None
+    limits: httpx.Limits = None
+    mocked_router: object = None
+    replay_recordings: Optional[Recordings] = None
+    request_log_kwargs: dict = field(default_factory=dict)
+    response_log_kwargs: dict = field(default_factory=dict)
+    base_path: str = ""
+    base_path_segments: FrozenSet[str] = frozenset()
+    route_patterns: Tuple[Tuple[str, Pattern], ...] = ()
+
+    @property
+    def uses_custom_transport(self) -> bool:
+        return any(self.options.get(option) for option in _transport_options)
+
+    def get_route(self, path: str) -> str:
+        """
+        Get the route template for a request path, relative to the endpoint's root_url, for use as a metric tag
+
+        If the endpoint has 'routes', the first template that matches is used, or "other" if none do.  Otherwise, any
+        path segments that look like ids (containing a digit, or long hex strings) are replaced with {id}, except for
+        segments of the root_url's path and versions such as v2 or oauth2.  Ids without digits, such as slugs, can't be
+        told apart from the rest of the path, so endpoints that use them need 'routes'.
+        """
+        if path == self.base_path or path.startswith(self.base_path + "/"):
+            path = path[len(self.base_path) :] or "/"
+        if self.route_patterns:
+            return next((route for route, pattern in self.route_patterns if pattern.match(path)), _unmatched_route)
+        return "/".join(segment if self._is_fixed_segment(segment) else "{id}" for segment in path.split("/"))
+
+    def _is_fixed_segment(self, segment: str) -> bool:
+        return (
+            segment in self.base_path_segments
+            or _fixed_segment_regex.fullmatch(segment) is not None
+            or _id_segment_regex.fullmatch(segment) is None
+        )
+
+
+def _get_timeout(settings_config: dict) -> httpx.Timeout:
+    """Build the timeout for an endpoint, where any specific 'timeouts' override default_timeout_seconds"""
+    timeouts = settings_config.get("timeouts") or {}
+    return httpx.Timeout(settings_config.get("default_timeout_seconds", _default_timeout_seconds), **timeouts)
+
+
+def _get_limits(settings_config: dict) -> httpx.Limits:
+    """Build the connection pool limits for an endpoint, using the shared pool's defaults if it has one"""
+    limits = settings_config.get("limits") or {}
+    if settings_config.get("shared_pool"):
+        return get_pool_limits(settings_config["shared_pool"], limits)
+    return httpx.Limits(**{**_default_limits, **limits})
+
+
+def _get_route_pattern(route: str) -> Pattern:
+    """Convert a route template, such as /{foo_id}/bars/, to a regex matching any value in place of each {param}"""
+    parts = _template_param_regex.split(route)
+    return re.compile("[^/]+".join(re.escape(part) for part in parts) + "$")
+
+
+def _validate_endpoint(name: str, settings_config) -> List[str]:
+    """Check an endpoint's settings, returning a description of each problem found"""
+    if not isinstance(settings_config, dict):
+        return [f"{name}: must be a dict of options"]
+
+    errors = []
+    for option, value in settings_config.items():
+        if option not in _endpoint_options:
+            errors.append(f"{name}: unknown option '{option}'")
+        elif isinstance(value, dict):
+            allowed_keys = _endpoint_options[option]
+            if allowed_keys is None:
+                errors.append(f"{name}: '{option}' can't be a dict")
+            else:
+                errors.extend(f"{name}: unknown key '{key}' in '{option}'" for key in value.keys() - allowed_keys)
+
+    root_url = settings_config.get("root_url")
+    if root_url and not root_url.startswith(("http://", "https://")):
+        errors.append(f"{name}: root_url must start with http:// or https://")
+    routes = settings_config.get("routes") or []
+    if not isinstance(routes, (list, tuple)) or not all(
+        isinstance(route, str) and route[:1] == "/" for route in routes
+    ):
+        errors.append(f"{name}: routes must be a list of paths starting with /")
+    sample_rate = settings_config.get("log_body_sample_rate")
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        errors.append(f"{name}: log_body_sample_rate must be between 0 and 1")
+    return errors
+
+
+def _build_endpoint(name: str, settings_config: dict) -> EndpointConfig:
+    mocked_router = None
+    if settings_config.get("mocked_transport"):
+        mocked_config = settings_config["mocked_transport"]
+        mocked_router = getattr(import_module(mocked_config["path"]), mocked_config["name"])
+
+    replay_recordings = None
+    if settings_config.get("replay"):
+        replay_recordings = Recordings(settings_config["replay"]["path"])
+
+    auth = None
+    if "auth" in settings_config:
+        auth = (settings_config["auth"]["username"], settings_config["auth"]["password"])
+
+    timeout = None
+    if "default_timeout_seconds" in settings_config or "timeouts" in settings_config:
+        timeout = _get_timeout(settings_config)
+
+    log_body = settings_config.get("log_body", True)
+    log_streamed_body = settings_config.get("log_streamed_body", False)
+    base_path = httpx.URL(settings_config.get("root_url") or "").path.rstrip("/")
+    return EndpointConfig(
+        name=name,
+        options=settings_config,
+        base_url=settings_config.get("root_url"),
+        auth=auth,
+        timeout=timeout,
+        limits=_get_limits(settings_config),
+        mocked_router=mocked_router,
+        replay_recordings=replay_recordings,
+        request_log_kwargs={
+            "log_body": log_body,
+            "log_body_sample_rate": settings_config.get("log_body_sample_rate"),
+            "log_streamed_body": log_streamed_body,
+        },
+        response_log_kwargs={"log_body": log_body, "log_streamed_body": log_streamed_body},
+        base_path=base_path,
+        base_path_segments=frozenset(segment for segment in base_path.split("/") if segment),
+        route_patterns=tuple((route, _get_route_pattern(route)) for route in settings_config.get("routes") or []),
+    )
+
+
+class EndpointRegistry:
+    """
+    The validated, pre-processed config for every endpoint in settings.HTTP_CLIENTS
+
+    It is loaded once per process, either explicitly at startup (so invalid settings fail the deploy, rather than the
+    first request), or on first use.  It is reset if HTTP_CLIENTS is changed, such as by override_settings in tests.
+    """
+
+    def __init__(self):
+        self._endpoints: Optional[Dict[str, EndpointConfig]] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, EndpointConfig]:
+        """Validate and build every endpoint, raising ImproperlyConfigured with all the problems found"""
+        with self._lock:
+            if self._endpoints is None:
+                self._endpoints = self._build_all()
+        return self._endpoints
+
+    def get(self, name: str) -> EndpointConfig:
+        endpoints = self._endpoints if self._endpoints is not None else self.load()
+        if name not in endpoints:
+            raise ImproperlyConfigured(f"No endpoint named '{name}' in settings.HTTP_CLIENTS")
+        return endpoints[name]
+
+    def clear(self):
+        with self._lock:
+            self._endpoints = None
+
+    @staticmethod
+    def _build_all() -> Dict[str, EndpointConfig]:
+        endpoint_settings = settings.HTTP_CLIENTS.get("endpoints", {})
+        errors = [error for name, config in endpoint_settings.items() for error in _validate_endpoint(name, config)]
+
+        endpoints = {}
+        for name, settings_config in endpoint_settings.items():
+            if any(error.startswith(f"{name}:") for error in errors):
+                continue
+            try:
+                endpoints[name] = _build_endpoint(name, settings_config)
+            except Exception as ex:
+                errors.append(f"{name}: {ex!r}")
+
+        if errors:
+            raise ImproperlyConfigured("Invalid settings.HTTP_CLIENTS:\n" + "\n".join(errors))
+        return endpoints
+
+
+endpoint_registry = EndpointRegistry()
+
+
+@receiver(setting_changed)
+def _reset_endpoint_registry(setting, **kwargs):
+    if setting == "HTTP_CLIENTS":
+        endpoint_registry.clear()
@@ -0,0 +1,122 @@
+"""A process-wide, metered connection pool for sync HTTPX clients"""
+import threading
+from time import time
+
+import httpx
+
+from common_lib.http_timing import get_timings
+from common_lib.metrics import statsd
+
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_EXPIRY = 5.0
+
+
+class _PooledResponseStream(httpx.SyncByteStream):
+    """Wraps a response stream, so the pool slot is only released once the response has been read and closed"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class SharedPoolTransport(httpx.BaseTransport):
+    """
+    A thread-safe transport, meant to be shared by every thread in the process, that limits and meters pool usage
+
+    HTTPX already pools connections within a transport, but it gives no visibility into how full the pool is, or how
+    long requests wait for a connection.  This gates in-flight requests with a semaphore sized to the pool's
+    max_connections, so the underlying pool never has to block, and the time spent waiting on the semaphore is the true
+    pool wait time.  That only holds for HTTP/1.1, where each in-flight request has a connection to itself, so this
+    shouldn't be used for HTTP/2 endpoints, which multiplex many requests over each connection.
+
+    Every request emits two gauges, tagged with the client name:
+    * http.pool.in_use: the number of in-flight requests, and so connections in use, once the request acquired one
+    * http.pool.wait_time: milliseconds the request waited for a free connection, which is also added to the
+        response's timings extension as pool_wait
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, client_name: str, max_connections: int):
+        self._transport = transport
+        self._max_connections = max_connections
+        self._semaphore = threading.BoundedSemaphore(max_connections)
+        self._in_use = 0
+        self._in_use_lock = threading.Lock()
+        self._statsd_tags = [f"client:{client_name}"]
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    def _acquire(self, timeout: float = None) -> int:
+        start_time = time()
+        if not self._semaphore.acquire(timeout=timeout):
+            statsd.increment("http.pool.timeout", tags=self._statsd_tags)
+            raise httpx.PoolTimeout(f"Timed out waiting for one of {self._max_connections} pooled connections")
+        wait_time = round((time() - start_time) * 1000)
+
+        with self._in_use_lock:
+            self._in_use += 1
+            in_use = self._in_use
+        statsd.gauge("http.pool.in_use", in_use, tags=self._statsd_tags)
+        statsd.gauge("http.pool.wait_time", wait_time, tags=self._statsd_tags)
+        return wait_time
+
+    def _release(self):
+        with self._in_use_lock:
+            self._in_use -= 1
+        self._semaphore.release()
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        # a pool timeout of None means to wait forever, matching HTTPX
+        pool_timeout = extensions.get("timeout", {}).get("pool")
+        wait_time = self._acquire(pool_timeout)
+
+        try:
+            status_code, headers, response_stream, extensions = self._transport.handle_request(
+                method, url, headers, stream, extensions
+            )
+        except BaseException:
+            self._release()
+            raise
+
+        get_timings(extensions)["pool_wait"] = wait_time
+
+        # release the slot only once, no matter how many times the stream is closed
+        released = False
+
+        def release_once():
+            nonlocal released
+            if not released:
+                released = True
+                self._release()
+
+        return status_code, headers, _PooledResponseStream(response_stream, release_once), extensions
+
+    def close(self):
+        self._transport.close()
+
+
+def get_pool_limits(pool_config, limits: dict = None) -> httpx.Limits:
+    """
+    Build HTTPX limits for a shared pool
+
+    :param pool_config: the endpoint's 'shared_pool' config, which can be True to use the defaults, or a dict of limits
+    :param limits: the endpoint's general 'limits' config, overridden by any limits set in pool_config
+    """
+    limits = {**(limits or {}), **(pool_config if isinstance(pool_config, dict) else {})}
+    return httpx.Limits(
+        max_connections=limits.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=limits.get("max_keepalive_connections", DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+        keepalive_expiry=limits.get("keepalive_expiry", DEFAULT_KEEPALIVE_EXPIRY),
+    )
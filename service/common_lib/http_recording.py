@@ -0,0 +1,176 @@
+"""Record real HTTP responses to a JSON lines file, and replay them, for deterministic offline benchmarks"""
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import httpx
+
+
+class ReplayMissError(httpx.TransportError):
+    """Raised when replaying, for a request that has no recorded response"""
+
+
+def _get_key(method: bytes, url) -> Tuple[str, str]:
+    scheme, host, port, target = url
+    port_part = f":{port}" if port else ""
+    return method.decode(), f"{scheme.decode()}://{host.decode()}{port_part}{target.decode()}"
+
+
+def _to_record(method: bytes, url, status_code: int, headers: List[Tuple[bytes, bytes]], content: bytes) -> dict:
+    record_method, record_url = _get_key(method, url)
+    record = {
+        "method": record_method,
+        "url": record_url,
+        "status_code": status_code,
+        "headers": [[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+    }
+    try:
+        record["body"] = content.decode("utf-8")
+    except UnicodeDecodeError:
+        record["body_base64"] = base64.b64encode(content).decode("ascii")
+    return record
+
+
+class _RecordedResponse:
+    def __init__(self, record: dict):
+        self.status_code = record["status_code"]
+        self.headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in record["headers"]]
+        if "body_base64" in record:
+            self.content = base64.b64decode(record["body_base64"])
+        else:
+            self.content = record.get("body", "").encode("utf-8")
+
+    def to_transport_response(self):
+        return self.status_code, list(self.headers), httpx.ByteStream(self.content), {}
+
+
+class Recordings:
+    """
+    The responses recorded for each method and url, loaded from a JSON lines file
+
+    When a request was recorded more than once, its responses are replayed in order, starting over after the last one.
+    """
+
+    def __init__(self, path: str):
+        responses: Dict[Tuple[str, str], List[_RecordedResponse]] = defaultdict(list)
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    responses[(record["method"], record["url"])].append(_RecordedResponse(record))
+        self._responses = dict(responses)
+        self._next_index = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(responses) for responses in self._responses.values())
+
+    def get_response(self, method: bytes, url) -> _RecordedResponse:
+        key = _get_key(method, url)
+        responses = self._responses.get(key)
+        if not responses:
+            raise ReplayMissError(f"No recorded response for {key[0]} {key[1]}")
+        with self._lock:
+            index = self._next_index[key]
+            self._next_index[key] = (index + 1) % len(responses)
+        return responses[index]
+
+
+class _ReplayTransportMixin:
+    def __init__(self, recordings: Recordings, latency_ms: float = 0, jitter_ms: float = 0):
+        self._recordings = recordings
+        self._latency_ms = latency_ms
+        self._jitter_ms = jitter_ms
+
+    def _get_delay(self) -> float:
+        return (self._latency_ms + random.uniform(0, self._jitter_ms)) / 1000
+
+
+class ReplayTransport(_ReplayTransportMixin, httpx.BaseTransport):
+    """
+    A transport that responds with recorded responses, after an injected latency, instead of using the network
+
+    The latency is latency_ms, plus a random 0 to jitter_ms, to simulate an upstream's response time.
+    """
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        response = self._recordings.get_response(method, url)
+        delay = self._get_delay()
+        if delay:
+            time.sleep(delay)
+        return response.to_transport_response()
+
+
+class AsyncReplayTransport(_ReplayTransportMixin, httpx.AsyncBaseTransport):
+    """The async version of ReplayTransport"""
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        response = self._recordings.get_response(method, url)
+        delay = self._get_delay()
+        if delay:
+            await asyncio.sleep(delay)
+        return response.to_transport_response()
+
+
+class _RecordingTransportMixin:
+    # every client for an endpoint appends to the same file, so writes are serialized across threads
+    _write_lock = threading.Lock()
+
+    def __init__(self, transport, path: str):
+        self._transport = transport
+        self._path = path
+
+    def _write(self, record: dict):
+        line = json.dumps(record) + "\n"
+        with self._write_lock:
+            with open(self._path, "a", encoding="utf-8") as file:
+                file.write(line)
+
+
+class RecordingTransport(_RecordingTransportMixin, httpx.BaseTransport):
+    """
+    A transport that appends every response it receives to a JSON lines file, for ReplayTransport to replay later
+
+    Only the method, url, response status, response headers and response body are recorded.  Request headers are not,
+    so credentials aren't written to the file.  Each response body is read in full, so it can be recorded.
+    """
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        status_code, response_headers, response_stream, response_extensions = self._transport.handle_request(
+            method, url, headers, stream, extensions
+        )
+        try:
+            content = b"".join(response_stream)
+        finally:
+            response_stream.close()
+        self._write(_to_record(method, url, status_code, response_headers, content))
+        return status_code, response_headers, httpx.ByteStream(content), response_extensions
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRecordingTransport(_RecordingTransportMixin, httpx.AsyncBaseTransport):
+    """The async version of RecordingTransport"""
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        (
+            status_code,
+            response_headers,
+            response_stream,
+            response_extensions,
+        ) = await self._transport.handle_async_request(method, url, headers, stream, extensions)
+        try:
+            content = b"".join([chunk async for chunk in response_stream])
+        finally:
+            await response_stream.aclose()
+        self._write(_to_record(method, url, status_code, response_headers, content))
+        return status_code, response_headers, httpx.ByteStream(content), response_extensions
+
+    async def aclose(self):
+        await self._transport.aclose()
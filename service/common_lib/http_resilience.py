@@ -0,0 +1,380 @@
+"""Circuit breaking and retries with backoff, used as a transport by HTTPX clients"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from enum import Enum
+from typing import Callable, Optional
+
+import httpx
+
+from common_lib.deadline import DeadlineExceededError, get_remaining_seconds
+from common_lib.enum_mixin import EnumMixin
+from common_lib.event import Event
+from common_lib.metrics import statsd
+
+_logger = logging.getLogger(__name__)
+_idempotent_methods = {b"GET", b"HEAD", b"OPTIONS", b"PUT", b"DELETE"}
+# errors where the request never reached the server, so even non-idempotent requests are safe to retry
+_not_sent_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitStates(EnumMixin, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitBreakerStateChangedEvent(Event):
+    event_name = "http.circuit_breaker.state_changed"
+    event_fields = ["client_name", "state", "previous_state", "failure_count"]
+    message = "Circuit breaker for {client_name} changed from {previous_state} to {state}"
+    log_level = logging.WARNING
+    emit_metric = True
+    metric_tags = ["client_name", "state"]
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised instead of making a request, when the circuit breaker for its endpoint is open"""
+
+
+class CircuitBreaker:
+    """
+    A thread-safe circuit breaker, shared by every client for an endpoint
+
+    * closed: requests are allowed.  After failure_threshold consecutive failures, the circuit opens.
+    * open: requests fail immediately with CircuitOpenError.  After recovery_timeout_seconds, the circuit half-opens.
+    * half_open: up to half_open_max_calls trial requests are allowed.  A success closes the circuit, and a failure
+        opens it again.  A trial that ends without an outcome (such as running out of time, or being cancelled) must
+        call release_trial, so another request can take its place.
+
+    Every state change is passed to on_state_change as a CircuitBreakerStateChangedEvent.
+    """
+
+    def __init__(
+        self,
+        client_name: str,
+        failure_threshold: int = 5,
+        recovery_timeout_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+        on_state_change: Callable[[Event], None] = None,
+    ):
+        self.client_name = client_name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout_seconds = recovery_timeout_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self._on_state_change = on_state_change
+        self._state = CircuitStates.closed
+        self._failure_count = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> CircuitStates:
+        return self._state
+
+    def _set_state(self, state: CircuitStates) -> Optional[Event]:
+        """Change the state, returning an event to record once the lock is released"""
+        previous_state = self._state
+        self._state = state
+        if state == CircuitStates.open:
+            self._opened_at = time.monotonic()
+        self._half_open_calls = 0
+        return CircuitBreakerStateChangedEvent(
+            self.client_name, state.value, previous_state.value, failure_count=self._failure_count
+        )
+
+    def _notify(self, event: Optional[Event]):
+        if event and self._on_state_change:
+            try:
+                self._on_state_change(event)
+            except Exception:
+                _logger.exception("Failed to record circuit breaker state change", extra={"event": repr(event)})
+
+    def allow_request(self) -> bool:
+        return self.try_acquire() is not None
+
+    def try_acquire(self) -> Optional[bool]:
+        """Check if a request is allowed, returning None if it isn't, or whether it's a half-open trial if it is"""
+        event = None
+        with self._lock:
+            if self._state == CircuitStates.open:
+                if time.monotonic() - self._opened_at < self.recovery_timeout_seconds:
+                    return None
+                event = self._set_state(CircuitStates.half_open)
+
+            if self._state == CircuitStates.half_open:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    is_trial = None
+                else:
+                    self._half_open_calls += 1
+                    is_trial = True
+            else:
+                is_trial = False
+
+        self._notify(event)
+        return is_trial
+
+    def release_trial(self):
+        """Free the slot of a half-open trial that ended without a success or failure"""
+        with self._lock:
+            # the state may have changed since the trial started, which already freed its slot
+            if self._state == CircuitStates.half_open and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        event = None
+        with self._lock:
+            self._failure_count = 0
+            if self._state != CircuitStates.closed:
+                event = self._set_state(CircuitStates.closed)
+        self._notify(event)
+
+    def record_failure(self):
+        event = None
+        with self._lock:
+            self._failure_count += 1
+            if self._state == CircuitStates.half_open or (
+                self._state == CircuitStates.closed and self._failure_count >= self.failure_threshold
+            ):
+                event = self._set_state(CircuitStates.open)
+        self._notify(event)
+
+
+class RetryBudget:
+    """
+    Limits retries to a ratio of requests, so retries can't multiply the load on an upstream that is already failing
+
+    Each request deposits `ratio` tokens, and each retry withdraws one, so with a ratio of 0.2, at most 1 in 5 requests
+    is retried.  min_retries_per_second tokens are also added over time, so low-traffic clients can still retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries_per_second: float = 1.0, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, tokens: float):
+        now = time.monotonic()
+        tokens += (now - self._last_refill) * self.min_retries_per_second
+        self._tokens = min(self.max_tokens, self._tokens + tokens)
+        self._last_refill = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            self._refill(0)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    Decides which requests to retry, and how long to wait before each retry
+
+    Delays use exponential backoff with full jitter: a random time between 0 and
+    min(backoff_max_seconds, backoff_base_seconds * 2^attempt), unless the server sent a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        backoff_base_seconds: float = 0.1,
+        backoff_max_seconds: float = 2.0,
+        retry_statuses=(429, 502, 503, 504),
+        budget: RetryBudget = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.retry_statuses = set(retry_statuses)
+        self.budget = budget or RetryBudget()
+
+    def should_retry(self, attempt: int, method: bytes, stream, status_code: int = None, error: Exception = None):
+        """Check if a failed attempt (0-based) should be retried, withdrawing from the retry budget if it should"""
+        if attempt >= self.max_retries:
+            return False
+        # a streamed request body may not be able to be sent again
+        if stream is not None and not isinstance(stream, httpx.ByteStream):
+            return False
+        if error is not None:
+            if not isinstance(error, httpx.TransportError) or isinstance(
+                error, (CircuitOpenError, DeadlineExceededError)
+            ):
+                return False
+            if method not in _idempotent_methods and not isinstance(error, _not_sent_errors):
+                return False
+        elif status_code not in self.retry_statuses or method not in _idempotent_methods:
+            return False
+        return self.budget.try_withdraw()
+
+    def get_delay(self, attempt: int, headers=None) -> float:
+        retry_after = _get_retry_after(headers)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_seconds)
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2**attempt))
+
+
+def _get_retry_after(headers) -> Optional[float]:
+    for name, value in headers or []:
+        if name.lower() == b"retry-after":
+            try:
+                return max(float(value), 0)
+            except ValueError:
+                return None  # an HTTP date, which isn't worth parsing for the short delays we allow
+    return None
+
+
+def _is_failure(status_code: int) -> bool:
+    return status_code >= 500
+
+
+class _ResilientTransportMixin:
+    def __init__(self, transport, client_name: str, circuit_breaker: CircuitBreaker = None, retry_policy=None):
+        self._transport = transport
+        self._circuit_breaker = circuit_breaker
+        self._retry_policy = retry_policy
+        self._statsd_tags = [f"client:{client_name}"]
+
+    def _check_circuit(self) -> bool:
+        """Raise CircuitOpenError if the request isn't allowed, or return whether it's a half-open trial"""
+        if not self._circuit_breaker:
+            return False
+        is_trial = self._circuit_breaker.try_acquire()
+        if is_trial is None:
+            statsd.increment("http.circuit_breaker.rejected", tags=self._statsd_tags)
+            raise CircuitOpenError(f"Circuit breaker is open for {self._circuit_breaker.client_name}")
+        return is_trial
+
+    def _release_trial(self, is_trial: bool):
+        if is_trial:
+            self._circuit_breaker.release_trial()
+
+    def _record_outcome(self, is_trial: bool, status_code: int = None, error: Exception = None):
+        if not self._circuit_breaker:
+            return
+        # running out of time for the work being done says nothing about the upstream's health
+        if isinstance(error, DeadlineExceededError):
+            self._release_trial(is_trial)
+            return
+        if error is not None or _is_failure(status_code):
+            self._circuit_breaker.record_failure()
+        else:
+            self._circuit_breaker.record_success()
+
+    def _get_retry_delay(self, attempt, method, stream, status_code=None, error=None, headers=None) -> Optional[float]:
+        """
+        Get how long to wait before retrying a failed attempt, or None if it shouldn't be retried
+
+        A retry isn't made if the deadline of the work being done would pass during the backoff, since it would only
+        fail, so the delay is never longer than the time remaining.
+        """
+        if not self._retry_policy:
+            return None
+        delay = self._retry_policy.get_delay(attempt, headers)
+        remaining = get_remaining_seconds()
+        if remaining is not None and remaining <= delay:
+            return None
+        if not self._retry_policy.should_retry(attempt, method, stream, status_code, error):
+            return None
+        statsd.increment("http.request.retry", tags=self._statsd_tags)
+        return delay
+
+
+class ResilientTransport(_ResilientTransportMixin, httpx.BaseTransport):
+    """
+    A transport that fails fast while an endpoint's circuit breaker is open, and retries failed requests
+
+    Connection errors and 5xx responses count as circuit breaker failures.  Retries follow the RetryPolicy, and each
+    one is counted with the http.request.retry metric.  The number of retries is added to the response's "retries"
+    extension.  Failures aren't retried once the backoff would outlast the deadline of the work being done.
+    """
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        if self._retry_policy:
+            self._retry_policy.budget.record_request()
+
+        attempt = 0
+        while True:
+            is_trial = self._check_circuit()
+            try:
+                status_code, response_headers, response_stream, response_extensions = self._transport.handle_request(
+                    method, url, headers, stream, extensions
+                )
+            except Exception as ex:
+                self._record_outcome(is_trial, error=ex)
+                delay = self._get_retry_delay(attempt, method, stream, error=ex)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+            except BaseException:
+                # cancelled or interrupted, so there's no outcome to record
+                self._release_trial(is_trial)
+                raise
+            else:
+                self._record_outcome(is_trial, status_code)
+                delay = self._get_retry_delay(
+                    attempt, method, stream, status_code=status_code, headers=response_headers
+                )
+                if delay is None:
+                    response_extensions["retries"] = attempt
+                    return status_code, response_headers, response_stream, response_extensions
+                response_stream.close()
+                time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncResilientTransport(_ResilientTransportMixin, httpx.AsyncBaseTransport):
+    """The async version of ResilientTransport"""
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        if self._retry_policy:
+            self._retry_policy.budget.record_request()
+
+        attempt = 0
+        while True:
+            is_trial = self._check_circuit()
+            try:
+                (
+                    status_code,
+                    response_headers,
+                    response_stream,
+                    response_extensions,
+                ) = await self._transport.handle_async_request(method, url, headers, stream, extensions)
+            except Exception as ex:
+                self._record_outcome(is_trial, error=ex)
+                delay = self._get_retry_delay(attempt, method, stream, error=ex)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            except BaseException:
+                # cancelled or interrupted, so there's no outcome to record
+                self._release_trial(is_trial)
+                raise
+            else:
+                self._record_outcome(is_trial, status_code)
+                delay = self._get_retry_delay(
+                    attempt, method, stream, status_code=status_code, headers=response_headers
+                )
+                if delay is None:
+                    response_extensions["retries"] = attempt
+                    return status_code, response_headers, response_stream, response_extensions
+                await response_stream.aclose()
+                await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,103 @@
+"""Incremental processing of streamed HTTP response bodies, so large payloads can be handled in constant memory"""
+import json
+from enum import Enum
+from typing import Any, Iterator
+
+from common_lib.enum_mixin import EnumMixin
+from common_lib.errors import BlinkParsingError
+
+_whitespace = " \t\n\r"
+
+
+class StreamModes(EnumMixin, Enum):
+    bytes = "bytes"  # raw chunks of the body, as they are received
+    lines = "lines"  # decoded lines of text, without line endings
+    json_items = "json_items"  # each item of a top-level JSON array, parsed as it is received
+
+
+class JsonArrayParser:
+    """
+    Parses the items of a top-level JSON array from chunks of text, without needing the whole array in memory
+
+    Only the text of the item currently being received is buffered, so memory use depends on the size of the largest
+    item, not the whole array.
+
+        parser = JsonArrayParser()
+        for chunk in response.iter_text():
+            for item in parser.feed(chunk):
+                ...
+        for item in parser.close():
+            ...
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._started = False
+        self._finished = False
+        self._expect_item = True
+        self._after_comma = False
+
+    def feed(self, text: str) -> Iterator[Any]:
+        """Add the next chunk of text, yielding every item that is now complete"""
+        self._buffer += text
+        yield from self._parse(is_final=False)
+
+    def close(self) -> Iterator[Any]:
+        """Signal the end of the text, yielding any last item, and raising BlinkParsingError if the array is incomplete"""
+        yield from self._parse(is_final=True)
+        if not self._finished:
+            raise BlinkParsingError("Streamed JSON array ended before it was complete")
+
+    def _parse(self, is_final: bool) -> Iterator[Any]:
+        index = 0
+        try:
+            while True:
+                index = self._skip_whitespace(index)
+                if index == len(self._buffer):
+                    break
+
+                if self._finished:
+                    raise BlinkParsingError("Unexpected data after the end of the streamed JSON array")
+                if not self._started:
+                    if self._buffer[index] != "[":
+                        raise BlinkParsingError("Streamed JSON is not an array")
+                    self._started = True
+                    index += 1
+                    continue
+                if self._buffer[index] == "]":
+                    if self._after_comma:
+                        raise BlinkParsingError("Trailing comma in the streamed JSON array")
+                    self._finished = True
+                    index += 1
+                    continue
+                if not self._expect_item:
+                    if self._buffer[index] != ",":
+                        raise BlinkParsingError("Expected a comma between items in the streamed JSON array")
+                    self._expect_item = True
+                    self._after_comma = True
+                    index += 1
+                    continue
+
+                try:
+                    item, end = self._decoder.raw_decode(self._buffer, index)
+                except json.JSONDecodeError:
+                    if is_final:
+                        raise BlinkParsingError("Invalid item in the streamed JSON array")
+                    break  # the item is incomplete, so wait for more text
+                # a number at the end of the buffer may continue in the next chunk
+                is_number = isinstance(item, (int, float)) and not isinstance(item, bool)
+                if is_number and end == len(self._buffer) and not is_final:
+                    break
+                self._expect_item = False
+                self._after_comma = False
+                index = end
+                yield item
+        finally:
+            # drop the parsed text, so the buffer only holds the incomplete item
+            self._buffer = self._buffer[index:]
+
+    def _skip_whitespace(self, index: int) -> int:
+        while index < len(self._buffer) and self._buffer[index] in _whitespace:
+            index += 1
+        return index
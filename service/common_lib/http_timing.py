@@ -0,0 +1,87 @@
+"""Per-phase timing of outbound requests, used as a transport by HTTPX clients"""
+from time import perf_counter
+
+import httpx
+
+
+def get_timings(extensions: dict) -> dict:
+    """Get the dict of phase timings (ms) for a response, from its extensions, which transports can add phases to"""
+    return extensions.setdefault("timings", {})
+
+
+def _elapsed_ms(start_time: float) -> float:
+    return round((perf_counter() - start_time) * 1000, 3)
+
+
+class _TimedResponseStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Wraps a response stream, to record how long the body took to read once it is closed"""
+
+    def __init__(self, stream, timings: dict):
+        self._stream = stream
+        self._timings = timings
+        self._start_time = perf_counter()
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    def close(self):
+        self._timings["body"] = _elapsed_ms(self._start_time)
+        self._stream.close()
+
+    async def aclose(self):
+        self._timings["body"] = _elapsed_ms(self._start_time)
+        await self._stream.aclose()
+
+
+class TimingTransport(httpx.BaseTransport):
+    """
+    A transport that records how long each phase of a request took, in the response's "timings" extension
+
+    * headers: from sending the request, including connecting if there was no pooled connection, until the response
+        headers were received (time to first byte)
+    * body: from receiving the headers until the body was read and closed
+
+    With retries, these are the timings of the last attempt.
+    """
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        start_time = perf_counter()
+        status_code, response_headers, response_stream, response_extensions = self._transport.handle_request(
+            method, url, headers, stream, extensions
+        )
+        timings = get_timings(response_extensions)
+        timings["headers"] = _elapsed_ms(start_time)
+        return status_code, response_headers, _TimedResponseStream(response_stream, timings), response_extensions
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncTimingTransport(httpx.AsyncBaseTransport):
+    """The async version of TimingTransport"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        start_time = perf_counter()
+        (
+            status_code,
+            response_headers,
+            response_stream,
+            response_extensions,
+        ) = await self._transport.handle_async_request(method, url, headers, stream, extensions)
+        timings = get_timings(response_extensions)
+        timings["headers"] = _elapsed_ms(start_time)
+        return status_code, response_headers, _TimedResponseStream(response_stream, timings), response_extensions
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,115 @@
+"""In-process latency histograms, with bounded memory and relative error, for finding tail latency on demand"""
+import threading
+from typing import Dict, List, Tuple
+
+# values are recorded in microseconds, and each bucket is at most 1/128 (<1%) of its value wide
+_sub_bucket_bits = 8
+_sub_bucket_count = 1 << _sub_bucket_bits
+_sub_bucket_half_count = _sub_bucket_count >> 1
+_summary_percentiles = (50, 90, 99, 99.9)
+
+
+def _get_index(value: int) -> int:
+    """Get the bucket for a value, where values below 256 each get their own bucket, and larger ones share buckets"""
+    if value < _sub_bucket_count:
+        return value
+    shift = value.bit_length() - _sub_bucket_bits
+    top = value >> shift  # the highest 8 bits of the value, in [128, 256)
+    return _sub_bucket_count + (shift - 1) * _sub_bucket_half_count + (top - _sub_bucket_half_count)
+
+
+def _get_highest_value(index: int) -> int:
+    """Get the highest value that is recorded in a bucket"""
+    if index < _sub_bucket_count:
+        return index
+    shift = (index - _sub_bucket_count) // _sub_bucket_half_count + 1
+    top = (index - _sub_bucket_count) % _sub_bucket_half_count + _sub_bucket_half_count
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    A thread-safe, HDR-style histogram of latencies in milliseconds
+
+    Rather than keeping every value, values are counted in buckets that grow with the value, so percentiles are accurate
+    to within 1%, and memory depends on the range of values seen rather than the number of requests.
+    """
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def record(self, value_ms: float):
+        value = max(int(value_ms * 1000), 0)
+        index = _get_index(value)
+        with self._lock:
+            self._counts[index] = self._counts.get(index, 0) + 1
+            self._count += 1
+            self._total += value
+            self._min = value if self._min is None else min(self._min, value)
+            self._max = value if self._max is None else max(self._max, value)
+
+    def percentile(self, percentile: float) -> float:
+        """Get the latency (ms) that the given percentage of values were at or below"""
+        with self._lock:
+            return self._percentile(percentile)
+
+    def _percentile(self, percentile: float) -> float:
+        if not self._count:
+            return 0.0
+        target = max(1, round(self._count * percentile / 100))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= target:
+                return min(_get_highest_value(index), self._max) / 1000
+        return self._max / 1000
+
+    def summary(self) -> dict:
+        with self._lock:
+            if not self._count:
+                return {"count": 0}
+            summary = {
+                "count": self._count,
+                "min": self._min / 1000,
+                "max": self._max / 1000,
+                "mean": round(self._total / self._count / 1000, 3),
+            }
+            for percentile in _summary_percentiles:
+                summary[f"p{percentile:g}"] = self._percentile(percentile)
+            return summary
+
+
+class LatencyHistograms:
+    """A thread-safe set of histograms, one for each metric name and set of tags"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, Tuple[str, ...]], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, value_ms: float, tags: List[str]):
+        key = (name, tuple(tags))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram())
+        histogram.record(value_ms)
+
+    def dump(self, reset: bool = False) -> List[dict]:
+        """Get a summary of every histogram, sorted by name and tags, and optionally start new histograms"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            if reset:
+                self._histograms = {}
+        return [{"name": name, "tags": list(tags), **histogram.summary()} for (name, tags), histogram in histograms]
+
+
+latency_histograms = LatencyHistograms()
@@ -0,0 +1,16 @@
+"""Logging filter callbacks for settings.LOGGING, extending those from blink_logging_metrics"""
+import logging
+
+from blink_logging_metrics.logging import logging_filters
+
+
+def add_blink_correlation_id(record: logging.LogRecord) -> bool:
+    """
+    Add the current thread's correlation id to the record, unless it already has one
+
+    Records created on one thread and handled on another, such as by the event pipeline, are given their correlation id
+    when they're created, which the handling thread's id would otherwise replace.
+    """
+    if getattr(record, "blink_correlation_id", None) is not None:
+        return True
+    return logging_filters.add_blink_correlation_id(record)
@@ -0,0 +1,291 @@
+"""
+A drop-in for blink_logging_metrics' statsd, that can aggregate metrics in process, and send them in batches
+
+With settings.METRICS["aggregation"] enabled, counters are summed, gauges keep their last value, and timings keep
+their values (sampled past max_samples) for each name and tags, then every flush_interval_seconds they are packed into
+as few UDP datagrams as possible, instead of a syscall and packet for every metric.  Otherwise, calls go straight to
+blink_logging_metrics' statsd.
+"""
+import atexit
+import logging
+import os
+import random
+import socket
+import threading
+import weakref
+from typing import Dict, List, Optional, Tuple
+
+from blink_logging_metrics.metrics import statsd as _statsd
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+_logger = logging.getLogger(__name__)
+_default_port = 8125
+_default_max_packet_size = 1432  # fits in a UDP datagram on a 1500 byte MTU, like the datadog client's default
+
+_MetricKey = Tuple[str, Tuple[str, ...]]
+# objects whose locks are re-created in a forked child, since a lock held by another of the parent's threads at the
+# time of the fork would never be released in the child
+_fork_safe_objects = weakref.WeakSet()
+
+
+class _Samples:
+    """The values recorded for a timing, keeping a uniform random sample once there are more than max_samples"""
+
+    __slots__ = ("values", "count")
+
+    def __init__(self):
+        self.values: List[float] = []
+        self.count = 0
+
+    def add(self, value: float, max_samples: int):
+        self.count += 1
+        if len(self.values) < max_samples:
+            self.values.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < max_samples:
+                self.values[index] = value
+
+
+class MetricsAggregator:
+    """
+    Aggregates metrics in memory, and sends them to dogstatsd in multi-metric datagrams on a background thread
+
+    It has the same increment, decrement, gauge, timing, histogram and distribution methods as the statsd client.  The
+    sample_rate of each call is ignored, since every call is aggregated without sending a packet.  When a timing has
+    more values than max_samples in a flush interval, a random sample of them is sent, with a sample rate so dogstatsd
+    still counts all of them.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = _default_port,
+        namespace: str = None,
+        constant_tags: List[str] = None,
+        flush_interval_seconds: float = 1.0,
+        max_packet_size: int = _default_max_packet_size,
+        max_samples: int = 1000,
+    ):
+        self._address = (host, port)
+        self._prefix = f"{namespace}." if namespace else ""
+        self._constant_tags = list(constant_tags or [])
+        self._flush_interval_seconds = flush_interval_seconds
+        self._max_packet_size = max_packet_size
+        self._max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters: Dict[_MetricKey, float] = {}
+        self._gauges: Dict[_MetricKey, float] = {}
+        self._samples: Dict[Tuple[str, str, Tuple[str, ...]], _Samples] = {}
+        self._socket: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._pid = None
+        _fork_safe_objects.add(self)
+
+    def increment(self, metric: str, value: float = 1, tags: List[str] = None, sample_rate: float = 1):
+        key = (metric, tuple(tags) if tags else ())
+        self._ensure_started()
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def decrement(self, metric: str, value: float = 1, tags: List[str] = None, sample_rate: float = 1):
+        self.increment(metric, -value, tags)
+
+    def gauge(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        key = (metric, tuple(tags) if tags else ())
+        self._ensure_started()
+        with self._lock:
+            self._gauges[key] = value
+
+    def timing(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._add_sample("ms", metric, value, tags)
+
+    def histogram(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._add_sample("h", metric, value, tags)
+
+    def distribution(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._add_sample("d", metric, value, tags)
+
+    def flush(self):
+        """Send everything aggregated so far"""
+        with self._lock:
+            counters, self._counters = self._counters, {}
+            gauges, self._gauges = self._gauges, {}
+            samples, self._samples = self._samples, {}
+
+        lines = [self._format(name, value, "c", tags) for (name, tags), value in counters.items()]
+        lines += [self._format(name, value, "g", tags) for (name, tags), value in gauges.items()]
+        for (metric_type, name, tags), sample in samples.items():
+            sample_rate = len(sample.values) / sample.count
+            lines += [self._format(name, value, metric_type, tags, sample_rate) for value in sample.values]
+        for packet in self._pack(lines):
+            self._send(packet)
+
+    def stop(self):
+        """Stop the flush thread, and send everything left"""
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(self._flush_interval_seconds + 1)
+        self.flush()
+
+    def _add_sample(self, metric_type: str, metric: str, value: float, tags: Optional[List[str]]):
+        key = (metric_type, metric, tuple(tags) if tags else ())
+        self._ensure_started()
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = _Samples()
+            sample.add(value, self._max_samples)
+
+    def _format(self, name: str, value: float, metric_type: str, tags: Tuple[str, ...], sample_rate: float = 1) -> str:
+        value = int(value) if float(value).is_integer() else round(value, 6)
+        line = f"{self._prefix}{name}:{value}|{metric_type}"
+        if sample_rate < 1:
+            line += f"|@{sample_rate:.6g}"
+        all_tags = self._constant_tags + list(tags) if tags else self._constant_tags
+        if all_tags:
+            line += "|#" + ",".join(all_tags)
+        return line
+
+    def _pack(self, lines: List[str]) -> List[bytes]:
+        """Join lines into as few packets as possible, without going over the max packet size"""
+        packets = []
+        current = bytearray()
+        for line in lines:
+            encoded = line.encode("utf-8")
+            if current and len(current) + 1 + len(encoded) > self._max_packet_size:
+                packets.append(bytes(current))
+                current = bytearray()
+            if current:
+                current += b"\n"
+            current += encoded
+        if current:
+            packets.append(bytes(current))
+        return packets
+
+    def _send(self, packet: bytes):
+        try:
+            if self._socket is None:
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._socket.setblocking(False)
+            self._socket.sendto(packet, self._address)
+        except OSError:
+            # metrics are best effort, like the statsd client, so a full buffer or unresolvable host only drops them
+            _logger.debug(f"Failed to send {len(packet)} bytes of metrics to {self._address}", exc_info=True)
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # after a fork, the parent's aggregated metrics were (or will be) sent by the parent
+            self._counters, self._gauges, self._samples = {}, {}, {}
+            self._socket = None
+            self._thread = threading.Thread(target=self._run, name="metrics-aggregator", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _run(self):
+        while not self._stopped.wait(self._flush_interval_seconds):
+            try:
+                self.flush()
+            except Exception:
+                _logger.exception("Failed to flush metrics")
+
+
+class _Statsd:
+    """
+    Sends metrics to the aggregator if it's enabled in settings.METRICS, otherwise to blink_logging_metrics' statsd
+
+    The client is chosen on first use, and again when METRICS is overridden in tests.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        _fork_safe_objects.add(self)
+
+    def increment(self, metric: str, value: float = 1, tags: List[str] = None, sample_rate: float = 1):
+        self._get_client().increment(metric, value=value, tags=tags, sample_rate=sample_rate)
+
+    def decrement(self, metric: str, value: float = 1, tags: List[str] = None, sample_rate: float = 1):
+        self._get_client().decrement(metric, value=value, tags=tags, sample_rate=sample_rate)
+
+    def gauge(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._get_client().gauge(metric, value, tags=tags, sample_rate=sample_rate)
+
+    def timing(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._get_client().timing(metric, value, tags=tags, sample_rate=sample_rate)
+
+    def histogram(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._get_client().histogram(metric, value, tags=tags, sample_rate=sample_rate)
+
+    def distribution(self, metric: str, value: float, tags: List[str] = None, sample_rate: float = 1):
+        self._get_client().distribution(metric, value, tags=tags, sample_rate=sample_rate)
+
+    def flush(self):
+        """Send any aggregated metrics now, such as before a short-lived command exits"""
+        if isinstance(self._client, MetricsAggregator):
+            self._client.flush()
+
+    def _get_client(self):
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = _create_client()
+                client = self._client
+        return client
+
+    def reset(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if isinstance(client, MetricsAggregator):
+            client.stop()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+
+def _create_client():
+    metrics_config = getattr(settings, "METRICS", None) or {}
+    aggregation = metrics_config.get("aggregation") or {}
+    if not aggregation.get("enabled"):
+        return _statsd
+
+    statsd_config = metrics_config.get("statsd") or {}
+    constant_tags = [f"{name}:{value}" for name, value in (statsd_config.get("constant_tags") or {}).items()]
+    aggregator = MetricsAggregator(
+        host=statsd_config.get("hostname") or "localhost",
+        port=statsd_config.get("port") or _default_port,
+        namespace=metrics_config.get("namespace"),
+        constant_tags=constant_tags,
+        flush_interval_seconds=aggregation.get("flush_interval_seconds", 1.0),
+        max_packet_size=aggregation.get("max_packet_size", _default_max_packet_size),
+        max_samples=aggregation.get("max_samples", 1000),
+    )
+    atexit.register(aggregator.stop)
+    return aggregator
+
+
+def _after_fork_in_child():
+    for fork_safe_object in list(_fork_safe_objects):
+        fork_safe_object._after_fork()
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+statsd = _Statsd()
+
+
+@receiver(setting_changed)
+def _reset_statsd(setting, **kwargs):
+    if setting == "METRICS":
+        statsd.reset()
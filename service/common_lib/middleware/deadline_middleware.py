@@ -0,0 +1,25 @@
+from django.conf import settings
+
+from common_lib.deadline import DEADLINE_HEADER, deadline, parse_deadline_header
+
+
+class DeadlineMiddleware(object):
+    """
+    Set a deadline for each request, so outbound calls made while handling it stop once the caller has given up
+
+    The deadline is settings.REQUEST_DEADLINE_SECONDS from when the request was received, or sooner if the caller sent
+    a Blink-Deadline-Ms header with less time remaining.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        seconds = getattr(settings, "REQUEST_DEADLINE_SECONDS", None)
+        caller_seconds = parse_deadline_header(request.headers.get(DEADLINE_HEADER))
+        if caller_seconds is not None:
+            seconds = caller_seconds if seconds is None else min(seconds, caller_seconds)
+
+        # process the request and return the response
+        with deadline(seconds):
+            return self.get_response(request)
@@ -0,0 +1,420 @@
+import asyncio
+import threading
+from copy import deepcopy
+from unittest import mock
+
+import httpx
+import pytest
+from django.conf import settings
+from django.test import override_settings
+from httpx import Response
+from respx.transports import MockTransport
+
+from common_lib import blink_requests_async
+from common_lib.blink_requests_async import (
+    aiter_response,
+    gather_batch,
+    iter_response,
+    run_async_as_sync,
+    get_client,
+    _get_config,
+)
+from common_lib.deadline import DeadlineExceededError, deadline, get_remaining_seconds
+from common_lib.errors import ClientError
+from common_lib.event_loop_thread import EventLoopThread
+from common_lib.http_endpoints import _get_limits, _get_timeout
+from common_lib.http_pool import SharedPoolTransport
+from common_lib.http_streaming import StreamModes
+from common_lib.latency_histogram import latency_histograms
+from common_lib.mock_http_response import MockHttpResponse
+from core.clients.mocks.foo_client_mocks import foo_router, get_foo_data, get_foo_route, get_foo_side_effect
+
+
+def _http_clients(**endpoint_overrides):
+    """Copy the test HTTP_CLIENTS settings, overriding options for the foo endpoint"""
+    http_clients = deepcopy(settings.HTTP_CLIENTS)
+    http_clients["endpoints"]["foo"].update(endpoint_overrides)
+    return http_clients
+
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_clients():
+    """Clients are cached per-thread and per-process, so clear them to pick up each test's settings"""
+
+    def clear():
+        getattr(blink_requests_async._thread_local, "httpx_clients", {}).clear()
+        getattr(blink_requests_async._thread_local, "httpx_async_clients", {}).clear()
+        blink_requests_async._shared_clients.clear()
+        blink_requests_async._response_caches.clear()
+        blink_requests_async._single_flights.clear()
+        blink_requests_async._circuit_breakers.clear()
+        blink_requests_async._retry_policies.clear()
+
+    clear()
+    yield
+    clear()
+
+
+class TestSharedPool:
+    def test_thread_clients_by_default(self):
+        clients = []
+        thread = threading.Thread(target=lambda: clients.append(get_client("foo")))
+        thread.start()
+        thread.join()
+
+        assert clients[0] is not get_client("foo")
+
+    def test_shared_client_across_threads(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(shared_pool=True)):
+            clients = []
+            thread = threading.Thread(target=lambda: clients.append(get_client("foo")))
+            thread.start()
+            thread.join()
+
+            assert clients[0] is get_client("foo")
+
+    def test_async_clients_not_shared(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(shared_pool=True)):
+            assert isinstance(get_client("foo", is_async=True), httpx.AsyncClient)
+            assert "foo" not in blink_requests_async._shared_clients
+
+    def test_pool_gauges(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(shared_pool={"max_connections": 5})):
+            with mock.patch("common_lib.http_pool.statsd.gauge") as mock_gauge:
+                response = get_client("foo").get("/123/")
+
+            assert response.status_code == 200
+            mock_gauge.assert_any_call("http.pool.in_use", 1, tags=["client:foo"])
+            assert get_client("foo")._transport.in_use == 0
+
+    def test_pool_timeout(self):
+        transport = SharedPoolTransport(MockTransport(router=foo_router), "foo", max_connections=1)
+        client = httpx.Client(transport=transport, base_url=settings.HTTP_CLIENTS["endpoints"]["foo"]["root_url"])
+
+        # hold the only connection open with a streamed response, so the next request can't get one
+        with client.stream("GET", "/123/"):
+            with pytest.raises(httpx.PoolTimeout):
+                client.get("/456/", timeout=httpx.Timeout(5.0, pool=0.01))
+
+        # once released, requests can use the connection again
+        assert client.get("/456/").status_code == 200
+
+
+    def test_http2_not_gated(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(mocked_transport=None, http2=True, shared_pool=True)):
+            config = _get_config("foo", is_async=False)
+
+            transport = config["transport"]
+            while transport is not None:
+                assert not isinstance(transport, SharedPoolTransport)
+                transport = getattr(transport, "_transport", None)
+
+            # requests from every thread are still multiplexed over the shared client's connections
+            clients = []
+            thread = threading.Thread(target=lambda: clients.append(get_client("foo")))
+            thread.start()
+            thread.join()
+            assert clients[0] is get_client("foo")
+
+
+class TestEndpointConfig:
+    def test_default_timeout(self):
+        timeout = _get_timeout({"default_timeout_seconds": 2.0})
+
+        assert timeout == httpx.Timeout(2.0)
+
+    def test_specific_timeouts(self):
+        timeout = _get_timeout({"default_timeout_seconds": 2.0, "timeouts": {"connect": 0.5, "pool": 0.1}})
+
+        assert timeout == httpx.Timeout(2.0, connect=0.5, pool=0.1)
+
+    def test_limits(self):
+        limits = _get_limits({"limits": {"max_connections": 4, "keepalive_expiry": 30}})
+
+        assert limits == httpx.Limits(max_connections=4, max_keepalive_connections=20, keepalive_expiry=30)
+
+    def test_shared_pool_limits_override(self):
+        limits = _get_limits(
+            {"limits": {"max_connections": 4, "keepalive_expiry": 30}, "shared_pool": {"max_connections": 8}}
+        )
+
+        assert limits == httpx.Limits(max_connections=8, max_keepalive_connections=10, keepalive_expiry=30)
+
+    def test_http2_transport(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(mocked_transport=None, http2=True)):
+            config = _get_config("foo", is_async=True)
+
+        assert isinstance(config["transport"], httpx.AsyncHTTPTransport)
+
+    def test_circuit_breaker_shared_by_clients(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(circuit_breaker={"failure_threshold": 2}, retries=True)):
+            sync_transport = _get_config("foo", is_async=False)["transport"]
+            async_transport = _get_config("foo", is_async=True)["transport"]
+
+        assert sync_transport._circuit_breaker is async_transport._circuit_breaker
+        assert sync_transport._circuit_breaker.failure_threshold == 2
+        assert sync_transport._retry_policy.max_retries == 2
+
+    def test_record_then_replay(self, tmp_path):
+        path = str(tmp_path / "foo.jsonl")
+        with override_settings(HTTP_CLIENTS=_http_clients(record={"path": path})):
+            with MockHttpResponse(get_foo_route, side_effect=get_foo_side_effect):
+                recorded = get_client("foo").get("/123/").json()
+
+        blink_requests_async._thread_local.httpx_clients.clear()
+        with override_settings(HTTP_CLIENTS=_http_clients(mocked_transport=None, replay={"path": path})):
+            assert get_client("foo").get("/123/").json() == recorded
+
+    def test_no_transport_by_default(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(mocked_transport=None)):
+            config = _get_config("foo", is_async=False)
+
+        assert "transport" not in config
+
+
+class TestLatencyMetrics:
+    def test_route_tags_and_phase_timings(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(phase_timings=True, shared_pool=True, routes=["/{id}/"])):
+            with MockHttpResponse(get_foo_route, side_effect=get_foo_side_effect):
+                with mock.patch("common_lib.blink_requests_async.statsd.timing") as mock_timing:
+                    get_client("foo").get("/123/")
+
+        timings = {call.args[0]: call.kwargs["tags"] for call in mock_timing.call_args_list}
+        assert set(timings) == {
+            "http.request.duration",
+            "http.request.phase.headers",
+            "http.request.phase.body",
+            "http.request.phase.pool_wait",
+        }
+        assert {"client:foo", "route:/{id}/"} <= set(timings["http.request.duration"])
+
+        histograms = {(item["name"], tuple(item["tags"])) for item in latency_histograms.dump()}
+        assert ("http.request.duration", ("method:GET", "client:foo", "route:/{id}/")) in histograms
+
+    def test_retries_extension(self):
+        retries = {"max_retries": 1, "backoff_base_seconds": 0}
+        side_effects = [Response(503), Response(200, json=get_foo_data())]
+
+        with override_settings(HTTP_CLIENTS=_http_clients(retries=retries)):
+            with MockHttpResponse(get_foo_route, side_effect=side_effects):
+                response = get_client("foo").get("/123/")
+
+        assert response.extensions["retries"] == 1
+
+
+class TestDeadlinePropagation:
+    def test_remaining_time_forwarded(self):
+        with MockHttpResponse(get_foo_route, side_effect=get_foo_side_effect):
+            with deadline(2):
+                get_client("foo").get("/123/")
+
+            assert 1000 < int(get_foo_route.calls.last.request.headers["Blink-Deadline-Ms"]) <= 2000
+
+            get_client("foo").get("/123/")
+            assert "Blink-Deadline-Ms" not in get_foo_route.calls.last.request.headers
+
+    def test_expired_deadline_not_sent(self):
+        with MockHttpResponse(get_foo_route, side_effect=get_foo_side_effect):
+            with deadline(0):
+                with pytest.raises(DeadlineExceededError):
+                    get_client("foo").get("/123/")
+
+            assert get_foo_route.call_count == 0
+
+    def test_deadline_passed_to_background_loop(self):
+        @run_async_as_sync
+        async def get_remaining():
+            return get_remaining_seconds()
+
+        with override_settings(HTTP_CLIENTS={**settings.HTTP_CLIENTS, "background_event_loop": True}):
+            with deadline(2):
+                assert 1 < get_remaining() <= 2
+
+
+class TestResponseCache:
+    def test_cached_responses_skip_request_metrics(self):
+        def side_effect(request):
+            return Response(200, json=get_foo_data(), headers={"Cache-Control": "max-age=60"})
+
+        with override_settings(HTTP_CLIENTS=_http_clients(cache={"max_entries": 10})):
+            with MockHttpResponse(get_foo_route, side_effect=side_effect, assert_called=True):
+                with mock.patch("common_lib.blink_requests_async.statsd.timing") as mock_timing:
+                    get_client("foo").get("/123/")
+                    response = get_client("foo").get("/123/")
+
+                assert get_foo_route.call_count == 1
+
+        assert response.extensions["from_cache"]
+        mock_timing.assert_called_once()
+
+
+class TestBodyLogging:
+    def _get_logged_extras(self, status_code: int = 200, **endpoint_overrides) -> list:
+        def side_effect(request):
+            return Response(status_code, json=get_foo_data())
+
+        with override_settings(HTTP_CLIENTS=_http_clients(**endpoint_overrides)):
+            with MockHttpResponse(get_foo_route, side_effect=side_effect):
+                with mock.patch("common_lib.blink_requests_async._logger.info") as mock_info:
+                    get_client("foo").request("GET", "/123/", json={"name": "x" * 10})
+
+        return [call.kwargs["extra"] for call in mock_info.call_args_list]
+
+    def test_bodies_logged_by_default(self):
+        request_extra, response_extra = self._get_logged_extras()
+
+        assert request_extra["body"] == '{"name": "xxxxxxxxxx"}'
+        assert "body" in response_extra
+
+    def test_unsampled_bodies_not_logged(self):
+        request_extra, response_extra = self._get_logged_extras(log_body_sample_rate=0)
+
+        assert "body" not in request_extra
+        assert "body" not in response_extra
+
+    def test_error_bodies_always_logged(self):
+        request_extra, response_extra = self._get_logged_extras(status_code=500, log_body_sample_rate=0)
+
+        assert "body" not in request_extra
+        assert response_extra["request_body"] == '{"name": "xxxxxxxxxx"}'
+        assert "body" in response_extra
+
+    def test_log_body_disabled(self):
+        request_extra, response_extra = self._get_logged_extras(status_code=500, log_body=False)
+
+        assert "body" not in request_extra
+        assert "body" not in response_extra
+
+    def test_truncated_by_bytes(self):
+        with mock.patch("common_lib.blink_requests_async._max_body_size_to_log", 2):
+            # the multi-byte é is split, so is replaced instead of failing to decode
+            assert blink_requests_async._truncate_body("héllo".encode()) == "h\ufffd..."
+            assert blink_requests_async._truncate_body(b"ab") == "ab"
+
+    def test_streamed_response_not_read(self):
+        with override_settings(HTTP_CLIENTS=_http_clients()):
+            with MockHttpResponse(get_foo_route, side_effect=get_foo_side_effect):
+                with mock.patch("common_lib.blink_requests_async._logger.info") as mock_info:
+                    with get_client("foo").stream("GET", "/123/") as response:
+                        assert not response.is_stream_consumed
+                        response.read()
+
+        assert mock_info.call_args_list[1].kwargs["extra"]["body"] == "<streamed>"
+
+    @pytest.mark.asyncio
+    async def test_async_streamed_response_logged_if_enabled(self):
+        with override_settings(HTTP_CLIENTS=_http_clients(log_streamed_body=True)):
+            with MockHttpResponse(get_foo_route, side_effect=get_foo_side_effect):
+                with mock.patch("common_lib.blink_requests_async._logger.info") as mock_info:
+                    async with get_client("foo", is_async=True).stream("GET", "/123/") as response:
+                        await response.aread()
+
+        assert '"id": "123"' in mock_info.call_args_list[1].kwargs["extra"]["body"]
+
+
+class TestIterResponse:
+    def _side_effect(self, request):
+        return Response(200, content=b'[{"id": "1"}, {"id": "2"}]\n')
+
+    def test_json_items(self):
+        with MockHttpResponse(get_foo_route, side_effect=self._side_effect):
+            with get_client("foo").stream("GET", "/export/") as response:
+                items = list(iter_response(response, StreamModes.json_items))
+
+        assert items == [{"id": "1"}, {"id": "2"}]
+
+    def test_lines(self):
+        def side_effect(request):
+            return Response(200, content=b"first\r\nsecond\n")
+
+        with MockHttpResponse(get_foo_route, side_effect=side_effect):
+            with get_client("foo").stream("GET", "/export/") as response:
+                assert list(iter_response(response, StreamModes.lines)) == ["first", "second"]
+
+    def test_error_status(self):
+        with MockHttpResponse(get_foo_route, side_effect=lambda request: Response(500, text="failed")):
+            with get_client("foo").stream("GET", "/export/") as response:
+                with pytest.raises(ClientError, match="failed"):
+                    list(iter_response(response))
+
+    @pytest.mark.asyncio
+    async def test_async_json_items(self):
+        with MockHttpResponse(get_foo_route, side_effect=self._side_effect):
+            async with get_client("foo", is_async=True).stream("GET", "/export/") as response:
+                items = [item async for item in aiter_response(response, StreamModes.json_items)]
+
+        assert items == [{"id": "1"}, {"id": "2"}]
+
+
+class TestGatherBatch:
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency(self):
+        in_flight = []
+        max_in_flight = []
+
+        async def func(key):
+            in_flight.append(key)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(key)
+            return key * 2
+
+        results = await gather_batch(func, range(10), max_concurrency=3)
+
+        assert [result.value for result in results] == [key * 2 for key in range(10)]
+        assert max(max_in_flight) == 3
+
+    @pytest.mark.asyncio
+    async def test_timeouts_and_errors_per_item(self):
+        async def func(key):
+            if key == "slow":
+                await asyncio.sleep(1)
+            if key == "bad":
+                raise ValueError("bad key")
+            return key
+
+        results = await gather_batch(func, ["ok", "slow", "bad"], timeout_seconds=0.05)
+
+        assert results[0].is_success and results[0].value == "ok"
+        assert isinstance(results[1].error, asyncio.TimeoutError)
+        assert isinstance(results[2].error, ValueError)
+
+
+class TestBackgroundEventLoop:
+    def test_one_loop_for_all_threads(self):
+        @run_async_as_sync
+        async def get_loop_and_thread():
+            return asyncio.get_event_loop(), threading.current_thread()
+
+        results = []
+        with override_settings(HTTP_CLIENTS={**settings.HTTP_CLIENTS, "background_event_loop": True}):
+            thread = threading.Thread(target=lambda: results.append(get_loop_and_thread()))
+            thread.start()
+            thread.join()
+            results.append(get_loop_and_thread())
+
+        assert results[0] == results[1]
+        assert results[0][1] is not threading.current_thread()
+
+    def test_correlation_id_passed_to_loop(self):
+        @run_async_as_sync
+        async def get_correlation_id():
+            return blink_requests_async.get_correlation_id()
+
+        current_thread = threading.current_thread()
+        current_thread.blink_correlation_id = "test-correlation-id"
+        try:
+            with override_settings(HTTP_CLIENTS={**settings.HTTP_CLIENTS, "background_event_loop": True}):
+                assert get_correlation_id() == "test-correlation-id"
+        finally:
+            del current_thread.blink_correlation_id
+
+    def test_run_from_loop_thread_fails(self):
+        event_loop_thread = EventLoopThread()
+
+        async def nested_run():
+            event_loop_thread.run(asyncio.sleep(0))
+
+        with pytest.raises(RuntimeError):
+            event_loop_thread.run(nested_run())
+        event_loop_thread.stop()
@@ -0,0 +1,92 @@
+import time
+
+import httpx
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from common_lib.deadline import (
+    DeadlineExceededError,
+    DeadlineTransport,
+    deadline,
+    get_remaining_seconds,
+    parse_deadline_header,
+)
+from common_lib.middleware.deadline_middleware import DeadlineMiddleware
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """Records the timeouts of each request it receives"""
+
+    def __init__(self):
+        self.timeouts = []
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        self.timeouts.append(extensions["timeout"])
+        return 200, [], httpx.ByteStream(b""), {}
+
+
+class TestDeadline:
+    def test_no_deadline_by_default(self):
+        assert get_remaining_seconds() is None
+
+    def test_nested_deadline_cant_extend(self):
+        with deadline(1):
+            with deadline(10):
+                assert get_remaining_seconds() <= 1
+            with deadline(None):
+                assert get_remaining_seconds() <= 1
+            with deadline(0.5):
+                assert get_remaining_seconds() <= 0.5
+
+        assert get_remaining_seconds() is None
+
+    @pytest.mark.parametrize("value, expected", [("1500", 1.5), ("-5", 0), ("soon", None), (None, None)])
+    def test_parse_header(self, value, expected):
+        assert parse_deadline_header(value) == expected
+
+
+class TestDeadlineMiddleware:
+    def _get_remaining(self, **headers):
+        remaining = []
+
+        def view(request):
+            remaining.append(get_remaining_seconds())
+            return HttpResponse()
+
+        DeadlineMiddleware(view)(RequestFactory().get("/", **headers))
+        return remaining[0]
+
+    @override_settings(REQUEST_DEADLINE_SECONDS=30)
+    def test_deadline_from_settings(self):
+        assert 29 < self._get_remaining() <= 30
+
+    @override_settings(REQUEST_DEADLINE_SECONDS=30)
+    def test_caller_deadline_if_sooner(self):
+        assert self._get_remaining(HTTP_BLINK_DEADLINE_MS="2000") <= 2
+        assert self._get_remaining(HTTP_BLINK_DEADLINE_MS="60000") <= 30
+
+
+class TestDeadlineTransport:
+    def test_timeouts_clamped(self):
+        transport = RecordingTransport()
+        client = httpx.Client(transport=DeadlineTransport(transport), timeout=httpx.Timeout(5, connect=0.5))
+
+        client.get("http://test.deadline.com/")
+        with deadline(1):
+            client.get("http://test.deadline.com/")
+
+        assert transport.timeouts[0]["read"] == 5
+        assert transport.timeouts[1]["connect"] == 0.5
+        assert 0.9 < transport.timeouts[1]["read"] <= 1
+
+    def test_expired_deadline(self):
+        transport = RecordingTransport()
+        client = httpx.Client(transport=DeadlineTransport(transport))
+
+        with deadline(0.01):
+            time.sleep(0.02)
+            with pytest.raises(DeadlineExceededError):
+                client.get("http://test.deadline.com/")
+
+        assert transport.timeouts == []
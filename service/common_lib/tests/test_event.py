@@ -1,6 +1,9 @@
+import logging
 from unittest import TestCase
 
-from common_lib.event import Event
+from django.core.exceptions import ImproperlyConfigured
+
+from common_lib.event import Event, EventRegistry, event_registry
 
 
 class TestEvent(TestCase):
@@ -76,3 +79,135 @@ class TestEvent(TestCase):
         # un-known kwarg
         with self.assertRaises(ValueError):
             event = ValidationEvent("val1", param_unknown="val2")
+
+    def test_invalid_definition_fails_on_class_creation(self):
+        with self.assertRaises(ValueError):
+
+            class OrderEvent(Event):
+                event_name = "name"
+                event_fields = ["param1=1", "param2"]
+
+        with self.assertRaises(ValueError):
+
+            class MessageEvent(Event):
+                event_name = "name"
+                event_fields = ["param1"]
+                message = "{param2} was set"
+
+        with self.assertRaises(ValueError):
+
+            class MissingFieldsEvent(Event):
+                event_name = "name"
+
+        with self.assertRaises(ValueError):
+
+            class SampledEvent(Event):
+                event_name = "name"
+                event_fields = ["param1"]
+                log_sample_rate = 2
+
+        with self.assertRaises(ValueError):
+
+            class BurstEvent(Event):
+                event_name = "name"
+                event_fields = ["param1"]
+                log_burst_size = 10
+
+    def test_abstract_base_event(self):
+        class BaseEvent(Event):
+            log_level = logging.WARNING
+
+        class ChildEvent(BaseEvent):
+            event_name = "name"
+            event_fields = ["param1", "**kwargs"]
+
+        event = ChildEvent("val1", extra="val2")
+
+        self.assertEqual(event.tags, {"param1": "val1", "extra": "val2"})
+        self.assertEqual(event.log_level, logging.WARNING)
+        with self.assertRaises(ValueError):
+            BaseEvent()
+
+    def test_message_formatted_when_read(self):
+        class MessageEvent(Event):
+            event_name = "name"
+            event_fields = ["param1", "param2=None"]
+            message = "{param1} was set"
+            metric_tags = ["param1", "param2"]
+
+        event = MessageEvent("val1")
+        self.assertNotIn("message", event.__dict__)
+
+        self.assertEqual(event.message, "val1 was set")
+        self.assertEqual(event.log_message, "name: val1 was set")
+        self.assertEqual(event.metric_tag_values, ["param1:val1", "param2:None"])
+        self.assertEqual(MessageEvent.message, "{param1} was set")
+
+        class ChildEvent(MessageEvent):
+            message = "{param1} was changed"
+
+        self.assertEqual(ChildEvent("val2").message, "val2 was changed")
+        self.assertEqual(MessageEvent("val3").message, "val3 was set")
+
+    def test_high_cardinality_fields_excluded_from_metric_tags(self):
+        class OrderEvent(Event):
+            event_name = "name"
+            event_fields = ["order_id", "status"]
+            emit_metric = True
+            metric_tags = ["order_id", "status"]
+            high_cardinality_fields = ["order_id"]
+
+        self.assertEqual(OrderEvent("a1b2", "filled").metric_tag_values, ["status:filled"])
+        self.assertEqual(OrderEvent.get_definition_errors(), [])
+
+    def test_registry_validation(self):
+        class ValidEvent(Event):
+            event_name = "valid"
+            event_fields = ["param1", "count=1"]
+            emit_metric = True
+            metric_tags = ["param1"]
+            metric_increment_field = "count"
+
+        class InvalidEvent(Event):
+            event_name = "invalid"
+            event_fields = ["param1", "param2?"]
+            emit_metric = True
+            metric_tags = ["param1", "param2?"]
+            high_cardinality_fields = ["param3"]
+
+        self.assertIn(ValidEvent, event_registry.get_event_classes())
+        self.assertEqual(len(InvalidEvent.get_definition_errors()), 2)
+
+        registry = EventRegistry()
+        registry.register(ValidEvent)
+        registry.validate()
+
+        registry.register(InvalidEvent)
+        with self.assertRaises(ImproperlyConfigured) as context:
+            registry.validate()
+        self.assertIn("InvalidEvent.metric_tags includes 'param2?'", str(context.exception))
+        self.assertIn("InvalidEvent.high_cardinality_fields includes 'param3'", str(context.exception))
+
+    def test_catalog(self):
+        class CatalogEvent(Event):
+            event_name = "catalog.event"
+            event_fields = ["order_id", "status?", "retries=0"]
+            message = "Order {order_id} is {status}"
+            log_level = logging.WARNING
+            emit_metric = True
+            metric_tags = ["order_id", "status"]
+            high_cardinality_fields = ["order_id"]
+
+        registry = EventRegistry()
+        registry.register(CatalogEvent)
+
+        entry = registry.get_catalog()[0]
+        self.assertEqual(entry["event_name"], "catalog.event")
+        self.assertEqual(entry["message"], "Order {order_id} is {status}")
+        self.assertEqual(entry["log_level"], "WARNING")
+        self.assertEqual(entry["metric"], {"name": "catalog.event", "tags": ["status"], "increment_field": None})
+        self.assertEqual(
+            entry["fields"][0],
+            {"name": "order_id", "required": True, "nullable": False, "default": None, "high_cardinality": True},
+        )
+        self.assertEqual(entry["fields"][2]["default"], "0")
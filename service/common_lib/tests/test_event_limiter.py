@@ -0,0 +1,62 @@
+import logging
+from unittest import mock
+
+import pytest
+
+from common_lib.event import Event
+from common_lib.event_limiter import EventLimiter
+
+
+class UnlimitedEvent(Event):
+    event_name = "test.unlimited"
+    event_fields = ["param1"]
+    log_level = logging.INFO
+
+
+class RateLimitedEvent(Event):
+    event_name = "test.rate_limited"
+    event_fields = ["param1"]
+    log_level = logging.INFO
+    log_max_per_second = 1
+    log_burst_size = 3
+
+
+class SampledEvent(Event):
+    event_name = "test.sampled"
+    event_fields = ["param1"]
+    log_level = logging.INFO
+    log_sample_rate = 0.25
+
+
+class TestEventLimiter:
+    @pytest.fixture(scope="function", autouse=True)
+    def mock_statsd(self):
+        with mock.patch("common_lib.event_limiter.statsd.increment") as mock_statsd:
+            yield mock_statsd
+
+    def test_unlimited(self, mock_statsd):
+        limiter = EventLimiter()
+        assert not UnlimitedEvent.is_log_limited
+        assert all(limiter.allow(UnlimitedEvent(i)) == (True, 0) for i in range(100))
+        mock_statsd.assert_not_called()
+
+    def test_rate_limited_with_burst(self, mock_statsd):
+        limiter = EventLimiter()
+        with mock.patch("common_lib.event_limiter.time.monotonic", return_value=100.0) as mock_time:
+            results = [limiter.allow(RateLimitedEvent(i)) for i in range(5)]
+            assert results == [(True, 0)] * 3 + [(False, 0)] * 2
+
+            # a token refills after a second, and the next logged event reports what was suppressed
+            mock_time.return_value = 101.0
+            assert limiter.allow(RateLimitedEvent(5)) == (True, 2)
+            assert limiter.allow(RateLimitedEvent(6)) == (False, 0)
+
+        assert mock_statsd.call_count == 3
+        mock_statsd.assert_called_with("event.suppressed", tags=["event_name:test.rate_limited"])
+
+    def test_sampled(self):
+        limiter = EventLimiter()
+        with mock.patch("common_lib.event_limiter.random.random", side_effect=[0.1, 0.5, 0.9, 0.2]):
+            results = [limiter.allow(SampledEvent(i)) for i in range(4)]
+
+        assert results == [(True, 0), (False, 0), (False, 0), (True, 2)]
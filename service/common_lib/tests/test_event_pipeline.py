@@ -0,0 +1,99 @@
+import logging
+import os
+import threading
+from unittest import mock
+
+import pytest
+
+from common_lib.event_pipeline import EventPipeline
+
+_test_logger = logging.getLogger("common_lib.tests.event_pipeline")
+
+
+def _make_record(message: str) -> logging.LogRecord:
+    return _test_logger.makeRecord(_test_logger.name, logging.INFO, __file__, 0, message, None, None)
+
+
+class TestEventPipeline:
+    @pytest.fixture(scope="function", autouse=True)
+    def mock_statsd(self):
+        with mock.patch("common_lib.event_pipeline.statsd.increment") as mock_statsd:
+            yield mock_statsd
+
+    @pytest.fixture(scope="function")
+    def pipeline(self):
+        pipeline = EventPipeline(max_queue_size=100, flush_interval_seconds=60)
+        yield pipeline
+        pipeline.stop()
+
+    def test_combines_metric_increments(self, pipeline, mock_statsd):
+        for _ in range(3):
+            pipeline.submit_metric("test.metric", 1, ("status:ok",))
+        pipeline.submit_metric("test.metric", 2, ("status:error",))
+        pipeline.submit_metric("test.other")
+        mock_statsd.assert_not_called()
+
+        assert pipeline.flush(timeout=5)
+
+        assert mock_statsd.call_count == 3
+        mock_statsd.assert_any_call("test.metric", value=3, tags=["status:ok"])
+        mock_statsd.assert_any_call("test.metric", value=2, tags=["status:error"])
+        mock_statsd.assert_any_call("test.other", value=1, tags=None)
+
+    def test_handles_logs_in_order(self, pipeline, caplog):
+        caplog.set_level(logging.INFO, logger=_test_logger.name)
+        pipeline.submit_log(_test_logger, _make_record("first"))
+        pipeline.submit_log(_test_logger, _make_record("second"))
+
+        assert pipeline.flush(timeout=5)
+
+        assert [record.getMessage() for record in caplog.records] == ["first", "second"]
+        assert caplog.records[0].threadName == threading.current_thread().name
+
+    def test_drops_when_full(self, pipeline, mock_statsd):
+        handled = threading.Event()
+        release = threading.Event()
+
+        def block(record):
+            handled.set()
+            release.wait(5)
+
+        logger = mock.Mock(handle=mock.Mock(side_effect=block))
+        pipeline.submit_log(logger, _make_record("blocking"))
+        pipeline.flush(timeout=0)
+        assert handled.wait(5)
+
+        # the worker is stuck handling the first log, so the queue fills up
+        results = [pipeline.submit_metric("test.metric") for _ in range(150)]
+        release.set()
+        assert pipeline.flush(timeout=5)
+
+        dropped = results.count(False)
+        assert dropped > 0
+        mock_statsd.assert_any_call("test.metric", value=150 - dropped, tags=None)
+        mock_statsd.assert_any_call("event_pipeline.dropped", value=dropped)
+
+    def test_stop_flushes(self, mock_statsd):
+        pipeline = EventPipeline(flush_interval_seconds=60)
+        pipeline.submit_metric("test.metric")
+        assert pipeline.is_running
+
+        pipeline.stop()
+
+        assert not pipeline.is_running
+        mock_statsd.assert_called_once_with("test.metric", value=1, tags=None)
+
+    def test_flush_when_not_started(self, mock_statsd):
+        assert EventPipeline().flush(timeout=1)
+        mock_statsd.assert_not_called()
+
+    def test_locks_recreated_after_fork(self, pipeline):
+        # a lock held by another thread when the process forks is never released in the child
+        with pipeline._lock, pipeline._dropped_lock:
+            pid = os.fork()
+            if pid == 0:
+                acquired = pipeline._lock.acquire(timeout=1) and pipeline._dropped_lock.acquire(timeout=1)
+                os._exit(0 if acquired else 1)
+
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
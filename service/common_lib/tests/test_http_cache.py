@@ -0,0 +1,230 @@
+from unittest import mock
+
+import httpx
+import pytest
+import respx
+from httpx import Response
+from respx.transports import MockTransport
+
+from common_lib.http_cache import AsyncCachingTransport, CachingTransport, ResponseCache
+
+BASE_URL = "http://test.cache.com/api/v1"
+
+router = respx.Router(base_url=BASE_URL, assert_all_called=False)
+cached_route = router.get(path__regex="/cached/\\w+/", name="cached")
+
+
+def _client(response_cache: ResponseCache = None) -> httpx.Client:
+    response_cache = response_cache if response_cache is not None else ResponseCache()
+    transport = CachingTransport(MockTransport(router=router), response_cache)
+    return httpx.Client(transport=transport, base_url=BASE_URL)
+
+
+@pytest.fixture(scope="function", autouse=True)
+def reset_route():
+    cached_route.reset()
+    cached_route.side_effect = None
+    yield
+
+
+class TestCachingTransport:
+    def test_fresh_response_is_cached(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        client = _client()
+
+        with mock.patch("common_lib.http_cache.statsd.increment") as mock_increment:
+            first = client.get("/cached/1/")
+            second = client.get("/cached/1/")
+
+        assert cached_route.call_count == 1
+        assert first.json() == second.json() == {"id": 1}
+        assert second.extensions["from_cache"]
+        mock_increment.assert_any_call("http.cache.hit", tags=["endpoint:test.cache.com"])
+
+    def test_no_store_is_not_cached(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "no-store, max-age=60"})
+        client = _client()
+
+        client.get("/cached/1/")
+        client.get("/cached/1/")
+
+        assert cached_route.call_count == 2
+
+    def test_uncacheable_without_freshness_or_validators(self):
+        cached_route.return_value = Response(200, json={"id": 1})
+        client = _client()
+
+        client.get("/cached/1/")
+        client.get("/cached/1/")
+
+        assert cached_route.call_count == 2
+
+    def test_revalidation_with_etag(self):
+        def side_effect(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return Response(304, headers={"ETag": '"v1"'})
+            return Response(200, json={"id": 1}, headers={"ETag": '"v1"', "Cache-Control": "no-cache"})
+
+        cached_route.side_effect = side_effect
+        client = _client()
+
+        with mock.patch("common_lib.http_cache.statsd.increment") as mock_increment:
+            client.get("/cached/1/")
+            response = client.get("/cached/1/")
+
+        assert cached_route.call_count == 2
+        assert response.status_code == 200
+        assert response.json() == {"id": 1}
+        mock_increment.assert_any_call("http.cache.revalidated", tags=["endpoint:test.cache.com"])
+
+    def test_request_no_cache_bypasses(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        client = _client()
+
+        client.get("/cached/1/")
+        client.get("/cached/1/", headers={"Cache-Control": "no-cache"})
+
+        assert cached_route.call_count == 2
+
+    def test_lru_eviction(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        response_cache = ResponseCache(max_entries=2)
+        client = _client(response_cache)
+
+        client.get("/cached/1/")
+        client.get("/cached/2/")
+        client.get("/cached/3/")
+        client.get("/cached/1/")
+
+        assert len(response_cache) == 2
+        assert cached_route.call_count == 4
+
+    def test_max_ttl(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        client = _client(ResponseCache(max_ttl_seconds=0))
+
+        client.get("/cached/1/")
+        client.get("/cached/1/")
+
+        assert cached_route.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_async_fresh_response_is_cached(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        transport = AsyncCachingTransport(MockTransport(router=router), ResponseCache())
+
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as client:
+            await client.get("/cached/1/")
+            response = await client.get("/cached/1/")
+
+        assert cached_route.call_count == 1
+        assert response.json() == {"id": 1}
+
+    @pytest.mark.asyncio
+    async def test_async_shared_tier_is_read_off_the_event_loop(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        response_cache = ResponseCache(shared_cache_alias="default")
+        transport = AsyncCachingTransport(MockTransport(router=router), response_cache)
+
+        with mock.patch.object(response_cache, "_get_shared", return_value=None) as mock_get_shared:
+            with mock.patch.object(response_cache, "_set_shared") as mock_set_shared:
+                async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as client:
+                    await client.get("/cached/1/")
+
+        assert mock_get_shared.call_count == mock_set_shared.call_count == 1
+
+
+class TestRevalidation:
+    def test_revalidated_response_is_not_from_cache(self):
+        def side_effect(request):
+            if request.headers.get("If-None-Match") == '"v1"':
+                return Response(304, headers={"ETag": '"v1"'})
+            return Response(200, json={"id": 1}, headers={"ETag": '"v1"', "Cache-Control": "no-cache"})
+
+        cached_route.side_effect = side_effect
+        client = _client()
+
+        client.get("/cached/1/")
+        response = client.get("/cached/1/")
+
+        # the upstream was called, so the response should still be counted in the request metrics
+        assert not response.extensions.get("from_cache")
+        assert response.extensions["revalidated"]
+
+
+class TestVary:
+    def test_responses_are_cached_per_vary_header_value(self):
+        def side_effect(request):
+            return Response(
+                200,
+                json={"tenant": request.headers.get("X-Tenant")},
+                headers={"Cache-Control": "max-age=60", "Vary": "X-Tenant"},
+            )
+
+        cached_route.side_effect = side_effect
+        client = _client()
+
+        first = client.get("/cached/1/", headers={"X-Tenant": "a"})
+        second = client.get("/cached/1/", headers={"X-Tenant": "b"})
+        third = client.get("/cached/1/", headers={"X-Tenant": "a"})
+
+        assert cached_route.call_count == 2
+        assert first.json() == third.json() == {"tenant": "a"}
+        assert second.json() == {"tenant": "b"}
+        assert third.extensions["from_cache"]
+
+    def test_vary_star_is_not_cached(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60", "Vary": "*"})
+        client = _client()
+
+        client.get("/cached/1/")
+        client.get("/cached/1/")
+
+        assert cached_route.call_count == 2
+
+
+class TestSharedTier:
+    def test_private_response_is_not_shared(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "private, max-age=60"})
+        response_cache = ResponseCache(shared_cache_alias="default")
+        client = _client(response_cache)
+
+        with mock.patch.object(response_cache, "_set_shared") as mock_set_shared:
+            client.get("/cached/1/")
+            response = client.get("/cached/1/")
+
+        mock_set_shared.assert_not_called()
+        assert response.extensions["from_cache"]
+
+    def test_authorized_response_is_not_shared(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        response_cache = ResponseCache(shared_cache_alias="default")
+        client = _client(response_cache)
+
+        with mock.patch.object(response_cache, "_set_shared") as mock_set_shared:
+            with mock.patch.object(response_cache, "_get_shared", return_value=None):
+                client.get("/cached/1/", headers={"Authorization": "Bearer token"})
+
+        mock_set_shared.assert_not_called()
+
+    def test_authorized_response_marked_public_is_shared(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "public, max-age=60"})
+        response_cache = ResponseCache(shared_cache_alias="default")
+        client = _client(response_cache)
+
+        with mock.patch.object(response_cache, "_set_shared") as mock_set_shared:
+            with mock.patch.object(response_cache, "_get_shared", return_value=None):
+                client.get("/cached/1/", headers={"Authorization": "Bearer token"})
+
+        mock_set_shared.assert_called_once()
+
+    def test_public_response_is_shared(self):
+        cached_route.return_value = Response(200, json={"id": 1}, headers={"Cache-Control": "max-age=60"})
+        response_cache = ResponseCache(shared_cache_alias="default")
+        client = _client(response_cache)
+
+        with mock.patch.object(response_cache, "_set_shared") as mock_set_shared:
+            with mock.patch.object(response_cache, "_get_shared", return_value=None):
+                client.get("/cached/1/")
+
+        mock_set_shared.assert_called_once()
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from common_lib.http_coalescing import AsyncCoalescingTransport, CoalescingTransport, SingleFlight
+
+BASE_URL = "http://test.coalesce.com/api/v1"
+
+
+class SlowTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """A transport that takes a while to respond, and counts the requests it receives"""
+
+    def __init__(self, delay_seconds: float = 0.1):
+        self.delay_seconds = delay_seconds
+        self.call_count = 0
+
+    def _response(self, url):
+        self.call_count += 1
+        return 200, [(b"content-type", b"text/plain")], httpx.ByteStream(url[3]), {}
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        time.sleep(self.delay_seconds)
+        return self._response(url)
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        await asyncio.sleep(self.delay_seconds)
+        return self._response(url)
+
+
+class TestCoalescingTransport:
+    def test_concurrent_requests_across_threads(self):
+        slow_transport = SlowTransport()
+        single_flight = SingleFlight()
+        responses = []
+
+        def make_request(correlation_id: int):
+            # each thread has its own client, as with get_client(), but they share the single flight group
+            client = httpx.Client(transport=CoalescingTransport(slow_transport, single_flight), base_url=BASE_URL)
+            response = client.get("/foo/1/", headers={"Blink-Correlation-Id": str(correlation_id)})
+            responses.append(response.text)
+
+        threads = [threading.Thread(target=make_request, args=(i,)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert slow_transport.call_count == 1
+        assert responses == ["/api/v1/foo/1/"] * 5
+
+    def test_different_urls_not_coalesced(self):
+        slow_transport = SlowTransport(delay_seconds=0)
+        client = httpx.Client(transport=CoalescingTransport(slow_transport, SingleFlight()), base_url=BASE_URL)
+
+        client.get("/foo/1/")
+        client.get("/foo/2/")
+
+        assert slow_transport.call_count == 2
+
+    def test_sequential_requests_not_coalesced(self):
+        slow_transport = SlowTransport(delay_seconds=0)
+        client = httpx.Client(transport=CoalescingTransport(slow_transport, SingleFlight()), base_url=BASE_URL)
+
+        client.get("/foo/1/")
+        client.get("/foo/1/")
+
+        assert slow_transport.call_count == 2
+
+    def test_errors_shared_with_waiters(self):
+        single_flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def failing_call():
+            started.set()
+            time.sleep(0.1)
+            raise httpx.ConnectError("upstream down")
+
+        def make_call(func):
+            try:
+                single_flight.do("key", func)
+            except httpx.ConnectError as ex:
+                errors.append(ex)
+
+        leader = threading.Thread(target=make_call, args=(failing_call,))
+        leader.start()
+        started.wait()
+        waiter = threading.Thread(target=make_call, args=(lambda: None,))
+        waiter.start()
+        leader.join()
+        waiter.join()
+
+        # the waiter got the leader's error, instead of making its own call
+        assert len(errors) == 2
+
+    def test_waiter_honors_its_own_read_timeout(self):
+        slow_transport = SlowTransport(delay_seconds=0.5)
+        single_flight = SingleFlight()
+        errors = []
+
+        def make_request(timeout: float):
+            client = httpx.Client(transport=CoalescingTransport(slow_transport, single_flight), base_url=BASE_URL)
+            try:
+                client.get("/foo/1/", timeout=timeout)
+            except httpx.ReadTimeout as ex:
+                errors.append(ex)
+
+        leader = threading.Thread(target=make_request, args=(5,))
+        leader.start()
+        time.sleep(0.05)
+        start_time = time.monotonic()
+        make_request(0.1)
+        waited_seconds = time.monotonic() - start_time
+        leader.join()
+
+        # the waiter gave up after its own timeout, while the leader's call still completed
+        assert len(errors) == 1
+        assert waited_seconds < 0.4
+        assert slow_transport.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_async_waiter_honors_its_own_read_timeout(self):
+        slow_transport = SlowTransport(delay_seconds=0.5)
+
+        async with httpx.AsyncClient(transport=AsyncCoalescingTransport(slow_transport), base_url=BASE_URL) as client:
+            leader = asyncio.ensure_future(client.get("/foo/1/"))
+            await asyncio.sleep(0)
+            with pytest.raises(httpx.ReadTimeout):
+                await client.get("/foo/1/", timeout=0.1)
+            response = await leader
+
+        assert response.status_code == 200
+        assert slow_transport.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_across_tasks(self):
+        slow_transport = SlowTransport()
+
+        async with httpx.AsyncClient(transport=AsyncCoalescingTransport(slow_transport), base_url=BASE_URL) as client:
+            responses = await asyncio.gather(*(client.get("/foo/1/") for _ in range(5)))
+
+        assert slow_transport.call_count == 1
+        assert [response.text for response in responses] == ["/api/v1/foo/1/"] * 5
+
+    @pytest.mark.asyncio
+    async def test_cancelled_leader_does_not_fail_waiters(self):
+        slow_transport = SlowTransport()
+
+        async with httpx.AsyncClient(transport=AsyncCoalescingTransport(slow_transport), base_url=BASE_URL) as client:
+            leader = asyncio.ensure_future(client.get("/foo/1/"))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(client.get("/foo/1/"))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            response = await waiter
+
+        assert response.status_code == 200
+        assert slow_transport.call_count == 1
@@ -0,0 +1,110 @@
+from copy import deepcopy
+from importlib import import_module
+from unittest import mock
+
+import pytest
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+
+from common_lib import blink_requests_async
+from common_lib.blink_requests_async import load_endpoints
+from common_lib.http_endpoints import EndpointRegistry, endpoint_registry
+from core.clients.mocks.foo_client_mocks import foo_router
+
+
+def _http_clients(**endpoints):
+    http_clients = deepcopy(settings.HTTP_CLIENTS)
+    http_clients["endpoints"].update(endpoints)
+    return http_clients
+
+
+class TestEndpointRegistry:
+    def test_builds_each_endpoint_once(self):
+        registry = EndpointRegistry()
+
+        with mock.patch("common_lib.http_endpoints.import_module", wraps=import_module) as mock_import:
+            foo = registry.get("foo")
+            assert registry.get("foo") is foo
+
+        mock_import.assert_called_once()
+        assert foo.mocked_router is foo_router
+        assert foo.base_url == settings.HTTP_CLIENTS["endpoints"]["foo"]["root_url"]
+
+    def test_reset_when_settings_change(self):
+        foo = endpoint_registry.get("foo")
+
+        with override_settings(HTTP_CLIENTS=_http_clients(bar={"root_url": "http://bar.com"})):
+            assert endpoint_registry.get("bar").base_url == "http://bar.com"
+
+        assert endpoint_registry.get("foo") is not foo
+
+    def test_all_errors_reported(self):
+        invalid_endpoints = {
+            "bar": {"root_url": "bar.com", "timeout": 2},
+            "baz": {"retries": {"max_retry": 2}, "log_body_sample_rate": 2},
+            "qux": {"mocked_transport": {"path": "core.clients.mocks.missing", "name": "router"}},
+        }
+
+        with override_settings(HTTP_CLIENTS=_http_clients(**invalid_endpoints)):
+            with pytest.raises(ImproperlyConfigured) as error:
+                EndpointRegistry().load()
+
+        message = str(error.value)
+        assert "bar: root_url must start with http:// or https://" in message
+        assert "bar: unknown option 'timeout'" in message
+        assert "baz: unknown key 'max_retry' in 'retries'" in message
+        assert "baz: log_body_sample_rate must be between 0 and 1" in message
+        assert "qux: ModuleNotFoundError" in message
+
+    def test_unknown_endpoint(self):
+        with pytest.raises(ImproperlyConfigured):
+            endpoint_registry.get("missing")
+
+
+class TestRoutes:
+    def _get_endpoint(self, **options):
+        with override_settings(HTTP_CLIENTS=_http_clients(bar={"root_url": "http://bar.com/api/v1/", **options})):
+            return EndpointRegistry().get("bar")
+
+    def test_ids_replaced_by_default(self):
+        endpoint = self._get_endpoint()
+
+        assert endpoint.get_route("/api/v1/foo/123/bars/") == "/foo/{id}/bars/"
+        assert endpoint.get_route("/api/v1/foo/0c6a41d2-9f2d-4bd6-a4a1-5d3a9b2c4e11/") == "/foo/{id}/"
+        assert endpoint.get_route("/api/v1") == "/"
+
+    def test_fixed_segments_kept(self):
+        endpoint = self._get_endpoint()
+
+        assert endpoint.get_route("/api/v1/oauth2/token/") == "/oauth2/token/"
+        assert endpoint.get_route("/api/v1/v2/foo/123/") == "/v2/foo/{id}/"
+        # a path outside the root_url keeps the root_url's segments
+        assert endpoint.get_route("/api/v1.1/foo/123/") == "/api/v1.1/foo/{id}/"
+        assert endpoint.get_route("/other/api/v1/foo/123/") == "/other/api/v1/foo/{id}/"
+
+    def test_route_templates(self):
+        endpoint = self._get_endpoint(routes=["/foo/{foo_id}/", "/foo/{foo_id}/bars/"])
+
+        assert endpoint.get_route("/api/v1/foo/abc/") == "/foo/{foo_id}/"
+        assert endpoint.get_route("/api/v1/foo/abc/bars/") == "/foo/{foo_id}/bars/"
+        assert endpoint.get_route("/api/v1/foo/abc/bars/1/") == "other"
+
+
+class TestLoadEndpoints:
+    def test_warm_connections(self):
+        endpoints = {
+            "bar": {"root_url": "http://bar.com", "shared_pool": True},
+            "baz": {"root_url": "", "shared_pool": True},
+            "qux": {"root_url": "http://qux.com"},
+        }
+
+        with override_settings(HTTP_CLIENTS=_http_clients(**endpoints)):
+            with mock.patch.object(blink_requests_async, "_get_shared_client") as mock_get_client:
+                mock_get_client.return_value.head.side_effect = Exception("connection refused")
+                load_endpoints(warm_connections=True)
+
+        # foo is mocked, baz has no url, and qux has per-thread clients, so only bar is warmed, and its failure doesn't
+        # stop startup
+        mock_get_client.assert_called_once_with("bar")
+        mock_get_client.return_value.head.assert_called_once_with("")
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from common_lib.http_recording import (
+    AsyncReplayTransport,
+    Recordings,
+    RecordingTransport,
+    ReplayMissError,
+    ReplayTransport,
+)
+
+BASE_URL = "http://test.recording.com/api/v1"
+
+
+def _upstream(request: httpx.Request) -> httpx.Response:
+    if request.url.path.endswith("/binary/"):
+        return httpx.Response(200, content=b"\xff\x00")
+    return httpx.Response(200, json={"path": request.url.path, "count": request.headers.get("count")})
+
+
+@pytest.fixture
+def recordings_path(tmp_path):
+    path = str(tmp_path / "recordings.jsonl")
+    client = httpx.Client(transport=RecordingTransport(httpx.MockTransport(_upstream), path), base_url=BASE_URL)
+    for count in range(2):
+        client.get("/foo/1/", headers={"count": str(count)})
+    client.get("/binary/")
+    return path
+
+
+class TestRecordAndReplay:
+    def test_replay_in_order(self, recordings_path):
+        recordings = Recordings(recordings_path)
+        client = httpx.Client(transport=ReplayTransport(recordings), base_url=BASE_URL)
+
+        counts = [client.get("/foo/1/").json()["count"] for _ in range(3)]
+
+        assert len(recordings) == 3
+        assert counts == ["0", "1", "0"]
+        assert client.get("/binary/").content == b"\xff\x00"
+
+    def test_replay_miss(self, recordings_path):
+        client = httpx.Client(transport=ReplayTransport(Recordings(recordings_path)), base_url=BASE_URL)
+
+        with pytest.raises(ReplayMissError):
+            client.get("/foo/2/")
+
+    def test_injected_latency(self, recordings_path):
+        client = httpx.Client(transport=ReplayTransport(Recordings(recordings_path), latency_ms=50), base_url=BASE_URL)
+
+        start_time = time.perf_counter()
+        client.get("/foo/1/")
+
+        assert time.perf_counter() - start_time >= 0.05
+
+    @pytest.mark.asyncio
+    async def test_async_replay(self, recordings_path):
+        transport = AsyncReplayTransport(Recordings(recordings_path), latency_ms=20)
+
+        async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as client:
+            start_time = time.perf_counter()
+            responses = await asyncio.gather(*(client.get("/foo/1/") for _ in range(5)))
+
+        # the injected latency doesn't block the event loop
+        assert time.perf_counter() - start_time < 0.1
+        assert [response.status_code for response in responses] == [200] * 5
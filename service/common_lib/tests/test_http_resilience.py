@@ -0,0 +1,235 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import pytest
+
+from common_lib.deadline import DeadlineExceededError, deadline
+from common_lib.http_resilience import (
+    AsyncResilientTransport,
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitStates,
+    ResilientTransport,
+    RetryBudget,
+    RetryPolicy,
+)
+
+BASE_URL = "http://test.resilience.com/api/v1"
+
+
+class ScriptedTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Returns the scripted status codes in order, raising any that are exceptions, then 200 for any extra requests"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.call_count = 0
+
+    def _next(self):
+        self.call_count += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else 200
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome, [], httpx.ByteStream(b""), {}
+
+    def handle_request(self, method, url, headers, stream, extensions):
+        return self._next()
+
+    async def handle_async_request(self, method, url, headers, stream, extensions):
+        return self._next()
+
+
+def _no_delay_policy(**kwargs) -> RetryPolicy:
+    return RetryPolicy(backoff_base_seconds=0, backoff_max_seconds=0, **kwargs)
+
+
+def _client(transport, circuit_breaker=None, retry_policy=None) -> httpx.Client:
+    resilient_transport = ResilientTransport(transport, "test", circuit_breaker, retry_policy)
+    return httpx.Client(transport=resilient_transport, base_url=BASE_URL)
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        events = []
+        transport = ScriptedTransport(500, 500, 500)
+        client = _client(transport, CircuitBreaker("test", failure_threshold=3, on_state_change=events.append))
+
+        for _ in range(3):
+            client.get("/foo/")
+        with pytest.raises(CircuitOpenError):
+            client.get("/foo/")
+
+        assert transport.call_count == 3
+        assert [event.tags["state"] for event in events] == [CircuitStates.open.value]
+
+    def test_success_resets_failures(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=2)
+        client = _client(ScriptedTransport(500, 200, 500), circuit_breaker)
+
+        for _ in range(3):
+            client.get("/foo/")
+
+        assert circuit_breaker.state == CircuitStates.closed
+
+    def test_half_open_recovery(self):
+        events = []
+        circuit_breaker = CircuitBreaker(
+            "test", failure_threshold=1, recovery_timeout_seconds=0, on_state_change=events.append
+        )
+        client = _client(ScriptedTransport(httpx.ConnectError("down"), 200), circuit_breaker)
+
+        with pytest.raises(httpx.ConnectError):
+            client.get("/foo/")
+        client.get("/foo/")
+
+        assert circuit_breaker.state == CircuitStates.closed
+        assert [event.tags["state"] for event in events] == ["open", "half_open", "closed"]
+
+    def test_half_open_failure_reopens(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout_seconds=0)
+        client = _client(ScriptedTransport(503, 503), circuit_breaker)
+
+        client.get("/foo/")
+        client.get("/foo/")
+
+        assert circuit_breaker.state == CircuitStates.open
+
+    def test_half_open_trial_out_of_time_frees_its_slot(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout_seconds=0)
+        client = _client(ScriptedTransport(503, DeadlineExceededError("out of time"), 200), circuit_breaker)
+
+        client.get("/foo/")
+        with pytest.raises(DeadlineExceededError):
+            client.get("/foo/")
+        assert circuit_breaker.state == CircuitStates.half_open
+
+        # the next request is allowed as a new trial, rather than rejected for the rest of the process
+        client.get("/foo/")
+        assert circuit_breaker.state == CircuitStates.closed
+
+    @pytest.mark.asyncio
+    async def test_half_open_trial_cancelled_frees_its_slot(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout_seconds=0)
+        transport = ScriptedTransport(503, asyncio.CancelledError(), 200)
+        resilient_transport = AsyncResilientTransport(transport, "test", circuit_breaker)
+
+        async with httpx.AsyncClient(transport=resilient_transport, base_url=BASE_URL) as client:
+            await client.get("/foo/")
+            with pytest.raises(asyncio.CancelledError):
+                await client.get("/foo/")
+            await client.get("/foo/")
+
+        assert circuit_breaker.state == CircuitStates.closed
+        assert transport.call_count == 3
+
+
+class TestRetryPolicy:
+    def test_retries_retryable_status(self):
+        transport = ScriptedTransport(503, 502, 200)
+        client = _client(transport, retry_policy=_no_delay_policy(max_retries=2))
+
+        with mock.patch("common_lib.http_resilience.statsd.increment") as mock_increment:
+            response = client.get("/foo/")
+
+        assert response.status_code == 200
+        assert transport.call_count == 3
+        mock_increment.assert_called_with("http.request.retry", tags=["client:test"])
+
+    def test_max_retries(self):
+        transport = ScriptedTransport(503, 503, 503, 503)
+        client = _client(transport, retry_policy=_no_delay_policy(max_retries=2))
+
+        response = client.get("/foo/")
+
+        assert response.status_code == 503
+        assert transport.call_count == 3
+
+    def test_no_retry_for_non_idempotent_status(self):
+        transport = ScriptedTransport(503)
+        client = _client(transport, retry_policy=_no_delay_policy())
+
+        response = client.post("/foo/", json={})
+
+        assert response.status_code == 503
+        assert transport.call_count == 1
+
+    def test_retry_non_idempotent_connect_error(self):
+        transport = ScriptedTransport(httpx.ConnectError("refused"))
+        client = _client(transport, retry_policy=_no_delay_policy())
+
+        response = client.post("/foo/", json={})
+
+        assert response.status_code == 200
+        assert transport.call_count == 2
+
+    def test_deadline_not_retried_or_counted(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1)
+        transport = ScriptedTransport(DeadlineExceededError("out of time"))
+        client = _client(transport, circuit_breaker, _no_delay_policy())
+
+        with pytest.raises(DeadlineExceededError):
+            client.get("/foo/")
+
+        assert transport.call_count == 1
+        assert circuit_breaker.state == CircuitStates.closed
+
+    def test_no_retry_when_backoff_outlasts_deadline(self):
+        transport = ScriptedTransport(503, 200)
+        retry_policy = RetryPolicy()
+        client = _client(transport, retry_policy=retry_policy)
+
+        with mock.patch.object(retry_policy, "get_delay", return_value=3), mock.patch(
+            "common_lib.http_resilience.time.sleep"
+        ) as mock_sleep, deadline(1):
+            response = client.get("/foo/")
+
+        # the backoff was 3 seconds, but only 1 second was left, so the failure is returned without waiting
+        assert response.status_code == 503
+        assert transport.call_count == 1
+        mock_sleep.assert_not_called()
+
+    def test_retry_within_deadline(self):
+        transport = ScriptedTransport(503, 200)
+        client = _client(transport, retry_policy=_no_delay_policy())
+
+        with deadline(1):
+            response = client.get("/foo/")
+
+        assert response.status_code == 200
+        assert transport.call_count == 2
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0, min_retries_per_second=0, max_tokens=1)
+        transport = ScriptedTransport(503, 503, 503)
+        client = _client(transport, retry_policy=_no_delay_policy(budget=budget))
+
+        client.get("/foo/")
+
+        # only a single retry was allowed, before the budget ran out
+        assert transport.call_count == 2
+
+    def test_retry_after_header(self):
+        policy = RetryPolicy(backoff_max_seconds=5)
+
+        assert policy.get_delay(0, [(b"Retry-After", b"3")]) == 3
+        assert policy.get_delay(0, [(b"Retry-After", b"30")]) == 5
+
+    def test_jittered_backoff(self):
+        policy = RetryPolicy(backoff_base_seconds=0.1, backoff_max_seconds=1)
+
+        assert all(0 <= policy.get_delay(2) <= 0.4 for _ in range(100))
+        assert all(0 <= policy.get_delay(10) <= 1 for _ in range(100))
+
+    @pytest.mark.asyncio
+    async def test_async_retries_and_breaker(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=3)
+        transport = ScriptedTransport(503, 503, 503)
+        resilient_transport = AsyncResilientTransport(transport, "test", circuit_breaker, _no_delay_policy())
+
+        async with httpx.AsyncClient(transport=resilient_transport, base_url=BASE_URL) as client:
+            response = await client.get("/foo/")
+            with pytest.raises(CircuitOpenError):
+                await client.get("/foo/")
+
+        assert response.status_code == 503
+        assert transport.call_count == 3
@@ -0,0 +1,39 @@
+import pytest
+
+from common_lib.errors import BlinkParsingError
+from common_lib.http_streaming import JsonArrayParser
+
+
+def _parse_chunks(*chunks) -> list:
+    parser = JsonArrayParser()
+    items = [item for chunk in chunks for item in parser.feed(chunk)]
+    return items + list(parser.close())
+
+
+class TestJsonArrayParser:
+    def test_items_split_across_chunks(self):
+        items = _parse_chunks('[{"id": 1, "na', 'me": "a"}, {"id"', ': 2}, "x,]"', ", [1, 2]]")
+
+        assert items == [{"id": 1, "name": "a"}, {"id": 2}, "x,]", [1, 2]]
+
+    def test_numbers_split_across_chunks(self):
+        assert _parse_chunks("[12", "34, 5", "6]") == [1234, 56]
+
+    def test_items_yielded_as_received(self):
+        parser = JsonArrayParser()
+
+        assert list(parser.feed('[{"id": 1}, {"id": ')) == [{"id": 1}]
+        assert list(parser.feed("2}")) == [{"id": 2}]
+        assert list(parser.feed("]")) == []
+        # only the unparsed text is buffered
+        assert parser._buffer == ""
+
+    def test_empty_array(self):
+        assert _parse_chunks(" [ ", " ] ") == []
+
+    @pytest.mark.parametrize(
+        "chunks", [['{"id": 1}'], ["[1, 2"], ["[1 2]"], ["[1]", "[2]"], ["[tru"], ["[1,", "]"], ["[,]"]]
+    )
+    def test_invalid(self, chunks):
+        with pytest.raises(BlinkParsingError):
+            _parse_chunks(*chunks)
@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from common_lib.latency_histogram import LatencyHistogram, LatencyHistograms, _get_highest_value, _get_index
+
+
+class TestLatencyHistogram:
+    def test_buckets_within_one_percent(self):
+        for value in [0, 255, 256, 511, 512, 10**6, 60 * 10**6]:
+            highest_value = _get_highest_value(_get_index(value))
+            assert value <= highest_value <= value * 1.01 + 1
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        values = list(range(1, 1001))
+        random.shuffle(values)
+        for value in values:
+            histogram.record(value)
+
+        assert histogram.percentile(50) == pytest.approx(500, rel=0.01)
+        assert histogram.percentile(99) == pytest.approx(990, rel=0.01)
+        assert histogram.percentile(100) == 1000
+
+    def test_summary(self):
+        histogram = LatencyHistogram()
+        assert histogram.summary() == {"count": 0}
+
+        histogram.record(1.5)
+        histogram.record(2.5)
+
+        summary = histogram.summary()
+        assert summary["count"] == 2
+        assert (summary["min"], summary["max"], summary["mean"]) == (1.5, 2.5, 2.0)
+        assert summary["p99.9"] == 2.5
+
+    def test_dump_by_name_and_tags(self):
+        histograms = LatencyHistograms()
+        histograms.record("duration", 1, ["route:/{id}/"])
+        histograms.record("duration", 2, ["route:/{id}/"])
+        histograms.record("duration", 3, ["route:/"])
+
+        dump = histograms.dump(reset=True)
+
+        assert [(item["tags"], item["count"]) for item in dump] == [(["route:/"], 1), (["route:/{id}/"], 2)]
+        assert histograms.dump() == []
@@ -0,0 +1,139 @@
+import os
+import socket
+from unittest import mock
+
+import pytest
+from django.test import override_settings
+
+from common_lib.metrics import MetricsAggregator, statsd
+
+
+@pytest.fixture(scope="function")
+def udp_server():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(2)
+    yield server
+    server.close()
+
+
+def _receive_lines(server: socket.socket) -> list:
+    lines = []
+    server.settimeout(0.2)
+    try:
+        while True:
+            lines += server.recv(65535).decode().split("\n")
+    except socket.timeout:
+        return lines
+
+
+class TestMetricsAggregator:
+    @pytest.fixture(scope="function")
+    def aggregator(self, udp_server):
+        aggregator = MetricsAggregator(
+            host="127.0.0.1",
+            port=udp_server.getsockname()[1],
+            namespace="test",
+            constant_tags=["service:test"],
+            flush_interval_seconds=60,
+        )
+        yield aggregator
+        aggregator.stop()
+
+    def test_aggregates_into_one_packet(self, aggregator, udp_server):
+        for _ in range(3):
+            aggregator.increment("requests", tags=["status:200"])
+        aggregator.increment("requests", value=2, tags=["status:500"])
+        aggregator.decrement("in_flight")
+        aggregator.gauge("pool.in_use", 3)
+        aggregator.gauge("pool.in_use", 5)
+        aggregator.timing("duration", 12.5, tags=["route:/{id}/"])
+        aggregator.timing("duration", 7, tags=["route:/{id}/"])
+
+        aggregator.flush()
+
+        packet = udp_server.recv(65535).decode()
+        assert sorted(packet.split("\n")) == [
+            "test.duration:12.5|ms|#service:test,route:/{id}/",
+            "test.duration:7|ms|#service:test,route:/{id}/",
+            "test.in_flight:-1|c|#service:test",
+            "test.pool.in_use:5|g|#service:test",
+            "test.requests:2|c|#service:test,status:500",
+            "test.requests:3|c|#service:test,status:200",
+        ]
+
+    def test_flush_resets(self, aggregator, udp_server):
+        aggregator.increment("requests")
+        aggregator.flush()
+        aggregator.flush()
+
+        assert _receive_lines(udp_server) == ["test.requests:1|c|#service:test"]
+
+    def test_splits_packets_at_max_size(self, udp_server):
+        aggregator = MetricsAggregator(host="127.0.0.1", port=udp_server.getsockname()[1], max_packet_size=100)
+        for i in range(20):
+            aggregator.increment(f"metric.{i}")
+        aggregator.flush()
+        aggregator.stop()
+
+        packets = []
+        udp_server.settimeout(0.2)
+        try:
+            while True:
+                packets.append(udp_server.recv(65535))
+        except socket.timeout:
+            pass
+        assert len(packets) > 1
+        assert all(len(packet) <= 100 for packet in packets)
+        assert sorted(line for packet in packets for line in packet.decode().split("\n")) == sorted(
+            f"metric.{i}:1|c" for i in range(20)
+        )
+
+    def test_samples_timings_past_max_samples(self, udp_server):
+        aggregator = MetricsAggregator(host="127.0.0.1", port=udp_server.getsockname()[1], max_samples=10)
+        for i in range(40):
+            aggregator.timing("duration", i)
+        aggregator.stop()
+
+        lines = _receive_lines(udp_server)
+        assert len(lines) == 10
+        assert all(line.endswith("|ms|@0.25") for line in lines)
+
+    def test_send_failure_ignored(self):
+        aggregator = MetricsAggregator(host="invalid.host.local", port=1)
+        aggregator.increment("requests")
+        aggregator.stop()
+
+    def test_lock_recreated_after_fork(self, aggregator):
+        # a lock held by another thread when the process forks is never released in the child
+        with aggregator._lock:
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if aggregator._lock.acquire(timeout=1) else 1)
+
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+
+
+class TestStatsd:
+    def test_uses_statsd_by_default(self):
+        with override_settings(METRICS={"statsd": {}}):
+            with mock.patch("common_lib.metrics._statsd") as mock_statsd:
+                statsd.increment("requests", tags=["a:b"])
+
+            mock_statsd.increment.assert_called_once_with("requests", value=1, tags=["a:b"], sample_rate=1)
+
+    def test_uses_aggregator_when_enabled(self, udp_server):
+        metrics = {
+            "namespace": "test",
+            "statsd": {"hostname": "127.0.0.1", "port": udp_server.getsockname()[1], "constant_tags": {"env": "t"}},
+            "aggregation": {"enabled": True, "flush_interval_seconds": 60},
+        }
+        with override_settings(METRICS=metrics):
+            with mock.patch("common_lib.metrics._statsd") as mock_statsd:
+                statsd.increment("requests")
+                statsd.timing("duration", 5)
+                statsd.flush()
+
+            mock_statsd.increment.assert_not_called()
+            assert sorted(_receive_lines(udp_server)) == ["test.duration:5|ms|#env:t", "test.requests:1|c|#env:t"]
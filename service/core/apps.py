@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CoreConfig(AppConfig):
     name = "core"
+
+    def ready(self):
+        import core.events  # noqa: F401 (defines events, so they are registered before being validated)
+        from common_lib.blink_requests_async import load_endpoints
+        from common_lib.event import event_registry
+
+        # validate the http client settings at startup, and connect to upstreams before the pod reports healthy
+        load_endpoints(warm_connections=settings.IS_API_NODE and settings.HTTP_CLIENTS.get("warm_connections", False))
+
+        # check every event's metric definition refers to its fields
+        event_registry.validate()
@@ -1,4 +1,6 @@
-from common_lib.blink_requests_async import get_client, get_response
+from typing import List
+
+from common_lib.blink_requests_async import BatchResult, gather_batch, get_client, get_response, run_async_as_sync
 from common_lib.errors import BlinkError
 from core.dtos import Foo
 
@@ -25,3 +27,18 @@ async def get_foo_async(foo_id: str) -> Foo:
         return Foo.from_json(get_response(response)).validate()
     except Exception as ex:
         raise BlinkError(f"Failed to get foo data. {ex}")
+
+
+async def get_foos_async(
+    foo_ids: List[str], max_concurrency: int = 10, timeout_seconds: float = None
+) -> List[BatchResult]:
+    """
+    Get many foos concurrently, returning a result for each id, in order, with either the Foo or its error
+
+    :param timeout_seconds: if set, the max time getting a single foo can take, after which its result is the timeout
+    """
+    return await gather_batch(get_foo_async, foo_ids, max_concurrency=max_concurrency, timeout_seconds=timeout_seconds)
+
+
+def get_foos(foo_ids: List[str], max_concurrency: int = 10, timeout_seconds: float = None) -> List[BatchResult]:
+    return run_async_as_sync(get_foos_async)(foo_ids, max_concurrency, timeout_seconds)
@@ -1,10 +1,12 @@
 import json
+from unittest import mock
 import pytest
+from httpx import Response
 from django.conf import settings
 from common_lib.errors import BlinkError
 from common_lib.mock_http_response import MockHttpResponse
-from core.clients.foo_client import get_foo, get_foo_async
-from core.clients.mocks.foo_client_mocks import get_foo_data, get_foo_route
+from core.clients.foo_client import get_foo, get_foo_async, get_foos
+from core.clients.mocks.foo_client_mocks import get_foo_data, get_foo_route, get_foo_side_effect
 from core.dtos import Foo
 
 # Retrieves the base url from settings file
@@ -42,3 +44,27 @@ async def test_retrieve_foo_failed_async():
     with pytest.raises(BlinkError):
         with MockHttpResponse(get_foo_route, 404, {}, assert_called=True):
             response = await get_foo_async(foo_data["id"])
+
+
+def test_retrieve_foos_partial_failure():
+    def side_effect(request):
+        if request.url.path.endswith("/bad/"):
+            return Response(404, json={})
+        return get_foo_side_effect(request)
+
+    with MockHttpResponse(get_foo_route, side_effect=side_effect, assert_called=True):
+        results = get_foos(["foo1", "bad", "foo2", "foo1"])
+
+    assert [result.key for result in results] == ["foo1", "bad", "foo2", "foo1"]
+    assert [result.is_success for result in results] == [True, False, True, True]
+    assert results[0].value.id == "foo1"
+    assert isinstance(results[1].error, BlinkError)
+    # duplicate ids are only requested once
+    assert get_foo_route.call_count == 3
+
+
+def test_retrieve_foos_timeout_passed_through():
+    with mock.patch("core.clients.foo_client.gather_batch", return_value=[]) as mock_gather_batch:
+        get_foos(["foo1"], max_concurrency=5, timeout_seconds=1.5)
+
+    assert mock_gather_batch.call_args.kwargs == {"max_concurrency": 5, "timeout_seconds": 1.5}
@@ -16,7 +16,11 @@ class WidgetCreatedEvent(Event):
     message = "Widget creation succeeded"
     log_level = logging.INFO
     emit_metric = True
-    metric_tags = ["public_id", "status?"]
+    metric_tags = ["status"]
+    high_cardinality_fields = ["public_id"]
+    # fires on every write, so logs are capped at peak (the metric still counts every widget)
+    log_max_per_second = 20
+    log_burst_size = 100
 
 
 class WidgetCreateFailedEvent(Event):
@@ -25,4 +29,5 @@ class WidgetCreateFailedEvent(Event):
     message = "Widget creation failed"
     log_level = logging.ERROR
     emit_metric = True
-    metric_tags = ["public_id", "status?"]
+    metric_tags = ["status"]
+    high_cardinality_fields = ["public_id"]
@@ -0,0 +1,20 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from common_lib.event import event_registry
+
+
+class Command(BaseCommand):
+    help = "Export every event, with its fields, log and metric, as JSON (such as for building dashboards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", type=str, required=False, help="File to write to, instead of stdout")
+
+    def handle(self, *args, **options):
+        catalog = json.dumps({"events": event_registry.get_catalog()}, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(catalog + "\n")
+        else:
+            self.stdout.write(catalog)
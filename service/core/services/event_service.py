@@ -1,11 +1,24 @@
 import logging
+import threading
+from typing import Dict, Hashable, List, Optional, Tuple
 
-from blink_logging_metrics.metrics import statsd
+from django.conf import settings
+from django.core.signals import setting_changed
 from django.db import transaction
+from django.dispatch import receiver
 
+from common_lib.blink_requests_async import get_correlation_id
 from common_lib.event import Event
+from common_lib.event_limiter import event_limiter
+from common_lib.event_pipeline import EventPipeline
+from common_lib.metrics import statsd
 
 _logger = logging.getLogger(__name__)
+_pipeline: Optional[EventPipeline] = None
+_pipeline_loaded = False  # settings are only read once, since this is checked for every event
+_commit_buffer_size: Optional[int] = None
+_commit_buffer_loaded = False
+_thread_local = threading.local()
 
 
 def record_event(event: Event, on_commit=True):
@@ -16,6 +29,9 @@ def record_event(event: Event, on_commit=True):
     successfully before recording the event.  For error events though, they will always be logged immediately, since
     the commit would not be completed.
 
+    Events waiting on a commit are buffered for the transaction (see _CommitBuffer), so a bulk operation registers a
+    single on_commit callback, rather than one for each event.
+
     :param event: The event to record
     :param on_commit: Whether or not to send the tick after transaction is committed
     """
@@ -24,19 +40,176 @@ def record_event(event: Event, on_commit=True):
         on_commit = False
 
     if on_commit:
-        transaction.on_commit(lambda: _record_event(event))
+        if not _buffer_for_commit(event):
+            transaction.on_commit(lambda: _record_event(event))
     else:
         _record_event(event)
 
 
+class _CommitBuffer:
+    """
+    The events recorded in a transaction (or savepoint), to be recorded together when it commits
+
+    Metric increments with the same name and tags are summed, and identical events (with the same name and tags) are
+    logged once, with the number of times they occurred.  At most max_events distinct logs and metrics are kept, and
+    any more are dropped, counted with the event.commit_buffer.overflow metric when the buffer is flushed.
+    """
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self.logs: Dict[Hashable, List] = {}  # [event, occurrences], in the order they were first recorded
+        self.metrics: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        self.overflow = 0
+        self.flushed = False
+
+    def add(self, event: Event):
+        if event.log_level and _logger.isEnabledFor(event.log_level):
+            log_key = _get_log_key(event)
+            log_entry = self.logs.get(log_key)
+            if log_entry is not None:
+                log_entry[1] += 1
+            elif len(self.logs) < self.max_events:
+                self.logs[log_key] = [event, 1]
+            else:
+                self.overflow += 1
+
+        if event.emit_metric:
+            metric_key = (event.event_name, tuple(event.metric_tag_values or ()))
+            if metric_key in self.metrics or len(self.metrics) < self.max_events:
+                self.metrics[metric_key] = self.metrics.get(metric_key, 0) + _get_increment(event)
+            else:
+                self.overflow += 1
+
+    def flush(self):
+        self.flushed = True
+        for event, occurrences in self.logs.values():
+            _log_event(event, occurrences)
+        for (name, tags), value in self.metrics.items():
+            _emit_metric(name, value, list(tags) or None)
+
+        if self.overflow:
+            statsd.increment("event.commit_buffer.overflow", value=self.overflow)
+            _logger.warning(f"Dropped {self.overflow} events, after buffering {self.max_events} in one transaction")
+
+
+def _get_log_key(event: Event) -> Hashable:
+    log_key = (event.event_name, tuple(event.tags.items()))
+    try:
+        hash(log_key)
+        return log_key
+    except TypeError:
+        # tags that can't be hashed can't be compared cheaply, so the event is logged on its own
+        return id(event)
+
+
+def _buffer_for_commit(event: Event) -> bool:
+    """
+    Add an event to the buffer for the current transaction and savepoint, returning False if it can't be buffered
+
+    Each savepoint gets its own buffer, so events from a savepoint that is rolled back are discarded with it.  Django
+    replaces its list of on_commit callbacks when a transaction commits or rolls back, which is used to tell when the
+    buffers for the last transaction are done.
+    """
+    max_events = _get_commit_buffer_size()
+    connection = transaction.get_connection()
+    if not max_events or not connection.in_atomic_block:
+        return False
+
+    buffers = getattr(_thread_local, "commit_buffers", None)
+    if buffers is None or buffers[0] is not connection.run_on_commit:
+        buffers = _thread_local.commit_buffers = (connection.run_on_commit, {})
+
+    savepoint_ids = tuple(connection.savepoint_ids)
+    commit_buffer = buffers[1].get(savepoint_ids)
+    is_new_buffer = commit_buffer is None or commit_buffer.flushed
+    if is_new_buffer:
+        commit_buffer = buffers[1][savepoint_ids] = _CommitBuffer(max_events)
+    commit_buffer.add(event)
+    # registered after the event is added, in case on_commit runs the callback immediately
+    if is_new_buffer:
+        transaction.on_commit(commit_buffer.flush)
+    return True
+
+
+def _get_commit_buffer_size() -> Optional[int]:
+    """Get the max events buffered for each transaction, from settings.EVENT_COMMIT_BUFFER, or None if disabled"""
+    global _commit_buffer_size, _commit_buffer_loaded
+    if not _commit_buffer_loaded:
+        buffer_config = getattr(settings, "EVENT_COMMIT_BUFFER", None) or {}
+        _commit_buffer_size = buffer_config.get("max_events") if buffer_config.get("enabled") else None
+        _commit_buffer_loaded = True
+    return _commit_buffer_size
+
+
+def _get_pipeline() -> Optional[EventPipeline]:
+    """Get the background event pipeline, if enabled in settings.EVENT_PIPELINE"""
+    global _pipeline, _pipeline_loaded
+    if not _pipeline_loaded:
+        pipeline_config = getattr(settings, "EVENT_PIPELINE", None) or {}
+        if pipeline_config.get("enabled"):
+            _pipeline = EventPipeline(
+                max_queue_size=pipeline_config.get("max_queue_size", 10000),
+                flush_interval_seconds=pipeline_config.get("flush_interval_seconds", 1.0),
+            )
+        _pipeline_loaded = True
+    return _pipeline
+
+
+@receiver(setting_changed)
+def _reset_settings(setting, **kwargs):
+    global _pipeline, _pipeline_loaded, _commit_buffer_loaded
+    if setting == "EVENT_PIPELINE":
+        if _pipeline is not None:
+            _pipeline.stop()
+        _pipeline, _pipeline_loaded = None, False
+    elif setting == "EVENT_COMMIT_BUFFER":
+        _commit_buffer_loaded = False
+
+
 def _record_event(event: Event):
-    # log the event if there is a log level
-    if event.log_level:
-        log_message = f"{event.event_name}: {event.message}" if event.message else event.event_name
-        _logger.log(event.log_level, log_message, extra=event.tags)
+    _log_event(event)
 
     # emit the metric, if requested
     if event.emit_metric:
-        tags = [f"{tag}:{event.tags[tag]}" for tag in event.metric_tags] if event.metric_tags else None
-        increment_by = event.tags[event.metric_increment_field] if event.metric_increment_field else 1
-        statsd.increment(event.event_name, value=increment_by, tags=tags)
+        immediate = event.log_level >= logging.ERROR
+        _emit_metric(event.event_name, _get_increment(event), event.metric_tag_values, immediate)
+
+
+def _get_increment(event: Event):
+    return event.tags[event.metric_increment_field] if event.metric_increment_field else 1
+
+
+def _log_event(event: Event, occurrences: int = 1):
+    # log the event if there is a log level, unless it's sampled out or rate limited (errors are always logged).  The
+    # message is only formatted if the event is logged
+    if not event.log_level or not _logger.isEnabledFor(event.log_level):
+        return
+
+    log_extra = event.tags
+    if event.log_level < logging.ERROR:
+        should_log, suppressed_count = event_limiter.allow(event)
+        if not should_log:
+            return
+        if suppressed_count:
+            log_extra = {**log_extra, "suppressed_count": suppressed_count}
+    if occurrences > 1:
+        log_extra = {**log_extra, "occurrences": occurrences}
+
+    # errors are recorded immediately, so they can't be delayed or dropped by the pipeline
+    pipeline = _get_pipeline()
+    if pipeline is not None and event.log_level < logging.ERROR:
+        # the record is handled on the pipeline's thread, so it keeps the correlation id of the thread recording it
+        log_extra = {**log_extra, "blink_correlation_id": get_correlation_id()}
+        message = event.log_message
+        record = _logger.makeRecord(_logger.name, event.log_level, __file__, 0, message, None, None, extra=log_extra)
+        pipeline.submit_log(_logger, record)
+    else:
+        _logger.log(event.log_level, event.log_message, extra=log_extra)
+
+
+def _emit_metric(name: str, value, tags: Optional[List[str]], immediate: bool = False):
+    pipeline = None if immediate else _get_pipeline()
+    if pipeline is not None:
+        pipeline.submit_metric(name, value, tuple(tags or ()))
+    else:
+        statsd.increment(name, value=value, tags=tags)
@@ -1,9 +1,15 @@
 import logging
+import threading
 from unittest import mock
 
 import pytest
+from django.db import transaction
+from django.db.transaction import on_commit
+from django.test import override_settings
 
 from common_lib.event import Event
+from common_lib.event_pipeline import EventPipeline
+from common_lib.logging_filters import add_blink_correlation_id
 from core.services import event_service
 
 
@@ -65,3 +71,135 @@ class TestRecordEvent:
         # assert
         mock_statsd.assert_called_once()
         assert "Test event message" in caplog.text
+
+    def test_pipeline(self, caplog, mock_statsd):
+        # arrange
+        event = LogOnlyEvent(test_tag="Log")
+        event.emit_metric = True
+        event.metric_tags = ["test_tag"]
+        pipeline = EventPipeline(flush_interval_seconds=60)
+
+        # act
+        with mock.patch("core.services.event_service._get_pipeline", return_value=pipeline), mock.patch(
+            "common_lib.event_pipeline.statsd.increment"
+        ) as mock_pipeline_statsd:
+            event_service.record_event(event, on_commit=False)
+            mock_pipeline_statsd.assert_not_called()
+            pipeline.stop()
+
+        # assert
+        mock_statsd.assert_not_called()
+        mock_pipeline_statsd.assert_called_once_with("test.event", value=1, tags=["test_tag:Log"])
+        assert "Test event message" in caplog.text
+
+    def test_pipeline_keeps_correlation_id(self, caplog, mock_statsd):
+        # arrange
+        pipeline = EventPipeline(flush_interval_seconds=60)
+        current_thread = threading.current_thread()
+        current_thread.blink_correlation_id = "test-correlation-id"
+
+        # act
+        try:
+            with mock.patch("core.services.event_service._get_pipeline", return_value=pipeline):
+                event_service.record_event(LogOnlyEvent(test_tag="Log"), on_commit=False)
+        finally:
+            del current_thread.blink_correlation_id
+        pipeline.stop()
+
+        # assert
+        record = next(r for r in caplog.records if r.getMessage() == "test.event: Test event message")
+        assert record.blink_correlation_id == "test-correlation-id"
+        # the logging filter runs on the pipeline's thread, which has no correlation id of its own
+        filter_thread = threading.Thread(target=add_blink_correlation_id, args=(record,))
+        filter_thread.start()
+        filter_thread.join()
+        assert record.blink_correlation_id == "test-correlation-id"
+
+    def test_pipeline_skipped_for_errors(self, caplog, mock_statsd):
+        # arrange
+        event = LogOnlyEvent(test_tag="Error")
+        event.log_level = logging.ERROR
+        pipeline = mock.Mock()
+
+        # act
+        with mock.patch("core.services.event_service._get_pipeline", return_value=pipeline):
+            event_service.record_event(event)
+
+        # assert
+        pipeline.submit_log.assert_not_called()
+        assert "Test event message" in caplog.text
+
+    def test_rate_limited(self, caplog, mock_statsd):
+        # arrange
+        class LimitedEvent(LogOnlyEvent):
+            event_name = "test.limited"
+            emit_metric = True
+            log_max_per_second = 1
+            log_burst_size = 1
+
+        # act
+        for i in range(3):
+            event_service.record_event(LimitedEvent(test_tag=i), on_commit=False)
+
+        # assert
+        assert mock_statsd.call_count == 3 + 2  # every event's metric, and each suppressed event
+        assert caplog.text.count("Test event message") == 1
+
+
+@pytest.mark.django_db
+class TestCommitBuffer:
+    @pytest.fixture(scope="function", autouse=True)
+    def real_on_commit(self):
+        # the autouse mock_on_commit fixture runs callbacks immediately, but these tests need them to wait for a commit
+        with mock.patch("django.db.transaction.on_commit", on_commit), override_settings(
+            EVENT_COMMIT_BUFFER={"enabled": True, "max_events": 3}
+        ):
+            yield
+
+    @pytest.fixture(scope="function")
+    def mock_statsd(self):
+        with mock.patch("core.services.event_service.statsd.increment") as mock_statsd:
+            yield mock_statsd
+
+    def test_single_callback_with_aggregated_metrics(self, caplog, mock_statsd, django_capture_on_commit_callbacks):
+        # arrange
+        class MetricEvent(LogOnlyEvent):
+            event_name = "test.buffered"
+            emit_metric = True
+            metric_tags = ["test_tag"]
+
+        # act
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            for i in range(100):
+                event_service.record_event(MetricEvent(test_tag=i % 2))
+            mock_statsd.assert_not_called()
+
+        # assert
+        assert len(callbacks) == 1
+        assert mock_statsd.call_count == 2
+        mock_statsd.assert_any_call("test.buffered", value=50, tags=["test_tag:0"])
+        mock_statsd.assert_any_call("test.buffered", value=50, tags=["test_tag:1"])
+        assert [record.occurrences for record in caplog.records] == [50, 50]
+
+    def test_overflow(self, caplog, mock_statsd, django_capture_on_commit_callbacks):
+        # act
+        with django_capture_on_commit_callbacks(execute=True):
+            for i in range(5):
+                event_service.record_event(LogOnlyEvent(test_tag=i))
+
+        # assert
+        assert caplog.text.count("Test event message") == 3
+        mock_statsd.assert_called_once_with("event.commit_buffer.overflow", value=2)
+
+    def test_rolled_back_savepoint_discarded(self, caplog, mock_statsd, django_capture_on_commit_callbacks):
+        # act
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            event_service.record_event(LogOnlyEvent(test_tag="committed"))
+            with pytest.raises(ValueError):
+                with transaction.atomic():
+                    event_service.record_event(LogOnlyEvent(test_tag="rolled back"))
+                    raise ValueError()
+
+        # assert
+        assert len(callbacks) == 1
+        assert [record.test_tag for record in caplog.records] == ["committed"]
@@ -9,5 +9,5 @@ _logger = logging.getLogger(__name__)
 
 def create_widget(name: str):
     widget = Widget.objects.create(name=name)
-    record_event(WidgetCreatedEvent(name=widget.name))
+    record_event(WidgetCreatedEvent(public_id=str(widget.public_id), status=None))
     return widget
@@ -0,0 +1,16 @@
+from common_lib.event import event_registry
+from core.events import WidgetCreatedEvent
+
+
+def test_event_definitions_valid():
+    # events defined by tests are registered too, and some are invalid on purpose
+    event_classes = [cls for cls in event_registry.get_event_classes() if ".tests." not in cls.__module__]
+
+    assert WidgetCreatedEvent in event_classes
+    assert [error for cls in event_classes for error in cls.get_definition_errors()] == []
+
+
+def test_widget_public_id_not_a_metric_tag():
+    event = WidgetCreatedEvent(public_id="b839b1ab-0bf7-4a57-a421-8a5017de8292", status=None)
+
+    assert event.metric_tag_values == ["status:None"]
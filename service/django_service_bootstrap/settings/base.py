@@ -77,6 +77,8 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + SERVICE_APPS
 MIDDLEWARE = [
     # must be first, to ensure all logs have a blink_correlation_id
     "blink_logging_metrics.logging.middleware.RequestCorrelationIdMiddleware",
+    # should be near the top, so the request's deadline starts as soon as it's received
+    "common_lib.middleware.deadline_middleware.DeadlineMiddleware",
     # should be at/near the top, so that the timing cover all middleware as well
     "blink_logging_metrics.logging.middleware.RequestLoggingMiddleware",
     # should be at/near the top, so that any middleware DB access is tracked
@@ -121,10 +123,14 @@ WSGI_APPLICATION = "django_service_bootstrap.wsgi.application"
 # blink_logging_metrics middleware settings
 HTTP_LOG_HEADERS = True  # whether to log request/response headers
 HTTP_MAX_LOG_PAYLOAD = 2000  # payloads larger than this many characters will be truncated when logging responses
+HTTP_LOG_BODY_SAMPLE_RATE = 1.0  # fraction of outbound request/response bodies to log.  errors are always logged
 HTTP_IGNORED_LOG_PATHS = ["/healthcheck/"]  # do not write out standard logs or metrics for these paths
 QUERY_COUNT_LOG_QUERIES = False  # if true, log every individual query run, and not just totals
 REQUEST_QUERY_COUNT_MAX_COUNT = 20  # log a warning if any request uses more counts than this
 
+# outbound calls fail once a request has run this long, to stay under the load balancer's 60 second timeout
+REQUEST_DEADLINE_SECONDS = 55
+
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
@@ -196,7 +202,11 @@ LOGGING = {
     "formatters": {"standard": {"()": "logging.Formatter"}, "json": {"()": jsonlogger.JsonFormatter}},
     # filters can be used to both filter out some logs, as well as update or add to them
     "filters": {
-        "add_blink_correlation_id": {"()": CB_FILTER, "callback": logging_filters.add_blink_correlation_id},
+        # keeps a correlation id already on the record, such as from events logged on the event pipeline's thread
+        "add_blink_correlation_id": {
+            "()": CB_FILTER,
+            "callback": "ext://common_lib.logging_filters.add_blink_correlation_id",
+        },
         "add_log_level": {"()": CB_FILTER, "callback": logging_filters.add_log_level},
         "ignore_if_warning_level": {"()": CB_FILTER, "callback": logging_filters.ignore_if_warning_level},
         "ignore_paths": {"()": logging_filters.IgnorePathsFilter, "ignore_paths": []},
@@ -240,6 +250,13 @@ LOGGING = {
     },
 }
 
+# events recorded on commit are buffered for each transaction, and recorded by a single on_commit callback.  Identical
+# events are logged once, and metrics with the same name and tags are summed.  Past max_events, events are dropped
+EVENT_COMMIT_BUFFER = {"enabled": True, "max_events": 1000}
+
+# record non-error events on a background thread, batching logs and combining metric increments for each flush
+EVENT_PIPELINE = {"enabled": False, "max_queue_size": 10000, "flush_interval_seconds": 1.0}
+
 # metrics
 METRICS = {
     "provider": "datadog",
@@ -251,6 +268,13 @@ METRICS = {
             # environment is set by the statsd service ('dev', 'staging' or 'production')
         },
     },
+    # sum counters and collect timings in process, sending them in multi-metric UDP packets every flush interval
+    "aggregation": {
+        "enabled": False,
+        "flush_interval_seconds": 1.0,
+        # "max_packet_size": 1432,  # bytes in each UDP packet
+        # "max_samples": 1000,  # timing values sent for each metric and tags in a flush, past which they are sampled
+    },
 }
 
 # topic configuration for message consumer
@@ -277,15 +301,66 @@ QUEUES_CONFIG = {
 }
 TOPIC_CONFIG = BlinkTopic.load_from_config(QUEUES_CONFIG)
 
+# handle consumed messages on a pool of workers, so a slow handler doesn't hold up the messages behind it
+MESSAGE_CONSUMER = {
+    "workers": 0,  # 0 handles each message on the consumer's thread, one at a time
+    "run_consumer_workers": 4,  # workers for the run_consumer command, which has its process to itself
+    "mode": "thread",  # or "process", for CPU bound handlers
+    "max_pending": 20,  # messages received but not yet handled, before the consumer waits for a worker
+    "type_concurrency": {
+        # the most messages of a type to handle at once, by message full name
+        # Ex: "foo.pending_submission": 2,
+    },
+    "drain_timeout_seconds": 30,  # how long to wait for messages to be handled, when shutting down
+    # the fraction of messages to log the full payload of, when they're received.  Failures always log the payload
+    "payload_log_sample_rate": 0.0,
+    # for the run_consumer command: how often to gauge the number of messages waiting in each SQS topic, or 0 to not
+    # report it
+    "backlog_interval_seconds": 60,
+    # run the consumer in each API node.  Set to false when it runs in its own pods, with the run_consumer command
+    "run_in_api": os.environ.get("MESSAGE_CONSUMER_IN_API", "true").lower() == "true",
+    # for the run_consumer command: the port for its health and status endpoints, and how often it reports its load
+    "health_port": 8001,
+    "status_interval_seconds": 10,
+}
+
 # http clients
 HTTP_CLIENTS = {
+    # records events from the clients, such as circuit breaker state changes
+    "event_recorder": {"path": "core.services.event_service", "name": "record_event"},
+    # run async clients for all threads on one background event loop, instead of an event loop per thread
+    "background_event_loop": False,
+    # on API nodes, open a connection to each endpoint with a shared_pool at startup, so the first requests after a
+    # deploy aren't slower
+    "warm_connections": False,
     "endpoints": {
         "foo": {
             "root_url": "",
             "default_timeout_seconds": 2.0,
+            # override specific timeouts, ex: {"connect": 0.5, "read": 2.0, "write": 2.0, "pool": 0.5}
+            "timeouts": None,
+            "http2": False,  # multiplex concurrent requests over one connection, if the upstream supports HTTP/2
+            # connection pool limits, ex: {"max_connections": 100, "max_keepalive_connections": 20, "keepalive_expiry": 5}
+            "limits": None,
             "auth": {"username": None, "password": None},
             "num_retries": 0,
             "mocked_transport": None,
+            "log_body_sample_rate": None,  # fraction of bodies to log, defaulting to HTTP_LOG_BODY_SAMPLE_RATE
+            "log_streamed_body": False,  # read streamed bodies into memory to log them
+            # share one connection pool across all threads, ex: {"max_connections": 20, "max_keepalive_connections": 10}
+            "shared_pool": None,
+            # cache GET responses, ex: {"max_entries": 1000, "max_ttl_seconds": 300, "shared_cache_alias": "default"}
+            "cache": None,
+            "coalesce_requests": False,  # share one upstream call between concurrent identical GET requests
+            "clamp_to_deadline": True,  # limit timeouts to the time left for the request being handled
+            "phase_timings": False,  # record pool wait, time to headers and body read time for each request
+            # route templates for metric tags, ex: ["/{foo_id}/"].  by default, path segments with digits become {id},
+            # so routes are needed if the upstream uses ids without digits, such as slugs
+            "routes": None,
+            # fail fast while the upstream is failing, ex: {"failure_threshold": 5, "recovery_timeout_seconds": 30}
+            "circuit_breaker": None,
+            # retry idempotent requests with backoff, ex: {"max_retries": 2, "backoff_base_seconds": 0.1}
+            "retries": None,
         },
     },
 }
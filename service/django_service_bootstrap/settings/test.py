@@ -41,6 +41,7 @@ QUEUES_CONFIG = always_merger.merge(
 TOPIC_CONFIG = BlinkTopic.load_from_config(QUEUES_CONFIG)
 
 HTTP_CLIENTS = {
+    "event_recorder": {"path": "core.services.event_service", "name": "record_event"},
     "endpoints": {
         "foo": {
             "root_url": "http://test.foo.com/api/v1/foo",
@@ -3,11 +3,13 @@ import logging
 from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 
+from common_lib.latency_histogram import latency_histograms
+
 
 _logger = logging.getLogger(__name__)
 _schema_view = get_schema_view(
@@ -31,10 +33,24 @@ def healthcheck(request):
     return HttpResponse("Health Check", status=200)
 
 
+def http_latency(request):
+    """
+    Dump this process's outbound HTTP latency histograms, to find tail latency without high-cardinality metrics
+
+    Only available to staff users.  Pass ?reset=true to start new histograms after dumping them.
+    """
+    if not request.user.is_staff:
+        return HttpResponse("Forbidden", status=403)
+
+    reset = request.GET.get("reset", "").lower() == "true"
+    return JsonResponse({"histograms": latency_histograms.dump(reset=reset)})
+
+
 urlpatterns = [
     path("api/", include("api.urls")),
     path("admin/", admin.site.urls),
     path("healthcheck/", healthcheck),
+    path("internal/http-latency/", http_latency),
     path("swagger/", _schema_view.with_ui()),
 ]
 # For serving static files when DEBUG=True
@@ -6,9 +6,16 @@ class MessageConsumerConfig(AppConfig):
     name = "message_consumer"
 
     def ready(self):
+        from message_consumer.worker_pool import is_worker_process
+
+        # worker processes only handle the messages they're given by the consumer that spawned them
+        if is_worker_process():
+            return
+
         # importing consumer here so that we only load it when ready. Otherwise we will have issues when importing
         # methods from different apps when they are not yet loaded
         from message_consumer.consumer import start_consumer
 
-        if settings.IS_API_NODE:
+        # the consumer can be run in its own process instead, with the run_consumer command
+        if settings.IS_API_NODE and settings.MESSAGE_CONSUMER.get("run_in_api", True):
             start_consumer()
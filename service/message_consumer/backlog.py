@@ -0,0 +1,81 @@
+"""Report the number of messages waiting in each SQS topic, as a gauge for dashboards and autoscaling"""
+import logging
+import threading
+from typing import Dict, Optional
+
+from common_lib.metrics import statsd
+
+_logger = logging.getLogger(__name__)
+
+
+class BacklogReporter:
+    """
+    Gauges the approximate number of messages waiting in each SQS topic in QUEUES_CONFIG, every interval_seconds
+
+    Each topic is reported as message_consumer.backlog (visible messages) and message_consumer.backlog.in_flight
+    (received, but not yet confirmed), tagged with the topic.  Mocked topics, and those not on SQS, are skipped.
+    """
+
+    def __init__(self, queues_config: dict, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        self._endpoint_url = queues_config.get("aws_endpoint_url")  # such as localstack, when running locally
+        self._topics = {
+            key: topic
+            for key, topic in queues_config.get("topics", {}).items()
+            if topic.get("processor") == "sqs" and not topic.get("is_mocked")
+        }
+        self._clients = {}
+        self._queue_urls: Dict[str, str] = {}
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if not self._topics or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="consumer-backlog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def report(self):
+        """Gauge the backlog of every topic, logging rather than raising if one can't be read"""
+        for key, topic in self._topics.items():
+            try:
+                attributes = self._get_queue_attributes(topic)
+            except Exception:
+                _logger.warning(f"Failed to get the backlog of topic {key}", exc_info=True)
+                continue
+
+            tags = [f"topic:{key}"]
+            statsd.gauge("message_consumer.backlog", int(attributes["ApproximateNumberOfMessages"]), tags=tags)
+            in_flight = int(attributes["ApproximateNumberOfMessagesNotVisible"])
+            statsd.gauge("message_consumer.backlog.in_flight", in_flight, tags=tags)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval_seconds):
+            self.report()
+
+    def _get_queue_attributes(self, topic: dict) -> dict:
+        client = self._get_client(topic["aws_region"])
+        queue_name = topic["name"]
+        # SQS requires FIFO queue names to end with .fifo
+        if topic.get("is_fifo") and not queue_name.endswith(".fifo"):
+            queue_name += ".fifo"
+        queue_url = self._queue_urls.get(queue_name)
+        if queue_url is None:
+            queue_url = self._queue_urls[queue_name] = client.get_queue_url(QueueName=queue_name)["QueueUrl"]
+        response = client.get_queue_attributes(
+            QueueUrl=queue_url,
+            AttributeNames=["ApproximateNumberOfMessages", "ApproximateNumberOfMessagesNotVisible"],
+        )
+        return response["Attributes"]
+
+    def _get_client(self, region: str):
+        client = self._clients.get(region)
+        if client is None:
+            # boto3 is installed with blink-messaging, for its SQS processor
+            import boto3
+
+            client = self._clients[region] = boto3.client("sqs", region_name=region, endpoint_url=self._endpoint_url)
+        return client
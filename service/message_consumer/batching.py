@@ -0,0 +1,102 @@
+"""Collect consumed messages of the same type into batches, for handlers that can handle many messages at once"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class BatchHandler:
+    """
+    A handler for a list of messages of the same type, such as one that saves them with bulk_create
+
+    The handler returns a list with True for each message it handled, and False for each that failed, in the same
+    order as the messages it was given.  Returning None means they were all handled.  Only handled messages are
+    confirmed, so failed ones go to the DLQ, as they would with a single message handler.
+    """
+
+    handler: Callable[[List[Any]], Optional[List[bool]]]
+    max_batch_size: int = 50  # the batch is handled as soon as it has this many messages
+    linger_seconds: float = 0.1  # otherwise, it's handled this long after its first message was received
+
+
+class _Batch:
+    def __init__(self, flush_at: float):
+        self.items = []
+        self.flush_at = flush_at  # the time.monotonic() at which the batch is handled, if it hasn't filled up
+
+
+class MessageBatcher:
+    """
+    Collects items by key, passing each batch to on_batch once it's full, or once it has lingered long enough
+
+    on_batch is called on the thread that filled the batch, or on the batcher's flusher thread if it lingered.  The
+    flusher is a single long-lived thread, started on first use, so a handler using the database keeps reusing that
+    thread's connection, rather than opening one on a new thread for every lingering batch.
+    """
+
+    def __init__(self, on_batch: Callable[[Hashable, List[Any]], None], name: str = "message-batcher"):
+        self._on_batch = on_batch
+        self._name = name
+        self._batches: Dict[Hashable, _Batch] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def size(self) -> int:
+        """The number of items waiting in batches"""
+        with self._condition:
+            return sum(len(batch.items) for batch in self._batches.values())
+
+    def add(self, key: Hashable, item, max_batch_size: int, linger_seconds: float):
+        full_batch = None
+        with self._condition:
+            self._ensure_flusher()
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(time.monotonic() + linger_seconds)
+                # wake the flusher, in case this batch is due before the one it's waiting for
+                self._condition.notify()
+            batch.items.append(item)
+            if len(batch.items) >= max_batch_size:
+                full_batch = self._batches.pop(key)
+
+        if full_batch is not None:
+            self._handle(key, full_batch)
+
+    def flush(self):
+        """Handle every batch now, without waiting for them to fill up or linger, such as before shutting down"""
+        with self._condition:
+            batches, self._batches = self._batches, {}
+        for key, batch in batches.items():
+            self._handle(key, batch)
+
+    def _ensure_flusher(self):
+        # a thread from before a fork isn't alive in the child, so a new one is started there
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                lingering = [(key, batch) for key, batch in self._batches.items() if batch.flush_at <= now]
+                for key, _ in lingering:
+                    del self._batches[key]
+                if not lingering:
+                    next_flush_at = min((batch.flush_at for batch in self._batches.values()), default=None)
+                    self._condition.wait(None if next_flush_at is None else next_flush_at - now)
+                    continue
+
+            for key, batch in lingering:
+                self._handle(key, batch)
+
+    def _handle(self, key: Hashable, batch: _Batch):
+        try:
+            self._on_batch(key, batch.items)
+        except Exception:
+            _logger.exception(f"Failed to handle a batch of {len(batch.items)} messages for {key}")
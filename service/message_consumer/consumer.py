@@ -1,30 +1,134 @@
 import logging
+import random
+import time
+from functools import partial
 from threading import Thread
+from typing import Callable, Hashable, List, Optional, Tuple
 
 from blink_messaging import consumer
+from django import db
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
+from common_lib.metrics import statsd
 from core.constants import INTERNAL_QUEUE_TOPIC_NAME
+from message_consumer.batching import BatchHandler, MessageBatcher
+from message_consumer.worker_pool import MessageWorkerPool, create_worker_pool
 
 _logger = logging.getLogger(__name__)
 _topics = [settings.TOPIC_CONFIG[INTERNAL_QUEUE_TOPIC_NAME]]
 _topic_names = ", ".join(t.name for t in _topics)
+_is_fifo = settings.QUEUES_CONFIG["topics"][INTERNAL_QUEUE_TOPIC_NAME].get("is_fifo", False)
+_payload_log_sample_rate = settings.MESSAGE_CONSUMER.get("payload_log_sample_rate", 0)
 _consumer_thread: Thread = None
+_worker_pool: Optional[MessageWorkerPool] = None
+_is_stopping = False
 
 _handler_map = {
     # Here we will map the message to the handler
     # Ex: PendingFooSubmissionDTO: handle_foo_submission_request,
 }
 
+# batch handlers are given lists of messages of the same type, for handling them together, like with bulk_create.  A
+# message type should be in either this or _handler_map.  They can't be used with FIFO topics, since a lingering batch
+# would be handled after later messages in the same group
+_batch_handler_map = {
+    # Here we will map the message to the batch handler
+    # Ex: PendingFooSubmissionDTO: BatchHandler(handle_foo_submission_requests, max_batch_size=50),
+}
+
+# for FIFO topics, messages with the same group key are handled in order.  Messages without one are all handled in
+# order, which is safe, but means they are handled one at a time
+_group_key_map = {
+    # Here we will map the message to a function returning the key to order it by
+    # Ex: PendingFooSubmissionDTO: lambda message: message.foo_id,
+}
+
+
+def _handle_batch(message_type: type, items: List[Tuple[object, Callable]]):
+    batch_handler: BatchHandler = _batch_handler_map[message_type]
+    messages = [message for message, _ in items]
+    full_name = message_type.Meta.full_name
+
+    if _worker_pool is not None:
+        accepted = _worker_pool.submit(
+            full_name,
+            None,
+            partial(_call_batch_handler, batch_handler.handler),
+            messages,
+            on_success=lambda results: _confirm_batch(items, results),
+            on_failure=lambda error: _log_batch_failure(messages, error),
+        )
+        if not accepted:
+            _logger.warning(f"Not handling {len(items)} {full_name} messages, since the consumer is shutting down")
+        return
+
+    try:
+        results = _call_batch_handler(batch_handler.handler, messages)
+    except Exception as e:
+        _log_batch_failure(messages, e)
+        return
+    finally:
+        # lingering batches are handled on the batcher's thread, whose connection would otherwise stay open (or
+        # broken) between batches, as with the worker pool's threads
+        db.close_old_connections()
+    _confirm_batch(items, results)
+
+
+def _call_batch_handler(handler: Callable, messages: list) -> List[bool]:
+    start_time = time.perf_counter()
+    try:
+        results = handler(messages)
+    finally:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        statsd.timing("message_consumer.batch_handle_time", duration_ms, tags=_get_type_tags(messages[0]))
+    if results is None:
+        return [True] * len(messages)
+    if len(results) != len(messages):
+        raise ValueError(f"Batch handler returned {len(results)} results for {len(messages)} messages")
+    return results
 
-def start_consumer():
-    """Start the blink-messaging consumer for all topics."""
-    global _consumer_thread
+
+def _confirm_batch(items: List[Tuple[object, Callable]], results: List[bool]):
+    # blink-messaging only gives us a confirm handler for each message, so they are called together once the batch
+    # is handled.  Messages that failed aren't confirmed, so they go to the DLQ
+    for (message, confirm_handler), is_handled in zip(items, results):
+        if is_handled:
+            _count_message(message, "success")
+            confirm_handler()
+        else:
+            _count_message(message, "handler_failure")
+            _logger.error(
+                f"Batch handler failed to handle message: {message.Meta.full_name}:{message.Meta.version}",
+                extra={"data": _get_message_data(message)},
+            )
+
+
+_batcher = MessageBatcher(_handle_batch)
+
+
+def _check_handlers():
+    """Fail if batch handlers are registered for a FIFO topic, since batching would break the order of its groups"""
+    if _is_fifo and _batch_handler_map:
+        raise ImproperlyConfigured(f"Batch handlers can't be used with the FIFO topic {_topic_names}")
+
+
+def start_consumer(config: dict = None):
+    """
+    Start the blink-messaging consumer for all topics, handling messages on a worker pool if configured
+
+    :param config: Overrides settings.MESSAGE_CONSUMER, such as for a dedicated consumer process with more workers
+    """
+    global _consumer_thread, _worker_pool
     if _consumer_thread and _consumer_thread.is_alive():
         _logger.warning("Trying to start the consumer while it's already running", extra={"topics": _topic_names})
         return
 
+    config = config or settings.MESSAGE_CONSUMER
+    _check_handlers()
     try:
+        if _worker_pool is None:
+            _worker_pool = create_worker_pool(config)
         _consumer_thread = consumer.startup(
             topics=_topics,
             message_handler=handle_message,
@@ -36,17 +140,51 @@ def start_consumer():
         _logger.exception("Failed to start consumer", extra={"topics": _topic_names, "message": e})
 
 
+def stop_consumer(timeout: float = 30):
+    """
+    Stop handling messages, handling any partial batches, and waiting up to timeout seconds for outstanding ones
+
+    The consumer thread keeps receiving until the process exits, but those messages aren't handled or confirmed, so
+    they are delivered again once their visibility times out.
+    """
+    global _is_stopping
+    _is_stopping = True
+    _batcher.flush()
+    if _worker_pool is not None:
+        _worker_pool.drain(timeout)
+
+
+def get_consumer_status() -> dict:
+    """Get the state of the consumer, for health checks and autoscaling"""
+    is_running = bool(_consumer_thread and _consumer_thread.is_alive())
+    return {
+        "running": is_running,
+        "accepting": is_running and not _is_stopping,
+        "topics": _topic_names,
+        "workers": _worker_pool.workers if _worker_pool else 0,
+        # being handled, or waiting for a worker
+        "in_flight": _worker_pool.outstanding if _worker_pool else 0,
+        "pending": _worker_pool.pending if _worker_pool else 0,
+        "batched": _batcher.size,
+    }
+
+
 def handle_message(message, confirm_handler):
     # check if message handler exists, if not exit early
     message_type = type(message)
     _logger.info(
         f"Starting to handle message of type {message.Meta.full_name}:{message.Meta.version}.",
-        extra={"data": message.to_json()},
+        extra={"message_summary": _get_message_summary(message)},
     )
+    # the full payload is only logged for a sample of messages, since it can be large
+    if _payload_log_sample_rate and random.random() < _payload_log_sample_rate:
+        _logger.info("Sampled message payload", extra={"data": _get_message_data(message)})
     message_handler = _handler_map.get(message_type, None)
+    batch_handler = _batch_handler_map.get(message_type, None)
 
-    if message_handler is None:
+    if message_handler is None and batch_handler is None:
         _logger.error(f"No handler is registered for message type {message_type}. Discarding message.")
+        _count_message(message, "unknown_type")
         confirm_handler()
         return
 
@@ -56,26 +194,107 @@ def handle_message(message, confirm_handler):
     except Exception as e:
         _logger.exception(
             "BlinkMessage failed validation on consumption.",
-            extra={"message": e, "data": message.to_json()},
+            extra={"message": e, "data": _get_message_data(message)},
+        )
+        _count_message(message, "validation_failure")
+        return
+
+    # batched messages are handled once their batch fills up, or lingers long enough
+    if batch_handler is not None:
+        _batcher.add(
+            message_type, (message, confirm_handler), batch_handler.max_batch_size, batch_handler.linger_seconds
+        )
+        return
+
+    # hand the message to the worker pool, which confirms it once handled, if there is one
+    if _worker_pool is not None:
+        accepted = _worker_pool.submit(
+            message.Meta.full_name,
+            _get_group_key(message),
+            partial(_timed_handler, message_handler),
+            message,
+            on_success=lambda result: _confirm_message(message, confirm_handler),
+            on_failure=lambda error: _log_handler_failure(message, error),
         )
+        if not accepted:
+            _logger.warning(f"Not handling message {message.Meta.full_name}, since the consumer is shutting down")
         return
 
     # call handler method and process message
     try:
-        message_handler(message)
+        _timed_handler(message_handler, message)
     except Exception as e:
-        _logger.exception(
-            f"Failed to handle message: {message.Meta.full_name}:{message.Meta.version}",
-            extra={"data": message.to_json()},
-        )
+        _log_handler_failure(message, e)
 
         # returning without confirming the message will cause it to go to the DLQ
         return
 
     # if all went well, confirm that message was handled
+    _confirm_message(message, confirm_handler)
+
+
+def _timed_handler(handler: Callable, message):
+    start_time = time.perf_counter()
+    try:
+        return handler(message)
+    finally:
+        duration_ms = (time.perf_counter() - start_time) * 1000
+        statsd.timing("message_consumer.handle_time", duration_ms, tags=_get_type_tags(message))
+
+
+def _confirm_message(message, confirm_handler: Callable):
+    _count_message(message, "success")
     confirm_handler()
 
 
+def _count_message(message, result: str):
+    """Count a handled message by its type and result: success, validation_failure, handler_failure or unknown_type"""
+    statsd.increment("message_consumer.message", tags=[*_get_type_tags(message), f"result:{result}"])
+
+
+def _get_type_tags(message) -> List[str]:
+    return [f"message_type:{message.Meta.full_name}"]
+
+
+def _log_handler_failure(message, error: BaseException):
+    _count_message(message, "handler_failure")
+    _logger.error(
+        f"Failed to handle message: {message.Meta.full_name}:{message.Meta.version}",
+        exc_info=error,
+        extra={"data": _get_message_data(message)},
+    )
+
+
+def _get_message_summary(message) -> dict:
+    """Get the details of a message that are cheap to log for every message, without its payload"""
+    json_data = getattr(message, "_json_data", None)
+    return {
+        "type": message.Meta.full_name,
+        "version": message.Meta.version,
+        "id": getattr(message, "id", None),
+        "size": len(json_data) if json_data is not None else None,
+    }
+
+
+def _get_message_data(message) -> str:
+    """Get the message's payload for logging, using the JSON it was received as, rather than serializing it again"""
+    json_data = getattr(message, "_json_data", None)
+    return json_data if json_data is not None else message.to_json()
+
+
+def _log_batch_failure(messages: list, error: BaseException):
+    for message in messages:
+        _log_handler_failure(message, error)
+
+
+def _get_group_key(message) -> Optional[Hashable]:
+    """Get the key that messages must be handled in order by, or None if they can be handled in any order"""
+    if not _is_fifo:
+        return None
+    group_key = _group_key_map.get(type(message))
+    return group_key(message) if group_key else ""
+
+
 def error_handler(error):
     _logger.error(f"Unhandled error when processing a topic message", exc_info=error)
 
@@ -87,4 +306,10 @@ def process_topics():
     This will also cause the consumer to run on the main thread, instead of a background one.  Useful for unit tests.
     :return: Returns a tuple (success_count, failure_count) of messages processed
     """
-    return consumer.process_topics(topics=_topics, message_handler=handle_message, error_handler=error_handler)
+    _check_handlers()
+    start_time = time.perf_counter()
+    result = consumer.process_topics(topics=_topics, message_handler=handle_message, error_handler=error_handler)
+    # handle any partial batches now, rather than leaving them to linger after the run
+    _batcher.flush()
+    statsd.timing("message_consumer.process_topics.duration", (time.perf_counter() - start_time) * 1000)
+    return result
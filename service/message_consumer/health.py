@@ -0,0 +1,77 @@
+"""A small HTTP server for the probes and autoscaling of a dedicated consumer process, which has no Django API"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+
+_logger = logging.getLogger(__name__)
+
+
+class HealthServer:
+    """
+    Serves the status of the consumer on a background thread, with the paths:
+
+    * /healthcheck/: 200 while the consumer is running, for the liveness probe
+    * /ready/: 200 while the consumer is running and accepting messages, for the readiness probe
+    * /status/: the full status as JSON, such as the in-flight and pending counts, for autoscaling
+
+    get_status returns a dict with at least "running" and "accepting", and is called for every request.
+    """
+
+    def __init__(self, port: int, get_status: Callable[[], dict], host: str = ""):
+        self._get_status = get_status
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        """The port being served, which is useful if it was created with port 0, to pick any free port"""
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="consumer-health", daemon=True)
+        self._thread.start()
+        _logger.info(f"Serving consumer health on port {self.port}")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _create_handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    status = server._get_status()
+                except Exception:
+                    _logger.exception("Failed to get the consumer status")
+                    self._respond(500, {"error": "Failed to get the consumer status"})
+                    return
+
+                path = self.path.split("?", 1)[0].rstrip("/")
+                if path == "/healthcheck":
+                    self._respond(200 if status["running"] else 503, {"running": status["running"]})
+                elif path == "/ready":
+                    is_ready = status["running"] and status["accepting"]
+                    self._respond(200 if is_ready else 503, {"ready": is_ready})
+                elif path == "/status":
+                    self._respond(200, status)
+                else:
+                    self._respond(404, {"error": f"Unknown path {self.path}"})
+
+            def _respond(self, status_code: int, body: dict):
+                content = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                # probes hit these every few seconds, which would flood the logs
+                pass
+
+        return _Handler
@@ -0,0 +1,74 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from common_lib.metrics import statsd
+from message_consumer.backlog import BacklogReporter
+from message_consumer.consumer import get_consumer_status, start_consumer, stop_consumer
+from message_consumer.health import HealthServer
+from message_consumer.worker_pool import WorkerModes
+
+_logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run only the message consumer, with its own worker pool and health endpoint, instead of in the API nodes "
+        "(set MESSAGE_CONSUMER_IN_API=false for those)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, help="Workers to handle messages on, instead of the run_consumer_workers setting"
+        )
+        parser.add_argument("--mode", choices=WorkerModes.values(), help="Handle messages on threads or processes")
+        parser.add_argument("--health-port", type=int, help="Port to serve the health and status endpoints on")
+
+    def handle(self, *args, **options):
+        config = dict(settings.MESSAGE_CONSUMER)
+        # the API nodes handle messages one at a time by default, but a dedicated process can use a worker pool
+        config["workers"] = config.get("run_consumer_workers", config.get("workers", 0))
+        if options["workers"] is not None:
+            config["workers"] = options["workers"]
+        if options["mode"]:
+            config["mode"] = options["mode"]
+        health_port = options["health_port"] or config.get("health_port", 8001)
+
+        # stop on SIGTERM, as sent by kubernetes, as well as on ctrl-c
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+        health_server = HealthServer(health_port, get_consumer_status)
+        health_server.start()
+        start_consumer(config)
+        # only the dedicated consumer reports the backlog, so every API worker process doesn't poll SQS for it
+        backlog_reporter = None
+        if config.get("backlog_interval_seconds"):
+            backlog_reporter = BacklogReporter(settings.QUEUES_CONFIG, config["backlog_interval_seconds"])
+            backlog_reporter.start()
+
+        # report the consumer's load, for autoscaling on, until asked to stop
+        report_interval = config.get("status_interval_seconds", 10)
+        is_running = True
+        while is_running and not stopping.wait(report_interval):
+            status = get_consumer_status()
+            _report_status(status)
+            is_running = status["running"]
+
+        _logger.info("Stopping the consumer")
+        if backlog_reporter is not None:
+            backlog_reporter.stop()
+        stop_consumer(config.get("drain_timeout_seconds", 30))
+        health_server.stop()
+        if not is_running:
+            # exiting with an error, so the process is restarted
+            raise CommandError("The consumer stopped running")
+
+
+def _report_status(status: dict):
+    for name in ("in_flight", "pending", "batched"):
+        statsd.gauge(f"message_consumer.{name}", status[name])
@@ -0,0 +1,53 @@
+from unittest import TestCase, mock
+
+from message_consumer.backlog import BacklogReporter
+
+_QUEUES_CONFIG = {
+    "topics": {
+        "general_queue": {"name": "general", "processor": "sqs", "is_fifo": False, "aws_region": "us-east-1"},
+        "ordered_queue": {"name": "ordered", "processor": "sqs", "is_fifo": True, "aws_region": "us-east-1"},
+        "mocked_queue": {"name": "mocked", "processor": "sqs", "is_mocked": True, "aws_region": "us-east-1"},
+    }
+}
+
+
+class TestBacklogReporter(TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.get_queue_url.side_effect = lambda QueueName: {"QueueUrl": f"https://sqs/{QueueName}"}
+        self.client.get_queue_attributes.return_value = {
+            "Attributes": {"ApproximateNumberOfMessages": "12", "ApproximateNumberOfMessagesNotVisible": "3"}
+        }
+        self.reporter = BacklogReporter(_QUEUES_CONFIG, interval_seconds=60)
+        self.reporter._get_client = lambda region: self.client
+
+    @mock.patch("message_consumer.backlog.statsd")
+    def test_reports_each_sqs_topic(self, statsd):
+        self.reporter.report()
+        self.reporter.report()
+
+        statsd.gauge.assert_any_call("message_consumer.backlog", 12, tags=["topic:general_queue"])
+        statsd.gauge.assert_any_call("message_consumer.backlog.in_flight", 3, tags=["topic:ordered_queue"])
+        self.assertEqual(statsd.gauge.call_count, 8)
+        # mocked topics are skipped, and queue urls are only looked up once
+        self.assertEqual(
+            [c.kwargs["QueueName"] for c in self.client.get_queue_url.call_args_list], ["general", "ordered.fifo"]
+        )
+
+    @mock.patch("message_consumer.backlog.statsd")
+    def test_failed_topic_is_skipped(self, statsd):
+        self.client.get_queue_url.side_effect = [Exception("Access denied"), {"QueueUrl": "https://sqs/ordered.fifo"}]
+
+        with self.assertLogs("message_consumer.backlog", "WARNING"):
+            self.reporter.report()
+
+        statsd.gauge.assert_any_call("message_consumer.backlog", 12, tags=["topic:ordered_queue"])
+        self.assertEqual(statsd.gauge.call_count, 2)
+
+    def test_client_uses_endpoint_url(self):
+        reporter = BacklogReporter({**_QUEUES_CONFIG, "aws_endpoint_url": "http://localhost:4566"}, interval_seconds=60)
+
+        with mock.patch("boto3.client") as mock_client:
+            reporter._get_client("us-east-1")
+
+        mock_client.assert_called_once_with("sqs", region_name="us-east-1", endpoint_url="http://localhost:4566")
@@ -0,0 +1,61 @@
+import threading
+from unittest import TestCase
+
+from message_consumer.batching import MessageBatcher
+
+
+class TestMessageBatcher(TestCase):
+    def setUp(self):
+        self.batches = []
+        self.batched = threading.Event()
+        self.batcher = MessageBatcher(self._on_batch)
+
+    def _on_batch(self, key, items):
+        self.batches.append((key, items, threading.current_thread()))
+        self.batched.set()
+
+    def test_full_batch_handled_immediately(self):
+        for i in range(5):
+            self.batcher.add("foo", i, max_batch_size=3, linger_seconds=10)
+        self.batcher.add("bar", "a", max_batch_size=3, linger_seconds=10)
+
+        self.assertEqual(self.batches, [("foo", [0, 1, 2], threading.current_thread())])
+
+        self.batcher.flush()
+        self.assertCountEqual([(key, items) for key, items, _ in self.batches[1:]], [("foo", [3, 4]), ("bar", ["a"])])
+
+    def test_batch_handled_after_lingering(self):
+        self.batcher.add("foo", 1, max_batch_size=10, linger_seconds=0.05)
+        self.batcher.add("foo", 2, max_batch_size=10, linger_seconds=0.05)
+
+        self.assertTrue(self.batched.wait(5))
+        self.assertEqual([(key, items) for key, items, _ in self.batches], [("foo", [1, 2])])
+
+    def test_lingering_batches_share_one_thread(self):
+        for key in ("foo", "bar"):
+            self.batched.clear()
+            self.batcher.add(key, 1, max_batch_size=10, linger_seconds=0.01)
+            self.assertTrue(self.batched.wait(5))
+
+        # both were handled on the same long-lived flusher thread, rather than a new thread per batch
+        (_, _, first_thread), (_, _, second_thread) = self.batches
+        self.assertIs(first_thread, second_thread)
+        self.assertEqual(first_thread.name, "message-batcher")
+        self.assertTrue(first_thread.is_alive())
+
+    def test_full_batch_not_flushed_again_when_due(self):
+        self.batcher.add("foo", 1, max_batch_size=2, linger_seconds=0.05)
+        self.batcher.add("foo", 2, max_batch_size=2, linger_seconds=0.05)
+        self.batcher.add("foo", 3, max_batch_size=2, linger_seconds=10)
+
+        # the first batch's linger time passing must not have flushed the second batch, which is still lingering
+        threading.Event().wait(0.1)
+        self.assertEqual([(key, items) for key, items, _ in self.batches], [("foo", [1, 2])])
+        self.batcher.flush()
+        self.assertEqual(self.batches[1][:2], ("foo", [3]))
+
+    def test_failed_batch_is_logged(self):
+        batcher = MessageBatcher(lambda key, items: 1 / 0)
+
+        with self.assertLogs("message_consumer.batching", "ERROR"):
+            batcher.add("foo", 1, max_batch_size=1, linger_seconds=10)
@@ -0,0 +1,155 @@
+import threading
+from unittest import mock
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from message_consumer import consumer
+from message_consumer.batching import BatchHandler
+
+
+class _FakeMessage:
+    class Meta:
+        full_name = "test.fake_message"
+        version = 1
+
+    def __init__(self, id: int):
+        self.id = id
+        self._json_data = f'{{"id": {id}}}'
+
+    def validate(self):
+        pass
+
+    def to_json(self):
+        return f'{{"id": {self.id}}}'
+
+
+def _items(count: int):
+    return [(_FakeMessage(i), mock.Mock(name=f"confirm_{i}")) for i in range(count)]
+
+
+def _confirmed(items) -> list:
+    return [message.id for message, confirm_handler in items if confirm_handler.called]
+
+
+class TestHandleBatch:
+    def _handle(self, items, handler):
+        with mock.patch.dict(consumer._batch_handler_map, {_FakeMessage: BatchHandler(handler)}):
+            consumer._handle_batch(_FakeMessage, items)
+
+    def test_only_handled_messages_confirmed(self):
+        items = _items(3)
+
+        with mock.patch.object(consumer.statsd, "increment") as mock_increment:
+            self._handle(items, lambda messages: [True, False, True])
+
+        assert _confirmed(items) == [0, 2]
+        mock_increment.assert_any_call(
+            "message_consumer.message", tags=["message_type:test.fake_message", "result:handler_failure"]
+        )
+
+    def test_none_means_all_handled(self):
+        items = _items(3)
+
+        self._handle(items, lambda messages: None)
+
+        assert _confirmed(items) == [0, 1, 2]
+
+    def test_wrong_number_of_results_confirms_none(self):
+        items = _items(3)
+
+        with mock.patch.object(consumer, "_log_handler_failure") as mock_log_failure:
+            self._handle(items, lambda messages: [True, True])
+
+        assert _confirmed(items) == []
+        assert mock_log_failure.call_count == 3
+        assert isinstance(mock_log_failure.call_args[0][1], ValueError)
+
+    def test_handler_error_confirms_none(self):
+        items = _items(2)
+
+        def handler(messages):
+            raise RuntimeError("database is down")
+
+        self._handle(items, handler)
+
+        assert _confirmed(items) == []
+
+    def test_lingering_batch_without_pool_closes_old_connections(self):
+        items = _items(1)
+        confirmed = threading.Event()
+        items[0][1].side_effect = lambda *args: confirmed.set()
+        handler = mock.Mock(return_value=None)
+
+        with mock.patch.dict(
+            consumer._batch_handler_map, {_FakeMessage: BatchHandler(handler, linger_seconds=0.01)}
+        ), mock.patch.object(consumer, "_worker_pool", None), mock.patch.object(
+            consumer.db, "close_old_connections"
+        ) as mock_close_old_connections:
+            consumer._batcher.add(_FakeMessage, items[0], max_batch_size=10, linger_seconds=0.01)
+            assert confirmed.wait(5)
+
+        handler.assert_called_once()
+        mock_close_old_connections.assert_called_once()
+
+    def test_batch_handlers_rejected_for_fifo_topics(self):
+        with mock.patch.object(consumer, "_is_fifo", True):
+            consumer._check_handlers()
+
+            with mock.patch.dict(consumer._batch_handler_map, {_FakeMessage: BatchHandler(lambda messages: None)}):
+                with pytest.raises(ImproperlyConfigured):
+                    consumer._check_handlers()
+
+
+class TestMessageLogging:
+    def _handle(self, message, handler, sample_rate: float = 0):
+        with mock.patch.dict(consumer._handler_map, {_FakeMessage: handler}), mock.patch.object(
+            consumer, "_payload_log_sample_rate", sample_rate
+        ), mock.patch.object(consumer, "_worker_pool", None):
+            with mock.patch.object(consumer._logger, "info") as mock_info, mock.patch.object(
+                consumer._logger, "error"
+            ) as mock_error:
+                consumer.handle_message(message, mock.Mock())
+        return mock_info, mock_error
+
+    def test_routine_logs_have_no_payload(self):
+        message = _FakeMessage(1)
+
+        with mock.patch.object(_FakeMessage, "to_json") as mock_to_json:
+            mock_info, _ = self._handle(message, lambda m: None)
+
+        mock_to_json.assert_not_called()
+        for call in mock_info.call_args_list:
+            assert "data" not in call.kwargs.get("extra", {})
+        assert mock_info.call_args_list[0].kwargs["extra"]["message_summary"] == {
+            "type": "test.fake_message",
+            "version": 1,
+            "id": 1,
+            "size": len(message._json_data),
+        }
+
+    def test_sampled_payload_is_logged(self):
+        message = _FakeMessage(1)
+
+        mock_info, _ = self._handle(message, lambda m: None, sample_rate=1)
+
+        assert mock.call("Sampled message payload", extra={"data": message._json_data}) in mock_info.call_args_list
+
+    def test_failure_logs_received_json(self):
+        message = _FakeMessage(1)
+
+        def handler(m):
+            raise ValueError("bad foo")
+
+        with mock.patch.object(_FakeMessage, "to_json") as mock_to_json:
+            _, mock_error = self._handle(message, handler)
+
+        mock_to_json.assert_not_called()
+        assert mock_error.call_args.kwargs["extra"]["data"] == message._json_data
+
+    def test_message_data_falls_back_to_serializing(self):
+        message = _FakeMessage(1)
+        del message._json_data
+
+        assert consumer._get_message_data(message) == '{"id": 1}'
+        assert consumer._get_message_summary(message)["size"] is None
@@ -0,0 +1,39 @@
+import json
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from message_consumer.health import HealthServer
+
+
+class TestHealthServer(TestCase):
+    def setUp(self):
+        self.status = {"running": True, "accepting": True, "in_flight": 3, "pending": 1}
+        self.server = HealthServer(0, lambda: self.status, host="127.0.0.1")
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def _get(self, path: str):
+        try:
+            with urlopen(f"http://127.0.0.1:{self.server.port}{path}", timeout=5) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_healthy_and_ready(self):
+        self.assertEqual(self._get("/healthcheck/"), (200, {"running": True}))
+        self.assertEqual(self._get("/ready/"), (200, {"ready": True}))
+        self.assertEqual(self._get("/status/"), (200, self.status))
+
+    def test_not_ready_while_draining(self):
+        self.status["accepting"] = False
+
+        self.assertEqual(self._get("/healthcheck/")[0], 200)
+        self.assertEqual(self._get("/ready/"), (503, {"ready": False}))
+
+    def test_unhealthy_once_stopped(self):
+        self.status = {"running": False, "accepting": False}
+
+        self.assertEqual(self._get("/healthcheck/")[0], 503)
+        self.assertEqual(self._get("/ready/")[0], 503)
+        self.assertEqual(self._get("/unknown/")[0], 404)
@@ -0,0 +1,138 @@
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import message_consumer
+from message_consumer.apps import MessageConsumerConfig
+from message_consumer.worker_pool import WORKER_PROCESS_ENV, MessageWorkerPool, _setup_worker_process
+
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.handled = []
+        self.confirmed = []
+        self.failed = []
+
+    def handler(self, delay: float = 0):
+        def handle(message):
+            with self.lock:
+                self.running += 1
+                self.max_running = max(self.max_running, self.running)
+            time.sleep(delay)
+            with self.lock:
+                self.running -= 1
+                self.handled.append(message)
+            if message == "fail":
+                raise ValueError(message)
+
+        return handle
+
+    def submit(self, pool: MessageWorkerPool, message, message_type="test.message", group_key=None, delay: float = 0):
+        return pool.submit(
+            message_type,
+            group_key,
+            self.handler(delay),
+            message,
+            on_success=lambda result: self.confirmed.append(message),
+            on_failure=lambda error: self.failed.append((message, error)),
+        )
+
+
+class TestMessageWorkerPool:
+    @pytest.fixture(scope="function")
+    def recorder(self):
+        return _Recorder()
+
+    def test_slow_message_doesnt_block_others(self, recorder):
+        pool = MessageWorkerPool(workers=2)
+        recorder.submit(pool, "slow", delay=0.5)
+        for i in range(5):
+            recorder.submit(pool, i)
+
+        time.sleep(0.2)
+        assert recorder.confirmed == [0, 1, 2, 3, 4]
+        pool.drain(timeout=5)
+        assert recorder.confirmed[-1] == "slow"
+
+    def test_failure_not_confirmed(self, recorder):
+        pool = MessageWorkerPool(workers=1)
+        recorder.submit(pool, "fail")
+        pool.drain(timeout=5)
+
+        assert recorder.confirmed == []
+        assert recorder.failed[0][0] == "fail"
+        assert isinstance(recorder.failed[0][1], ValueError)
+
+    def test_type_concurrency(self, recorder):
+        pool = MessageWorkerPool(workers=4, type_concurrency={"limited": 1})
+        for i in range(4):
+            recorder.submit(pool, i, message_type="limited", delay=0.05)
+        pool.drain(timeout=5)
+
+        assert recorder.max_running == 1
+        assert sorted(recorder.confirmed) == [0, 1, 2, 3]
+
+    def test_group_ordering(self, recorder):
+        pool = MessageWorkerPool(workers=4)
+        for i in range(10):
+            # the first message of each group is slow, so later ones would overtake it if allowed
+            recorder.submit(pool, ("a", i), group_key="a", delay=0.05 if i == 0 else 0)
+            recorder.submit(pool, ("b", i), group_key="b", delay=0.05 if i == 0 else 0)
+        pool.drain(timeout=5)
+
+        assert [i for group, i in recorder.confirmed if group == "a"] == list(range(10))
+        assert [i for group, i in recorder.confirmed if group == "b"] == list(range(10))
+
+    def test_backpressure(self, recorder):
+        pool = MessageWorkerPool(workers=1, max_pending=2)
+        release = threading.Event()
+        pool.submit(
+            "test.message", None, lambda message: release.wait(5), "blocking", lambda result: None, lambda e: None
+        )
+        recorder.submit(pool, "queued")
+
+        submitted = threading.Event()
+        thread = threading.Thread(target=lambda: recorder.submit(pool, "waiting") and submitted.set())
+        thread.start()
+        assert not submitted.wait(0.2)
+
+        release.set()
+        assert submitted.wait(5)
+        pool.drain(timeout=5)
+        assert recorder.confirmed == ["queued", "waiting"]
+
+    def test_drain_rejects_new_messages(self, recorder):
+        pool = MessageWorkerPool(workers=1)
+        recorder.submit(pool, 1, delay=0.1)
+        pool.drain(timeout=5)
+
+        assert recorder.confirmed == [1]
+        assert not recorder.submit(pool, 2)
+
+
+class TestWorkerProcess:
+    def test_worker_process_does_not_start_consumer(self, settings):
+        # spawned workers get the API node's sys.argv, so they look like API nodes
+        settings.IS_API_NODE = True
+        settings.MESSAGE_CONSUMER = {"run_in_api": True}
+        consumer_module = mock.Mock()
+        app_config = MessageConsumerConfig("message_consumer", message_consumer)
+
+        environ = {k: v for k, v in os.environ.items() if k != WORKER_PROCESS_ENV}
+        with mock.patch.dict(sys.modules, {"message_consumer.consumer": consumer_module}), mock.patch.dict(
+            os.environ, environ, clear=True
+        ):
+            app_config.ready()
+            assert consumer_module.start_consumer.call_count == 1
+
+            with mock.patch("django.setup", side_effect=app_config.ready):
+                _setup_worker_process()
+            assert os.environ[WORKER_PROCESS_ENV] == "true"
+            assert consumer_module.start_consumer.call_count == 1
@@ -0,0 +1,229 @@
+"""A pool of workers for handling consumed messages concurrently, with per-type limits and per-group ordering"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+from django import db
+
+from common_lib.enum_mixin import EnumMixin
+
+_logger = logging.getLogger(__name__)
+
+# set in worker processes, which are spawned with the parent's sys.argv, so they look like API nodes to the settings
+WORKER_PROCESS_ENV = "MESSAGE_CONSUMER_WORKER_PROCESS"
+
+
+class WorkerModes(EnumMixin, Enum):
+    thread = "thread"  # for handlers that wait on IO, like the database or HTTP calls
+    process = "process"  # for CPU bound handlers, which would hold the GIL
+
+
+@dataclass
+class _Work:
+    message_type: str
+    group_key: Optional[Hashable]
+    handler: Callable
+    message: object
+    on_success: Callable[[Any], None]
+    on_failure: Callable[[BaseException], None]
+
+
+def _run_handler(handler: Callable, message):
+    try:
+        return handler(message)
+    finally:
+        # each worker thread has its own connection, which would otherwise stay open (or broken) between messages
+        db.close_old_connections()
+
+
+def _setup_worker_process():
+    import django
+
+    # marked before setup, so the message_consumer app doesn't start another consumer (and pool) in the worker
+    os.environ[WORKER_PROCESS_ENV] = "true"
+    django.setup()
+
+
+def is_worker_process() -> bool:
+    """Check if this is one of the pool's worker processes, rather than the process running the consumer"""
+    return os.environ.get(WORKER_PROCESS_ENV) == "true"
+
+
+class MessageWorkerPool:
+    """
+    Handles messages on a pool of threads or processes, so a slow handler doesn't hold up the messages behind it
+
+    * max_pending: the most messages waiting or being handled at once.  Once reached, submit() blocks the consumer, so
+        it stops receiving messages whose visibility timeout would run out while they wait.
+    * type_concurrency: the most messages of each type (by full name) handled at once.  Messages past the limit wait,
+        without holding up messages of other types.
+    * Messages with the same group key are handled one at a time, in the order they were submitted, as FIFO topics
+        require.  Messages without a group key are handled in any order.
+
+    In process mode, handlers and messages must be picklable, and each process sets up Django when it starts.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        mode: WorkerModes = WorkerModes.thread,
+        max_pending: int = 100,
+        type_concurrency: Dict[str, int] = None,
+    ):
+        self.workers = workers
+        self.max_pending = max(max_pending, workers)
+        self._type_concurrency = dict(type_concurrency or {})
+        self._executor = self._create_executor(workers, mode)
+        self._condition = threading.Condition()
+        self._pending: List[_Work] = []
+        self._outstanding = 0  # pending, plus being handled
+        self._running_by_type: Dict[str, int] = defaultdict(int)
+        self._busy_groups: Set[Hashable] = set()
+        self._is_draining = False
+
+    @staticmethod
+    def _create_executor(workers: int, mode: WorkerModes) -> Executor:
+        if mode == WorkerModes.process:
+            # forked processes would share the parent's database connections and threads, so they are spawned
+            context = multiprocessing.get_context("spawn")
+            return ProcessPoolExecutor(workers, mp_context=context, initializer=_setup_worker_process)
+        return ThreadPoolExecutor(workers, thread_name_prefix="message-worker")
+
+    @property
+    def outstanding(self) -> int:
+        """The number of messages waiting or being handled"""
+        return self._outstanding
+
+    @property
+    def pending(self) -> int:
+        """The number of messages waiting for a worker, or for their type or group to be free"""
+        return len(self._pending)
+
+    def submit(
+        self,
+        message_type: str,
+        group_key: Optional[Hashable],
+        handler: Callable,
+        message,
+        on_success: Callable[[Any], None],
+        on_failure: Callable[[BaseException], None],
+    ) -> bool:
+        """
+        Queue a message to be handled, blocking while max_pending messages are outstanding
+
+        on_success is passed what the handler returned, and on_failure is passed the exception it raised.
+
+        :return: False if the pool is draining, so the message wasn't accepted
+        """
+        work = _Work(message_type, group_key, handler, message, on_success, on_failure)
+        with self._condition:
+            while self._outstanding >= self.max_pending and not self._is_draining:
+                self._condition.wait()
+            if self._is_draining:
+                return False
+            self._outstanding += 1
+            self._pending.append(work)
+            ready = self._take_ready()
+        self._start(ready)
+        return True
+
+    def drain(self, timeout: float = 30):
+        """Stop accepting messages, and wait for the outstanding ones to be handled, for up to timeout seconds"""
+        deadline = monotonic() + timeout
+        with self._condition:
+            self._is_draining = True
+            self._condition.notify_all()
+            while self._outstanding:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    _logger.warning(f"Stopped waiting for {self._outstanding} messages to be handled, while draining")
+                    break
+                self._condition.wait(remaining)
+            abandoned, self._pending = self._pending, []
+
+        # messages that never started aren't confirmed, so they are delivered again once their visibility times out
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if abandoned:
+            _logger.warning(f"Abandoned {len(abandoned)} messages that weren't handled before draining finished")
+
+    def _take_ready(self) -> List[_Work]:
+        """Take every pending message whose type is under its limit, and whose group isn't busy (holding the lock)"""
+        blocked_groups = set()
+        still_pending = []
+        ready = []
+        for work in self._pending:
+            type_limit = self._type_concurrency.get(work.message_type)
+            is_type_full = type_limit is not None and self._running_by_type[work.message_type] >= type_limit
+            is_group_blocked = work.group_key is not None and (
+                work.group_key in self._busy_groups or work.group_key in blocked_groups
+            )
+            if is_type_full or is_group_blocked:
+                # later messages in the same group must wait for this one, to keep their order
+                if work.group_key is not None:
+                    blocked_groups.add(work.group_key)
+                still_pending.append(work)
+                continue
+
+            self._running_by_type[work.message_type] += 1
+            if work.group_key is not None:
+                self._busy_groups.add(work.group_key)
+            ready.append(work)
+        self._pending = still_pending
+        return ready
+
+    def _start(self, ready: List[_Work]):
+        """Submit messages to the executor, without holding the lock, since a callback can run before submit returns"""
+        for work in ready:
+            try:
+                future = self._executor.submit(_run_handler, work.handler, work.message)
+            except RuntimeError:
+                # the executor was shut down after draining timed out, so the message is left unconfirmed
+                future = Future()
+                future.cancel()
+                self._on_done(work, future)
+                continue
+            future.add_done_callback(lambda done, work=work: self._on_done(work, done))
+
+    def _on_done(self, work: _Work, future: Future):
+        try:
+            # a message cancelled while draining is left unconfirmed, so it will be delivered again
+            if not future.cancelled():
+                error = future.exception()
+                if error is None:
+                    work.on_success(future.result())
+                else:
+                    work.on_failure(error)
+        except Exception:
+            _logger.exception(f"Failed to complete handling a message of type {work.message_type}")
+        finally:
+            with self._condition:
+                self._running_by_type[work.message_type] -= 1
+                self._busy_groups.discard(work.group_key)
+                self._outstanding -= 1
+                ready = self._take_ready()
+                self._condition.notify_all()
+            self._start(ready)
+
+
+def create_worker_pool(config: dict) -> Optional[MessageWorkerPool]:
+    """Create a pool from settings.MESSAGE_CONSUMER, draining it when the process exits, or None if workers is 0"""
+    workers = config.get("workers", 0)
+    if not workers:
+        return None
+
+    pool = MessageWorkerPool(
+        workers=workers,
+        mode=WorkerModes(config.get("mode", WorkerModes.thread.value)),
+        max_pending=config.get("max_pending", 100),
+        type_concurrency=config.get("type_concurrency"),
+    )
+    atexit.register(pool.drain, config.get("drain_timeout_seconds", 30))
+    return pool